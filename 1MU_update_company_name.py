@@ -1,22 +1,63 @@
-import pandas as pd
+import argparse
+
+from ingest import CONTACT_LIST, RAW_EXPORT, read_frame, read_frames, resolve_inputs
+from metrics import add_arguments, finish_run, logger, metrics, start_run
 
 # 文件路径 - 请替换为你实际的路径
 rawdata_path = r"请替换为你实际的路径\rawdata.xlsx"
 contact_list_path = r"请替换为你实际的路径\contact_list.xlsx"
 output_path = r"请替换为你实际的路径\output\whitelist_updated.xlsx"
 
-# 读取文件
-rawdata_df = pd.read_excel(rawdata_path)
-contact_list_df = pd.read_excel(contact_list_path)
 
-# 检查和替换
-# 对协议号建立映射关系 {协议号: 协议客户名称}
-protocol_mapping = dict(zip(contact_list_df['协议号'], contact_list_df['协议客户名称']))  # 使用正确的列名
+def load_company_mapping(contact_list_path):
+    """读取批量发送列表，返回 {协议号: 协议客户名称}"""
+    contact_list_df = read_frame(contact_list_path, CONTACT_LIST, ['协议号', '协议客户名称'])
+    return dict(zip(contact_list_df['协议号'], contact_list_df['协议客户名称']))  # 使用正确的列名
+
+
+def apply_company_names(rawdata_df, protocol_mapping):
+    """用协议号映射更新原始数据中的公司名称，映射中没有的协议号保留原值"""
+    rawdata_df['公司名称'] = rawdata_df['协议号'].map(protocol_mapping).combine_first(
+        rawdata_df['公司名称'].astype(object)).astype('category')
+    return rawdata_df
+
+
+def update_company_names(rawdata_path, contact_list_path, output_path, workers=None):
+    """
+    根据协议号映射关系，将联系人列表中的协议客户名称更新到原始数据的公司名称列
+    rawdata_path 也可以是目录或通配符，多个原始导出并行读取后合并为一个文件
+    """
+    rawdata_paths = resolve_inputs(rawdata_path)
+    if not rawdata_paths:
+        raise FileNotFoundError(f"原始数据文件不存在：{rawdata_path}")
+
+    # 读取文件
+    with metrics.timer('read_excel'):
+        # 读取所有列：更新后整表写回，联系电话、登记日期等 2MU.py 不用的列也要原样保留
+        rawdata_df = read_frames(rawdata_paths, RAW_EXPORT, workers, all_columns=True)
+        # 检查和替换
+        # 将协议号和客户名称建立映射关系 {协议号: 协议客户名称}
+        protocol_mapping = load_company_mapping(contact_list_path)
+    metrics.incr('rows_read', len(rawdata_df))
+
+    # 更新公司名称
+    rawdata_df = apply_company_names(rawdata_df, protocol_mapping)
+
+    # 保存修改后的文件
+    with metrics.timer('to_excel'):
+        rawdata_df.to_excel(output_path, index=False)
+    metrics.incr('files_written')
+
+    logger.info(f"文件已更新并保存到：{output_path}")
+    return rawdata_df
 
-# 替换公司名称
-rawdata_df['公司名称'] = rawdata_df['协议号'].map(protocol_mapping).combine_first(rawdata_df['公司名称'])
 
-# 保存修改后的文件
-rawdata_df.to_excel(output_path, index=False)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='根据协议号更新原始数据中的公司名称')
+    add_arguments(parser)
+    args = parser.parse_args()
 
-print(f"文件已更新并保存到：{output_path}")
+    start_run('1MU_update_company_name', quiet=args.quiet, profile_dir=args.profile)
+    with metrics.timer('update_company_names'):
+        update_company_names(rawdata_path, contact_list_path, output_path)
+    finish_run(args.metrics_file)
@@ -1,94 +1,89 @@
+import argparse
 import os
-import pandas as pd
+import threading
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
 from openpyxl import load_workbook, Workbook
-from openpyxl.styles import Alignment, Font, PatternFill
-from openpyxl.styles.numbers import FORMAT_TEXT
-from openpyxl.utils import get_column_letter
-from openpyxl.utils.cell import coordinate_from_string, column_index_from_string
 from copy import copy
 
+from ingest import RAW_EXPORT, read_frames, resolve_inputs
+from layouts import DEFAULT_LAYOUT, get_layout, load_plugins
+from metrics import add_arguments, finish_run, flush_logs, logger, metrics, start_run
+from whitelist_index import WHITELIST_INDEX_NAME, WhitelistIndex, row_keys
+
 # 读取excel_utils模块，包含所需的函数
 from excel_utils import (
     extract_birthday_and_add_to_column,
     split_info_to_next_row,
     split_column_and_add,
     convert_names_to_pinyin,
-    save_grouped_to_sheets
+    sheet_title,
+    append_group
 )
-def split_sheets_to_individual_files(output_file_path, output_dir):
-    """拆分每个工作表成独立的Excel文件，文件名格式为 MU_工作表名称_A3单元格内容，并删除A列"""
-    workbook = load_workbook(output_file_path)
-    for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
-        # 获取 A3 单元格内容
-        a3_content = sheet["A3"].value if sheet["A3"].value else "Empty"
-
-        # 创建文件名
-        file_name = f"MU_{sheet_name}_{a3_content}.xlsx"
-        file_name = file_name.replace("/", "-")  # 防止非法字符
-        file_path = os.path.join(output_dir, file_name)
-
-        # 创建新的工作簿
-        new_workbook = Workbook()
-        new_sheet = new_workbook.active
-        new_sheet.title = sheet_name
-
-        # 复制原始工作表的内容到新的工作表，包括值、样式和合并单元格
-        copy_sheet(sheet, new_sheet)
-
-        # 取消可能存在的合并单元格
-        if new_sheet.merged_cells.ranges:
-            merged_cells = list(new_sheet.merged_cells)
-            for merged_cell in merged_cells:
-                new_sheet.unmerge_cells(str(merged_cell))
-
-        # 删除 A 列
-        new_sheet.delete_cols(1)
-
-        # 获取最大列数
-        max_col = new_sheet.max_column
-
-        # 重新设置首行格式
-        new_sheet.merge_cells(start_row=1, start_column=1, end_row=1, end_column=3)  # 合并A1到C1
-        new_sheet.merge_cells(start_row=1, start_column=4, end_row=1, end_column=7)  # 合并D1到G1
-
-        # 检查是否存在H列和I列
-        if max_col >= 8:  # H列的索引是8
-            if max_col >= 9:  # I列的索引是9
-                new_sheet.merge_cells(start_row=1, start_column=8, end_row=1, end_column=9)  # 合并H1到I1
-            else:
-                # 只有H列存在，不需要合并
-                pass
-        else:
-            # H列不存在，跳过合并
-            pass
 
-        # 设置首行内容
-        new_sheet.cell(row=1, column=1, value="姓名信息(中英文至少填写一项）")
-        new_sheet.cell(row=1, column=4, value="证件信息（至少填写一种证件）")
+# 后台保存合并工作簿的线程，见 wait_for_combined_workbooks
+_combined_writers = []
 
-        if max_col >= 8:
-            new_sheet.cell(row=1, column=8, value="C0客户必填")
-        else:
-            pass  # H列不存在，跳过设置
 
-        # 设置首行字体和对齐方式
-        for col in range(1, max_col + 1):
-            cell = new_sheet.cell(row=1, column=col)
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-            cell.font = Font(name="宋体", bold=True)
+def write_individual_file(sheet, output_dir, layout, in_memory=False):
+    """
+    把合并工作簿中的一个工作表写成独立文件：复制到新工作簿，取消合并单元格并删除A列，再按航司布局设置表头
+    文件名格式为 航司代码_工作表名称_A3单元格内容（如 MU_协议号_公司名称）
+    返回文件路径；in_memory 为 True 时不写入 output_dir，返回 (文件名, 内容字节串)
+    """
+    # 获取 A3 单元格内容
+    a3_content = sheet["A3"].value if sheet["A3"].value else "Empty"
+
+    # 创建文件名
+    file_name = layout.file_name(sheet.title, a3_content)
+    file_path = os.path.join(output_dir, file_name)
+
+    # 创建新的工作簿
+    new_workbook = Workbook()
+    new_sheet = new_workbook.active
+    new_sheet.title = sheet.title
 
-        # 设置列宽
-        for col_idx, width in zip(range(1, max_col + 1), [28.75]*3 + [28.5]*4 + [15.5]*2):
-            if col_idx <= max_col:
-                col_letter = get_column_letter(col_idx)
-                new_sheet.column_dimensions[col_letter].width = width
+    # 复制原始工作表的内容到新的工作表，包括值、样式和合并单元格
+    copy_sheet(sheet, new_sheet)
 
-        # 设置行高
-        new_sheet.row_dimensions[1].height = 23
+    # 取消可能存在的合并单元格
+    if new_sheet.merged_cells.ranges:
+        merged_cells = list(new_sheet.merged_cells)
+        for merged_cell in merged_cells:
+            new_sheet.unmerge_cells(str(merged_cell))
 
+    # 删除 A 列
+    new_sheet.delete_cols(1)
+
+    # 按航司布局设置表头格式
+    layout.finish_sheet(new_sheet)
+
+    if in_memory:
+        buffer = BytesIO()
+        with metrics.timer('save'):
+            new_workbook.save(buffer)
+        metrics.incr('files_written')
+        logger.debug(f"生成独立文件并删除A列（内存）：{file_name}")
+        return file_name, buffer.getvalue()
+
+    with metrics.timer('save'):
         new_workbook.save(file_path)
-        print(f"保存独立文件并删除A列：{file_path}")
+    metrics.incr('files_written')
+    logger.debug(f"保存独立文件并删除A列：{file_path}")
+    return file_path
+
+
+def split_sheets_to_individual_files(output_file_path, output_dir, layout=None, in_memory=False):
+    """
+    拆分已保存的合并工作簿中的每个工作表成独立的Excel文件，见 write_individual_file
+    返回生成的文件路径列表；in_memory 为 True 时不写入 output_dir，返回 [(文件名, 内容字节串), ...]
+    build 不再经过这一步（见 render_layout），保留用于单独处理已有的合并工作簿
+    """
+    layout = layout or get_layout(DEFAULT_LAYOUT)
+    with metrics.timer('load_workbook'):
+        workbook = load_workbook(output_file_path)
+    return [write_individual_file(workbook[sheet_name], output_dir, layout, in_memory)
+            for sheet_name in workbook.sheetnames]
 
 
 def copy_sheet(source_sheet, target_sheet):
@@ -113,211 +108,260 @@ def copy_sheet(source_sheet, target_sheet):
     for merged_cell in source_sheet.merged_cells.ranges:
         target_sheet.merge_cells(str(merged_cell))
 
-def modify_sheets(output_file_path):
-    workbook = load_workbook(output_file_path)
+def modify_sheets(output_file_path, layout=None):
+    """按航司布局修改合并工作簿中的所有工作表，默认为东航模板"""
+    layout = layout or get_layout(DEFAULT_LAYOUT)
+    with metrics.timer('load_workbook'):
+        workbook = load_workbook(output_file_path)
     for sheet_name in workbook.sheetnames:
-        sheet = workbook[sheet_name]
-
-        # 取消所有合并单元格
-        if sheet.merged_cells.ranges:
-            merged_cells = list(sheet.merged_cells)
-            for merged_cell in merged_cells:
-                sheet.unmerge_cells(str(merged_cell))
-
-        # 插入新行
-        sheet.insert_rows(1)
-
-        # 在新行的B1, E1, I1设置内容
-        sheet["B1"] = "姓名信息(中英文至少填写一项）"
-        sheet["E1"] = "证件信息（至少填写一种证件）"
-        sheet["I1"] = "C0客户必填"
-
-        # 合并单元格
-        sheet.merge_cells("B1:D1")
-        sheet.merge_cells("E1:H1")
-        sheet.merge_cells("I1:J1")
-
-        # 设置字体样式
-        for cell_range in ["B1:D1", "E1:H1", "I1:J1"]:
-            for row in sheet[cell_range]:
-                for cell in row:
-                    cell.alignment = Alignment(horizontal="center", vertical="center")
-                    cell.font = Font(name="宋体", bold=True)
-
-        # 设置新行的行高
-        sheet.row_dimensions[1].height = 23
-
-        # 修改原来的第一行（现在是第二行）为新内容
-        headers = [
-            "员工姓名（中）", "员工姓名（英/拼音）", "生日", "身份证号码",
-            "护照号码", "其他证件类型（下拉选择）", "其他证件号", "所属企业名称", "企业所在地"
-        ]
-        for col_idx, header in enumerate(headers, start=2):
-            cell = sheet.cell(row=2, column=col_idx)  # 修改第二行
-            cell.value = header
-            cell.alignment = Alignment(horizontal="center", vertical="center")
-            cell.font = Font(name="宋体", bold=True)
-
-        # 设置第二行的行高为34.5
-        sheet.row_dimensions[2].height = 34.5
-
-        # 设置列宽
-        for col, width in zip(["B", "C", "D"], [28.75, 28.75, 28.75]):
-            sheet.column_dimensions[col].width = width
-        for col, width in zip(["E", "F", "G", "H"], [28.5, 28.5, 28.5, 28.5]):
-            sheet.column_dimensions[col].width = width
-        for col, width in zip(["I", "J"], [15.5, 15.5]):
-            sheet.column_dimensions[col].width = width
-
-        # 设置E, F, H列单元格格式为纯文本
-        for col_letter in ["E", "F", "H"]:
-            for row in sheet.iter_rows(min_col=column_index_from_string(col_letter),
-                                       max_col=column_index_from_string(col_letter),
-                                       min_row=3):
-                for cell in row:
-                    cell.number_format = FORMAT_TEXT
-
-        # 设置颜色填充
-        red_fill = PatternFill(start_color="FFFF0000", end_color="FFFF0000", fill_type="solid")
-        yellow_fill = PatternFill(start_color="FFFFFF00", end_color="FFFFFF00", fill_type="solid")
-
-        for col_letter in ["B", "C", "E", "F", "G", "H"]:
-            sheet[f"{col_letter}2"].fill = red_fill  # B2, C2, E2-H2填充红色
-        for col_letter in ["D", "I", "J"]:
-            sheet[f"{col_letter}2"].fill = yellow_fill  # D2, I2, J2填充黄色
-
-        # 删除G3:L3及以下单元格内容
-        for row in sheet.iter_rows(min_row=3, max_row=sheet.max_row, min_col=7, max_col=12):  # G列到L列
-            for cell in row:
-                cell.value = None
-
-        # 筛选替换逻辑
-        max_row = sheet.max_row  # 由于后续可能删除行，需要提前获取最大行数
-        for row_index in range(3, max_row + 1):
-            n_value = sheet[f"N{row_index}"].value
-            if n_value == "身份证":  # 检测N列内容是否为"身份证"
-                id_value = sheet[f"M{row_index}"].value  # 获取对应M列单元格的值
-                sheet[f"E{row_index}"].value = id_value  # 将M列值复制到E列
-                sheet[f"C{row_index}"].value = None  # 清空C列单元格内容
-                sheet[f"D{row_index}"].value = None  # 清空D列单元格内容
-                sheet[f"F{row_index}"].value = None  # 清空F列单元格内容
-
-            elif n_value in ["普通护照", "公务护照"]:  # 检测N列内容是否为护照
-                c_value = sheet[f"C{row_index}"].value or ""
-                d_value = sheet[f"D{row_index}"].value or ""
-                # 合并C列和D列内容，转大写并去除空格
-                combined_value = (str(c_value).replace(" ", "") + "/" + str(d_value).replace(" ", "")).upper()# 合并C列和D列内容，中间添加"/"，转大写并去除空格
-                sheet[f"C{row_index}"].value = combined_value  # 设置合并后的值到C列
-                sheet[f"D{row_index}"].value = sheet[f"E{row_index}"].value  # 将E列内容复制到D列
-                sheet[f"F{row_index}"].value = sheet[f"M{row_index}"].value  # 将M列内容复制到F列
-                sheet[f"E{row_index}"].value = None  # 删除E列单元格内容
-
-            elif n_value:  # 如果N列内容既不是身份证也不是护照类型
-                sheet[f"G{row_index}"].value = n_value  # 将N列内容复制到G列
-                sheet[f"H{row_index}"].value = sheet[f"M{row_index}"].value  # 将M列内容复制到H列
-                # 合并C列和D列内容，转大写去空格
-                c_value = sheet[f"C{row_index}"].value or ""
-                d_value = sheet[f"D{row_index}"].value or ""
-                combined_value = (str(c_value).replace(" ", "") + "/" + str(d_value).replace(" ", "")).upper()# 合并C列和D列内容，中间添加"/"，转大写并去除空格
-                sheet[f"C{row_index}"].value = combined_value
-                sheet[f"D{row_index}"].value = sheet[f"E{row_index}"].value  # 将E列内容复制到D列
-                # 删除F列内容
-                sheet[f"F{row_index}"].value = None
-                sheet[f"E{row_index}"].value = None  # 删除E列单元格内容
-
-        # 检查B列相邻单元格内容，当N列内容没有“身份证”时合并相邻行
-        row = 3
-        while row < sheet.max_row:
-            b_value = sheet[f"B{row}"].value
-            n_value = sheet[f"N{row}"].value
-            b_next = sheet[f"B{row + 1}"].value
-            n_next = sheet[f"N{row + 1}"].value
-
-            if b_value == b_next and "身份证" not in [n_value, n_next]:
-                for col in range(2, sheet.max_column + 1):  # 遍历列
-                    current_cell = sheet.cell(row=row, column=col)
-                    next_cell = sheet.cell(row=row + 1, column=col)
-
-                    if current_cell.value is None and next_cell.value is not None:
-                        current_cell.value = next_cell.value  # 将下一行内容合并到当前行
-                sheet.delete_rows(row + 1)  # 删除下一行
-                continue  # 继续检查当前行
-            row += 1
-
-        # 检查B列相邻单元格内容，当相邻行N列内容有“身份证”时保留身份证行
-        rows_to_delete = []
-        row = 3
-        while row < sheet.max_row:
-            b_value = sheet[f"B{row}"].value
-            n_value = sheet[f"N{row}"].value
-            b_next = sheet[f"B{row + 1}"].value
-            n_next = sheet[f"N{row + 1}"].value
-
-            if b_value == b_next:  # 如果B列内容相邻一致
-                if "身份证" in [n_value, n_next]:  # 如果N列中有身份证
-                    if n_value == "身份证":
-                        rows_to_delete.append(row + 1)  # 删除下一行
-                    elif n_next == "身份证":
-                        rows_to_delete.append(row)  # 删除当前行
-                    row += 1  # 跳过下一行
-            row += 1
-
-        # 删除收集到的行
-        for row in sorted(rows_to_delete, reverse=True):
-            sheet.delete_rows(row)
-
-        # 删除B列单元格内容，当对应C列单元格有内容时
-        for row in range(3, sheet.max_row + 1):
-            if sheet[f"C{row}"].value:  # 如果C列有内容
-                sheet[f"B{row}"].value = None  # 删除对应B列内容
-
-        # 删除J-M列
-        sheet.delete_cols(11, 4)  # 从J列开始删除4列
+        layout.format_sheet(workbook[sheet_name])
 
     # 保存修改
-    workbook.save(output_file_path)
-
-def main():
-    input_file = r"请替换为你实际的路径\RawData\MUwhitelist_updated.xlsx"
-    output_dir = r"请替换为你实际的路径\output"
-    output_file_name = "MU协议号拆分.xlsx"
-
-    if not os.path.exists(input_file):
-        print(f"输入文件不存在：{input_file}")
-        return
-
-    df = pd.read_excel(input_file)
+    with metrics.timer('save'):
+        workbook.save(output_file_path)
+
+def combined_workbook_paths(output_dir, output_file_name, shard_count):
+    """合并工作簿的文件路径：只有一个分片时为 output_file_name，否则为 名称-001.xlsx、名称-002.xlsx ..."""
+    if shard_count == 1:
+        return [os.path.join(output_dir, output_file_name)]
+    stem, ext = os.path.splitext(output_file_name)
+    return [os.path.join(output_dir, f"{stem}-{i:03d}{ext}") for i in range(1, shard_count + 1)]
+
+
+def save_combined_workbooks(shards, paths):
+    """保存合并工作簿的各个分片（在后台线程中执行）"""
+    for workbook, path in zip(shards, paths):
+        try:
+            with metrics.timer('save_combined_workbook'):
+                workbook.save(path)
+            metrics.incr('combined_workbooks_written')
+            logger.info(f"保存合并工作簿：{path}")
+        except Exception as e:
+            logger.error(f"保存合并工作簿失败 {path}: {e}")
+
+
+def wait_for_combined_workbooks():
+    """等待后台保存的合并工作簿全部写完（结束运行、写入指标之前调用）"""
+    while _combined_writers:
+        _combined_writers.pop().join()
+
+
+def render_layout(df, output_dir, code, output_file_name=None, layout_plugins=(), in_memory=False,
+                  combined_sheets=0, background=True, on_file=None):
+    """
+    按一个航司布局生成按协议号拆分的独立文件，返回 (独立文件路径列表, {文件名: 生成该文件的源数据行的键})
+    在子进程中执行时先导入布局插件；in_memory 见 write_individual_file
+
+    每个协议号的工作表在内存中生成、按布局修改后直接写成独立文件，不再先保存合并工作簿再读回。
+    combined_sheets 大于 0 时保留合并工作簿（供核对），每个文件最多 combined_sheets 个工作表；
+    合并工作簿在所有独立文件生成之后保存，background 为 True 时在后台线程中保存，
+    调用方用 wait_for_combined_workbooks 等待。合并工作簿不作为后续步骤的输入。
+    on_file: 每生成一个独立文件就调用 on_file(文件)，用于边生成边发送
+    """
+    load_plugins(layout_plugins)
+    layout = get_layout(code)
+    output_file_name = output_file_name or layout.workbook_name
+    if not os.path.exists(output_dir) and (not in_memory or combined_sheets):
+        os.makedirs(output_dir)
 
+    written = []
+    staged = {}
+    shards = []
+    scratch = None
+    with metrics.timer('render_layout'):
+        for agreement_value, group in df.groupby('协议号'):
+            title = sheet_title(agreement_value)
+            if combined_sheets:
+                # 当前分片已满时开始新的分片；新工作簿自带的空工作表用作第一个工作表
+                if not shards or len(shards[-1].sheetnames) >= combined_sheets:
+                    shards.append(Workbook())
+                    sheet = shards[-1].active
+                    sheet.title = title
+                else:
+                    sheet = shards[-1].create_sheet(title=title)
+            else:
+                scratch = scratch or Workbook()
+                sheet = scratch.create_sheet(title=title)
+
+            # 在 format_sheet 之前取得该文件所有源数据行的键，合并或删掉的行也随文件一起提交
+            keys = row_keys(group)
+            with metrics.timer('append_group'):
+                append_group(sheet, group)
+            with metrics.timer('format_sheet'):
+                layout.format_sheet(sheet)
+            with metrics.timer('write_individual_file'):
+                written.append(write_individual_file(sheet, output_dir, layout, in_memory))
+            file_name = written[-1][0] if in_memory else os.path.basename(written[-1])
+            staged[file_name] = keys
+            if on_file is not None:
+                on_file(written[-1])
+            if not combined_sheets:
+                scratch.remove(sheet)
+
+    if shards:
+        paths = combined_workbook_paths(output_dir, output_file_name, len(shards))
+        if background:
+            writer = threading.Thread(target=save_combined_workbooks, args=(shards, paths),
+                                      name=f'combined-workbook-{code}')
+            writer.start()
+            _combined_writers.append(writer)
+        else:
+            save_combined_workbooks(shards, paths)
+    return written, staged
+
+
+def build(df, output_dir, whitelist_index, output_file_name=None, include_known=False, batch=None,
+          layouts=None, layout_plugins=(), workers=None, in_memory=False, combined_sheets=0,
+          on_plan=None, on_file=None):
+    """
+    由更新公司名称后的数据生成按协议号拆分的文件
+    whitelist_index: 已打开的 WhitelistIndex，由调用方负责关闭（监控模式下在多个批次之间复用）
+    batch: 暂存到历史白名单的批次名
+    layouts: 航司布局代码列表，默认只生成东航模板；每个布局只生成该布局尚未提交过的旅客；
+             output_file_name 只在一个布局时使用
+    layout_plugins: 需要导入的布局插件模块
+    in_memory: 独立文件只在内存中生成，不写入 output_dir
+    combined_sheets: 大于 0 时另外保存合并工作簿，每个文件最多这么多个工作表，见 render_layout
+    on_plan: 生成文件之前调用 on_plan(协议号列表, {布局代码: 该布局生成的协议号列表})，返回 False 时不生成
+    on_file: 每生成一个独立文件调用 on_file(文件)；多个布局在进程池中生成时，在全部完成后依次调用
+
+    每个文件的源数据行暂存在历史白名单中，文件发送成功后由 4mail.py 记为已提交，见 WhitelistIndex
+
+    Returns:
+        生成的独立文件路径列表，in_memory 时为 [(文件名, 内容字节串), ...]；没有新增旅客或数据有误时为空列表
+    """
     if '公司名称' not in df.columns or df['公司名称'].isnull().any():
-        print("警告：公司名称列缺失或存在空值，请检查数据！")
-        return
+        logger.warning("警告：公司名称列缺失或存在空值，请检查数据！")
+        return []
 
     # 数据处理
-    df = extract_birthday_and_add_to_column(df)
-    df = split_info_to_next_row(df)
-    df = split_column_and_add(df)
-    df = convert_names_to_pinyin(df)
-
-    # 保存到单一文件，分组数据存入独立工作表
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    output_file_path = os.path.join(output_dir, output_file_name)
-    save_grouped_to_sheets(
-        df,
-        save_path=output_dir,
-        file_name=output_file_name,
-        company_name_col='公司名称',
-        agreement_col='协议号'
-    )
-
-    # 修改所有工作表
-    modify_sheets(output_file_path)
+    with metrics.timer('extract_birthday_and_add_to_column'):
+        df = extract_birthday_and_add_to_column(df)
+    with metrics.timer('split_info_to_next_row'):
+        df = split_info_to_next_row(df)
+    metrics.incr('rows_expanded', len(df))
+    with metrics.timer('split_column_and_add'):
+        df = split_column_and_add(df)
+
+    layouts = list(layouts or [DEFAULT_LAYOUT])
+    for code in layouts:
+        get_layout(code)  # 未注册的布局在生成任何文件之前报错
+
+    # 按航司布局过滤已经提交过的旅客，只保留真正的新增；只要对一个布局是新增，这一行就继续处理
+    if include_known:
+        masks = None
+    else:
+        with metrics.timer('filter_known_travellers'):
+            masks = whitelist_index.new_rows(df, layouts)
+            keep = [any(flags) for flags in zip(*masks.values())]
+            df = df[keep].reset_index(drop=True)
+            masks = {code: [flag for flag, kept in zip(mask, keep) if kept] for code, mask in masks.items()}
+        suppressed = len(keep) - len(df)
+        metrics.incr('rows_suppressed', suppressed)
+        logger.info(f"历史白名单中已存在 {suppressed} 行，已过滤，剩余 {len(df)} 行新增")
+        if len(layouts) > 1:
+            for code in layouts:
+                logger.info(f"  - {code}: 新增 {sum(masks[code])} 行")
+        if df.empty:
+            logger.info("没有新增的旅客，无需生成文件")
+            return []
+    with metrics.timer('convert_names_to_pinyin'):
+        df = convert_names_to_pinyin(df)
+
+    # 整理好的数据只计算一次，每个航司布局按各自的新增行生成文件；多个布局在进程池中并行
+    frames = {code: df if masks is None else df[masks[code]] for code in layouts}
+    layouts = [code for code in layouts if not frames[code].empty]
+    if not layouts:
+        logger.info("没有需要生成的数据")
+        return []
+    plan = {code: [sheet_title(a) for a in frames[code]['协议号'].unique()] for code in layouts}
+    if on_plan is not None and on_plan([sheet_title(a) for a in df['协议号'].unique()], plan) is False:
+        return []
+    if len(layouts) == 1:
+        written, staged = render_layout(frames[layouts[0]], output_dir, layouts[0], output_file_name,
+                                        in_memory=in_memory, combined_sheets=combined_sheets, on_file=on_file)
+        results = [(written, staged)]
+    else:
+        flush_logs()
+        with metrics.timer('render_layouts'), \
+                ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(layouts))) as pool:
+            # 子进程返回前必须写完合并工作簿，不使用后台线程
+            results = list(pool.map(render_layout, [frames[code] for code in layouts], [output_dir] * len(layouts),
+                                    layouts, [None] * len(layouts), [layout_plugins] * len(layouts),
+                                    [in_memory] * len(layouts), [combined_sheets] * len(layouts),
+                                    [False] * len(layouts)))
+        written = [file for files, _ in results for file in files]
+        metrics.incr('files_written', len(written))
+        if on_file is not None:
+            for file in written:
+                on_file(file)
+
+    # 文件全部生成后按布局暂存本批次的旅客，发送成功后才记入历史白名单
+    pending = sum(whitelist_index.stage(staged, layout=code, batch=batch)
+                  for code, (_, staged) in zip(layouts, results))
+    logger.info(f"已暂存 {pending} 条，发送成功后记入历史白名单")
+
+    logger.info("处理完成！")
+    return written
+
+
+def main(input_file=r"请替换为你实际的路径\RawData\MUwhitelist_updated.xlsx",
+         output_dir=r"请替换为你实际的路径\output",
+         output_file_name=None,
+         index_path=None,
+         include_known=False,
+         workers=None,
+         layouts=None,
+         layout_plugins=(),
+         in_memory=False,
+         combined_sheets=0,
+         on_plan=None,
+         on_file=None):
+    """
+    input_file: 单个文件，或包含多个文件的目录、通配符（如 RawData\\*.xlsx），多个文件合并为一个批次
+    index_path: 历史白名单数据库路径，默认为 output_dir 下的 白名单历史.sqlite3
+    include_known: 为 True 时不过滤已提交过的旅客（全部重新生成）
+    workers: 读取多个文件、生成多个布局时的进程数，默认为CPU核数
+    layouts: 航司布局代码列表，默认为 ['MU']；layout_plugins 为定义其它航司布局的插件模块
+    in_memory: 独立文件只在内存中生成，见 build
+    combined_sheets: 保留合并工作簿时每个文件的工作表数，0 为不保存
+    on_plan / on_file: 边生成边发送时的回调，见 build
+
+    Returns:
+        build 的结果，输入文件不存在时为 None
+    """
+    load_plugins(layout_plugins)
+
+    input_files = resolve_inputs(input_file)
+    if not input_files:
+        logger.error(f"输入文件不存在：{input_file}")
+        return
 
-    # 拆分工作表成独立文件并删除A列
-    split_sheets_to_individual_files(output_file_path, output_dir)
+    with metrics.timer('read_excel'):
+        df = read_frames(input_files, RAW_EXPORT, workers)
+    metrics.incr('rows_read', len(df))
+    metrics.incr('files_read', len(input_files))
 
-    print("处理完成！")
+    with WhitelistIndex(index_path or os.path.join(output_dir, WHITELIST_INDEX_NAME)) as whitelist_index:
+        return build(df, output_dir, whitelist_index, output_file_name, include_known,
+                     batch=os.path.basename(os.path.normpath(input_file)),
+                     layouts=layouts, layout_plugins=layout_plugins, workers=workers, in_memory=in_memory,
+                     combined_sheets=combined_sheets, on_plan=on_plan, on_file=on_file)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='将白名单数据格式化为航司模板并按协议号拆分')
+    parser.add_argument('--history-db', help='历史白名单数据库路径，默认为输出目录下的 白名单历史.sqlite3')
+    parser.add_argument('--include-known', action='store_true', help='不过滤已提交过的旅客，全部重新生成')
+    parser.add_argument('--layouts', help='航司布局代码，多个用逗号分隔，默认为 MU')
+    parser.add_argument('--layout-plugin', action='append', default=[], help='定义其它航司布局的插件模块，可重复指定')
+    parser.add_argument('--combined-sheets', type=int, default=0,
+                        help='另外保存合并工作簿，每个文件最多 N 个工作表；默认不保存')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    start_run('2MU', quiet=args.quiet, profile_dir=args.profile)
+    main(index_path=args.history_db, include_known=args.include_known,
+         layouts=args.layouts.split(',') if args.layouts else None, layout_plugins=args.layout_plugin,
+         combined_sheets=args.combined_sheets)
+    wait_for_combined_workbooks()
+    finish_run(args.metrics_file)
@@ -1,63 +1,159 @@
+import argparse
 import os
 import shutil
-import pandas as pd
-import numpy as np
+
+from delivery_store import DeliveryStore, default_db_path
+from ingest import CONTACT_LIST, read_records
+from metrics import add_arguments, finish_run, logger, metrics, start_run
+from send_records import InMemoryFile
 
 # 定义Excel文件路径 - 请替换为你实际的路径
 mapping_file_path = r"请替换为你实际的路径\邮件批量发送\MU批量发送列表.xlsx"
 
-# 读取映射文件，并确保协议号列被转换为字符串
-mapping_df = pd.read_excel(mapping_file_path, dtype={'协议号': str, '航司对接人邮箱': str})
-
-# 将映射关系存储在字典中，并处理 NaN 值
-mapping_df['航司对接人邮箱'].fillna('无邮箱', inplace=True)
-mapping = dict(zip(mapping_df['协议号'], mapping_df['航司对接人邮箱']))
-
-# 打印映射关系以进行调试
-print("映射关系：", mapping)
-
 # 定义Excel文件所在的目录和目标根目录 - 请替换为你实际的路径
 source_directory = r"请替换为你实际的路径\output"  # 请修改为实际路径
 target_root_directory = r"请替换为你实际的路径\target"  # 请修改为实际路径
 
-# 确保目标根目录存在
-if not os.path.exists(target_root_directory):
-    os.makedirs(target_root_directory)
-
-# 遍历源目录中的文件
-for filename in os.listdir(source_directory):
-    if filename.endswith('.xlsx') and not filename.startswith('~$'):
-        # 提取文件名中的编号，并转换为字符串
-        parts = filename.split('_')
-        if len(parts) > 1:
-            number = parts[1]
-            print(f"处理文件: {filename}, 提取到的编号: {number}")
-            if number in mapping:
-                # 获取对应的邮箱地址，并检查其有效性
-                email = mapping[number].strip()  # 移除邮箱地址两端的空格
-                if pd.notna(email):
-                    print(f"编号 {number} 对应的邮箱地址是 {email}")
-                    # 创建目标文件夹路径
-                    target_directory = os.path.join(target_root_directory, email)
-                    if not os.path.exists(target_directory):
-                        os.makedirs(target_directory)
-                        print(f"创建目标文件夹: {target_directory}")
-                    # 检查文件是否存在于源目录
-                    source_file_path = os.path.join(source_directory, filename)
-                    target_file_path = os.path.join(target_directory, filename)
-                    print(f"源文件路径: {source_file_path}")
-                    print(f"目标文件路径: {target_file_path}")
-                    if os.path.exists(source_file_path):
-                        # 移动文件到目标文件夹
-                        shutil.move(source_file_path, target_file_path)
-                        print(f"移动文件 {filename} 到 {target_directory}")
+
+def load_email_mapping(mapping_file_path):
+    """读取映射文件，返回 {协议号: 航司对接人邮箱}"""
+    # 读取映射文件，协议号统一为字符串
+    _, records = read_records(mapping_file_path, CONTACT_LIST, ['协议号', '航司对接人邮箱'])
+
+    # 将映射关系存储在字典中，邮箱为空时记为"无邮箱"
+    mapping = {}
+    for _, row in records:
+        if row.get('协议号') is None:
+            continue
+        email = row.get('航司对接人邮箱')
+        mapping[row['协议号']] = email or '无邮箱'
+    return mapping
+
+
+def route_files_to_email_folders(mapping, source_directory, target_root_directory, delivery_store=None):
+    """
+    按协议号把 source_directory 中的 MU_协议号_公司名.xlsx 移动到 target/邮箱/ 目录
+    传入 delivery_store 时，已经发送给该邮箱且内容相同的文件不再移动
+    """
+    # 确保目标根目录存在
+    if not os.path.exists(target_root_directory):
+        os.makedirs(target_root_directory)
+
+    moved_count = 0
+    # 遍历源目录中的文件
+    for filename in os.listdir(source_directory):
+        if filename.endswith('.xlsx') and not filename.startswith('~$'):
+            # 提取文件名中的编号，并转换为字符串
+            parts = filename.split('_')
+            if len(parts) > 1:
+                number = parts[1]
+                logger.debug(f"处理文件: {filename}, 提取到的编号: {number}")
+                if number in mapping:
+                    # 获取对应的邮箱地址，并检查其有效性
+                    email = mapping[number].strip()  # 移除邮箱地址两端的空格
+                    if email:
+                        logger.debug(f"编号 {number} 对应的邮箱地址是 {email}")
+                        # 创建目标文件夹路径
+                        target_directory = os.path.join(target_root_directory, email)
+                        if not os.path.exists(target_directory):
+                            os.makedirs(target_directory)
+                            logger.debug(f"创建目标文件夹: {target_directory}")
+                        # 检查文件是否存在于源目录
+                        source_file_path = os.path.join(source_directory, filename)
+                        target_file_path = os.path.join(target_directory, filename)
+                        logger.debug(f"源文件路径: {source_file_path}")
+                        logger.debug(f"目标文件路径: {target_file_path}")
+                        if os.path.exists(source_file_path) and delivery_store is not None \
+                                and delivery_store.file_was_sent(source_file_path, email):
+                            metrics.incr('files_already_sent')
+                            logger.info(f"文件 {filename} 已发送给 {email}，跳过")
+                        elif os.path.exists(source_file_path):
+                            # 移动文件到目标文件夹
+                            shutil.move(source_file_path, target_file_path)
+                            metrics.incr('files_moved')
+                            moved_count += 1
+                            logger.debug(f"移动文件 {filename} 到 {target_directory}")
+                        else:
+                            metrics.incr('files_skipped')
+                            logger.warning(f"源文件 {filename} 不存在")
                     else:
-                        print(f"源文件 {filename} 不存在")
+                        metrics.incr('files_skipped')
+                        logger.warning(f"编号 {number} 对应的邮箱地址无效")
                 else:
-                    print(f"编号 {number} 对应的邮箱地址无效")
+                    metrics.incr('files_skipped')
+                    logger.warning(f"编号 {number} 不在映射关系中")
             else:
-                print(f"编号 {number} 不在映射关系中")
-        else:
-            print(f"文件名 {filename} 格式不正确，无法提取编号")
+                metrics.incr('files_skipped')
+                logger.info(f"文件名 {filename} 格式不正确，无法提取编号")
+
+    logger.info(f"文件移动完成，共移动 {moved_count} 个文件。")
+
+
+def route_in_memory_file(mapping, filename, data, target_root_directory):
+    """
+    按协议号把一个内存中的独立文件分配给邮箱，返回 (邮箱, InMemoryFile)
+    文件名格式不正确、编号不在映射关系中或邮箱为空时返回 None
+    """
+    parts = filename.split('_')
+    if len(parts) <= 1:
+        metrics.incr('files_skipped')
+        logger.info(f"文件名 {filename} 格式不正确，无法提取编号")
+        return None
+    number = parts[1]
+    if number not in mapping:
+        metrics.incr('files_skipped')
+        logger.warning(f"编号 {number} 不在映射关系中")
+        return None
+    email = mapping[number].strip()
+    if not email:
+        metrics.incr('files_skipped')
+        logger.warning(f"编号 {number} 对应的邮箱地址无效")
+        return None
+    metrics.incr('files_routed')
+    logger.debug(f"文件 {filename} 分配给 {email}")
+    return email, InMemoryFile(os.path.join(target_root_directory, email, filename), data)
+
+
+def route_in_memory(mapping, files, target_root_directory):
+    """
+    按协议号把内存中生成的独立文件分配给邮箱，不写入磁盘
+    Route in-memory workbooks by agreement number to airline contact emails
+
+    files 为 2MU.build(in_memory=True) 的结果 [(文件名, 内容字节串), ...]；
+    返回 {邮箱: [InMemoryFile, ...]}，每个附件的路径为它归档时的位置 target/邮箱/文件名。
+    已发送过的文件由 4mail.verify_email_agreement_match 按发送记录排除。
+    """
+    routed = {}
+    for filename, data in files:
+        routed_file = route_in_memory_file(mapping, filename, data, target_root_directory)
+        if routed_file is not None:
+            email, file = routed_file
+            routed.setdefault(email, []).append(file)
+
+    logger.info(f"文件分配完成，共 {sum(len(v) for v in routed.values())} 个文件，{len(routed)} 个邮箱。")
+    return routed
+
+
+def main(mapping_file_path=mapping_file_path, source_directory=source_directory,
+         target_root_directory=target_root_directory, delivery_db=None):
+    """读取映射文件并分类文件；delivery_db 默认为 target 根目录下的发送记录"""
+    with metrics.timer('load_email_mapping'):
+        mapping = load_email_mapping(mapping_file_path)
+
+    # 打印映射关系以进行调试
+    logger.debug(f"映射关系：{mapping}")
+
+    with metrics.timer('route_files_to_email_folders'), \
+            DeliveryStore(delivery_db or default_db_path(target_root_directory)) as delivery_store:
+        route_files_to_email_folders(mapping, source_directory, target_root_directory, delivery_store)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='按协议号将Excel文件分类到对应邮箱目录')
+    parser.add_argument('--delivery-db', help='发送记录数据库路径，默认为 target/发送记录.sqlite3')
+    add_arguments(parser)
+    args = parser.parse_args()
 
-print("文件移动完成。")
+    start_run('3MUmails', quiet=args.quiet, profile_dir=args.profile)
+    main(delivery_db=args.delivery_db)
+    finish_run(args.metrics_file)
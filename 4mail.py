@@ -1,15 +1,26 @@
 import os
 import glob
 import smtplib
-import getpass
-import pandas as pd
 import re
 import sys
 import shutil
+import threading
 import time
+from collections import Counter
 from email.message import EmailMessage
+from email.utils import make_msgid
 import argparse
 
+from consolidation import plan_consolidation, split_cc
+from delivery_store import DeliveryStore, default_db_path
+from domain_scheduler import DomainLimits, DomainScheduler, recipient_domain
+from ingest import CONTACT_LIST, read_records
+from metrics import add_arguments, finish_run, flush_logs, logger, metrics, start_run
+from preflight import report as preflight_report, run_preflight, write_report
+from send_records import InMemoryFile, SendGroup, SendReport, ValidationResults, attachment_content, open_attachment
+from smtp_transport import PipeliningSMTP
+from whitelist_index import WhitelistIndex
+
 # 添加邮箱验证函数
 def is_valid_email(email):
     """
@@ -28,62 +39,99 @@ def sanitize_header(value: str) -> str:
     """移除字符串中的 CR/LF，防止 header 验证错误"""
     return re.sub(r"[\r\n]+", " ", str(value)).strip()
 
-def verify_email_agreement_match(excel_path, target_dir):
+def verify_email_agreement_match(excel_path, target_dir, delivery_store=None, attachments=None):
     """
     验证test.xlsx中的航司对接人邮箱和协议号与target目录中的文件一致性
     Verify the consistency between airline contact emails and agreement numbers
+
+    传入 delivery_store 时，发送记录中已发送给同一收件人且内容相同的文件会被排除
+    传入 attachments（3MUmails.route_in_memory 的结果 {邮箱: [InMemoryFile]}）时，
+    用内存中的附件代替邮箱文件夹中的文件，不读取 target 目录
+    
+    Returns:
+        ValidationResults，读取失败时为空
     """
     # 检查Excel文件是否存在
     if not os.path.exists(excel_path):
-        print(f"错误: Excel文件不存在 - {excel_path}")
-        return {}
+        logger.error(f"错误: Excel文件不存在 - {excel_path}")
+        return ValidationResults()
         
     # 检查目标目录是否存在
-    if not os.path.exists(target_dir):
-        print(f"错误: 目标目录不存在 - {target_dir}")
-        return {}
+    if attachments is None and not os.path.exists(target_dir):
+        logger.error(f"错误: 目标目录不存在 - {target_dir}")
+        return ValidationResults()
     
     # 读取Excel文件
     try:
-        df = pd.read_excel(excel_path)
-        print(f"成功读取文件: {excel_path}，包含 {len(df)} 行数据")
+        with metrics.timer('read_excel'):
+            _, records = read_records(excel_path, CONTACT_LIST, ['航司对接人邮箱', '协议号'])
+        metrics.incr('rows_read', len(records))
+        logger.info(f"成功读取文件: {excel_path}，包含 {len(records)} 行数据")
     except Exception as e:
-        print(f"读取Excel文件失败: {e}")
-        return {}
-    
-    # 检查必要的列是否存在
-    required_columns = ['航司对接人邮箱', '协议号']
-    if not all(col in df.columns for col in required_columns):
-        print(f"Excel文件缺少必要的列: {', '.join(required_columns)}")
-        return {}
-    
-    # 按邮箱地址聚合验证结果
-    email_results = {}
+        logger.error(f"读取Excel文件失败: {e}")
+        return ValidationResults()
+    return match_contact_records(records, target_dir, delivery_store, attachments)
+
+
+def match_contact_records(records, target_dir, delivery_store=None, attachments=None):
+    """
+    按发送列表的行 [(行号, {列名: 值})] 匹配邮箱文件夹（或内存附件）中的文件，参数见 verify_email_agreement_match
+    边生成边发送时每个收件人的文件齐全后只用该收件人的行调用一次
+    """
+    # 按邮箱地址聚合验证结果，附件路径统一保存在共享的文件表中
+    email_results = ValidationResults()
     invalid_emails_count = 0
+    # 每个邮箱文件夹只列出一次：{邮箱: [(文件名, 文件表索引), ...]}
+    folder_listings = {}
+    
+    def list_folder(email, email_folder):
+        """列出邮箱文件夹中尚未发送的Excel文件"""
+        if email in folder_listings:
+            return folder_listings[email]
+        if attachments is not None:
+            excel_files = list(attachments.get(email, ()))
+        else:
+            # 获取该文件夹下所有Excel文件
+            excel_files = []
+            patterns = ["*.xls", "*.xlsx", "*.xlsm"]
+            for pat in patterns:
+                excel_files.extend(glob.glob(os.path.join(email_folder, pat)))
+        
+        # 排除发送记录中已经发送过的文件
+        if delivery_store is not None:
+            unsent_files = [f for f in excel_files if not delivery_store.file_was_sent(f, email)]
+            for file_path in sorted(set(excel_files) - set(unsent_files)):
+                logger.debug(f"  - 已发送过，跳过: {os.path.basename(file_path)}")
+                metrics.incr('files_already_sent')
+            excel_files = unsent_files
+        
+        listing = [(os.path.basename(f), email_results.files.add(f)) for f in excel_files]
+        folder_listings[email] = listing
+        return listing
     
     # 遍历每一行数据
-    for idx, row in df.iterrows():
-        email = str(row['航司对接人邮箱']).strip()
-        agreement_id = str(row['协议号']).strip()
+    for row_number, row in records:
+        email = str(row['航司对接人邮箱'] or '').strip()
+        agreement_id = row['协议号'] or ''
         
-        if not email or pd.isna(email) or email == 'nan':
-            print(f"第 {idx+2} 行: 航司对接人邮箱为空")
+        if not email:
+            logger.warning(f"第 {row_number} 行: 航司对接人邮箱为空")
             continue
             
         # 验证主收件人邮箱格式
         if not is_valid_email(email):
-            print(f"第 {idx+2} 行: 航司对接人邮箱 '{email}' 格式不正确，跳过")
+            logger.warning(f"第 {row_number} 行: 航司对接人邮箱 '{email}' 格式不正确，跳过")
             invalid_emails_count += 1
             continue
             
-        if not agreement_id or pd.isna(agreement_id) or agreement_id == 'nan':
-            print(f"第 {idx+2} 行: 协议号为空")
+        if not agreement_id:
+            logger.warning(f"第 {row_number} 行: 协议号为空")
             continue
         
         # 获取抄送列表
         cc_str = ""
         valid_cc_emails = []
-        if '抄送邮箱' in row and row['抄送邮箱'] and not pd.isna(row['抄送邮箱']):
+        if row.get('抄送邮箱'):
             cc_str_original = str(row['抄送邮箱']).strip()
             # 分割多个抄送邮箱
             cc_emails = [email.strip() for email in re.split(r'[,;\r\n]+', cc_str_original) if email.strip()]
@@ -92,116 +140,85 @@ def verify_email_agreement_match(excel_path, target_dir):
                 if is_valid_email(cc_email):
                     valid_cc_emails.append(cc_email)
                 else:
-                    print(f"第 {idx+2} 行: 抄送邮箱 '{cc_email}' 格式不正确，将被忽略")
+                    logger.warning(f"第 {row_number} 行: 抄送邮箱 '{cc_email}' 格式不正确，将被忽略")
             
             # 使用有效的抄送邮箱重建抄送字符串
             cc_str = ",".join(valid_cc_emails)
         
         # 检查是否单独发送
         is_send_separately = False
-        if '是否单独发送' in row and row['是否单独发送'] and not pd.isna(row['是否单独发送']):
+        if row.get('是否单独发送'):
             is_send_separately = str(row['是否单独发送']).strip() == '是'
         
         # 检查邮箱对应的文件夹是否存在
         email_folder = os.path.join(target_dir, email)
-        folder_exists = os.path.isdir(email_folder)
+        if attachments is not None:
+            folder_exists = email in attachments
+        else:
+            folder_exists = os.path.isdir(email_folder)
         
-        # 检查协议号对应的Excel文件是否存在
-        excel_files = []
+        # 检查是否有文件名包含协议号的Excel
         matching_files = []
-        
         if folder_exists:
-            # 获取该文件夹下所有Excel文件
-            patterns = ["*.xls", "*.xlsx", "*.xlsm"]
-            for pat in patterns:
-                excel_files.extend(glob.glob(os.path.join(email_folder, pat)))
-            
-            # 检查是否有文件名包含协议号的Excel
-            for file_path in excel_files:
-                filename = os.path.basename(file_path)
-                if agreement_id in filename:
-                    matching_files.append(file_path)
+            matching_files = [index for filename, index in list_folder(email, email_folder)
+                              if agreement_id in filename]
         
         # 保存验证结果
         match_found = len(matching_files) > 0
-        
-        # 如果邮箱不存在于结果字典中，创建新条目
-        if email not in email_results:
-            email_results[email] = {
-                'folder_exists': folder_exists,
-                'groups': {}  # 按抄送列表分组
-            }
+        result = email_results.recipient(email, folder_exists)
         
         # 如果需要单独发送，使用协议号作为额外分组依据
-        group_key = cc_str
         if is_send_separately and match_found:
-            # 为每个文件创建单独的分组键
-            for match_file in matching_files:
-                file_group_key = f"{cc_str}_{os.path.basename(match_file)}"
-                if file_group_key not in email_results[email]['groups']:
-                    email_results[email]['groups'][file_group_key] = {
-                        'matches': [match_file],  # 单独发送时，一个分组只包含一个文件
-                        'match_found': True,
-                        'all_excels': [match_file],
-                        'row_data': row.to_dict(),
-                        'is_send_separately': True
-                    }
+            # 为每个文件创建单独的分组，一个分组只包含一个文件
+            for index in matching_files:
+                file_group_key = f"{cc_str}_{os.path.basename(email_results.files[index])}"
+                if file_group_key not in result.groups:
+                    result.groups[file_group_key] = SendGroup(cc_str, True, [index])
         else:
             # 使用抄送列表作为分组标识（不单独发送的情况）
-            if group_key not in email_results[email]['groups']:
-                email_results[email]['groups'][group_key] = {
-                    'matches': [],
-                    'match_found': False,
-                    'all_excels': [],
-                    'row_data': row.to_dict(),
-                    'is_send_separately': False
-                }
-            
+            if cc_str not in result.groups:
+                result.groups[cc_str] = SendGroup(cc_str)
             # 保存此条协议的匹配结果
-            if match_found:
-                email_results[email]['groups'][group_key]['match_found'] = True
-                email_results[email]['groups'][group_key]['matches'].extend(matching_files)
-            
-            # 所有Excel文件都保存，不管是否匹配
-            if folder_exists:
-                email_results[email]['groups'][group_key]['all_excels'].extend(excel_files)
+            result.groups[cc_str].add(matching_files)
         
         # 打印每个协议号的验证结果
         status = "通过" if folder_exists and match_found else "失败"
         separate_info = "（单独发送）" if is_send_separately else ""
-        print(f"验证 {email} - {agreement_id}{separate_info}: {status}")
-        if not folder_exists:
-            print(f"  - 文件夹不存在: {email_folder}")
+        if folder_exists and match_found:
+            logger.debug(f"验证 {email} - {agreement_id}{separate_info}: {status}")
+        else:
+            logger.warning(f"验证 {email} - {agreement_id}{separate_info}: {status}")
+        if not folder_exists and attachments is not None:
+            logger.warning("  - 本批次没有生成该邮箱的文件")
+        elif not folder_exists:
+            logger.warning(f"  - 文件夹不存在: {email_folder}")
         elif not match_found:
-            print(f"  - 未找到包含协议号 {agreement_id} 的Excel文件")
+            logger.warning(f"  - 未找到包含协议号 {agreement_id} 的Excel文件")
         else:
-            print(f"  - 找到匹配文件: {[os.path.basename(f) for f in matching_files]}")
+            logger.debug(f"  - 找到匹配文件: {[os.path.basename(email_results.files[i]) for i in matching_files]}")
             if valid_cc_emails and len(valid_cc_emails) > 0:
-                print(f"  - 有效抄送邮箱: {valid_cc_emails}")
+                logger.debug(f"  - 有效抄送邮箱: {valid_cc_emails}")
     
     # 打印按邮箱聚合的验证结果摘要
     for email, result in email_results.items():
-        if not result['folder_exists']:
-            print(f"\n邮箱 {email}: 文件夹不存在")
+        if not result.folder_exists:
+            logger.warning(f"\n邮箱 {email}: 文件夹不存在")
             continue
             
-        for group_key, group_data in result['groups'].items():
-            matches_count = len(group_data['matches'])
-            # 对于单独发送的邮件，分组键包含文件名
-            if group_data.get('is_send_separately', False):
-                cc_part = group_key.split('_')[0] if '_' in group_key else ''
-                cc_display = cc_part if cc_part else "无抄送"
-                print(f"\n邮箱 {email} (抄送: {cc_display}) (单独发送): 找到 {matches_count} 个匹配文件")
+        for group in result.groups.values():
+            matches_count = len(group.files)
+            cc_display = group.cc or "无抄送"
+            if group.separate:
+                logger.debug(f"\n邮箱 {email} (抄送: {cc_display}) (单独发送): 找到 {matches_count} 个匹配文件")
             else:
-                cc_display = group_key if group_key else "无抄送"
                 if matches_count > 0:
-                    print(f"\n邮箱 {email} (抄送: {cc_display}): 找到 {matches_count} 个匹配文件")
+                    logger.debug(f"\n邮箱 {email} (抄送: {cc_display}): 找到 {matches_count} 个匹配文件")
                 else:
-                    print(f"\n邮箱 {email} (抄送: {cc_display}): 未找到匹配文件")
+                    logger.warning(f"\n邮箱 {email} (抄送: {cc_display}): 未找到匹配文件")
     
     # 打印邮箱格式验证结果
     if invalid_emails_count > 0:
-        print(f"\n注意: 发现 {invalid_emails_count} 行数据包含格式不正确的邮箱地址，这些行已被跳过")
+        logger.warning(f"\n注意: 发现 {invalid_emails_count} 行数据包含格式不正确的邮箱地址，这些行已被跳过")
             
     return email_results
 
@@ -217,9 +234,9 @@ def move_sent_files(sent_files, target_dir):
     if not os.path.exists(sent_folder):
         try:
             os.makedirs(sent_folder)
-            print(f"创建文件夹: {sent_folder}")
+            logger.debug(f"创建文件夹: {sent_folder}")
         except Exception as e:
-            print(f"创建文件夹失败: {e}")
+            logger.error(f"创建文件夹失败: {e}")
             return False
     
     # 移动文件
@@ -233,24 +250,203 @@ def move_sent_files(sent_files, target_dir):
                 filename = os.path.basename(file_path)
                 destination = os.path.join(sent_folder, filename)
                 shutil.move(file_path, destination)
-                print(f"移动文件: {filename} -> {sent_folder}")
+                logger.debug(f"移动文件: {filename} -> {sent_folder}")
                 success_count += 1
             except Exception as e:
-                print(f"移动文件失败 {file_path}: {e}")
+                logger.error(f"移动文件失败 {file_path}: {e}")
                 failed_count += 1
                 failed_files.append((file_path, str(e)))
         else:
-            print(f"文件不存在，无法移动: {file_path}")
+            logger.warning(f"文件不存在，无法移动: {file_path}")
             failed_count += 1
             failed_files.append((file_path, "文件不存在"))
     
-    print(f"\n文件移动摘要: 成功 {success_count} 个，失败 {failed_count} 个")
+    logger.info(f"\n文件移动摘要: 成功 {success_count} 个，失败 {failed_count} 个")
     if failed_count > 0:
-        print("失败详情:")
+        logger.warning("失败详情:")
         for file_path, error in failed_files:
-            print(f"  - {file_path}: {error}")
+            logger.warning(f"  - {file_path}: {error}")
     return True
 
+def build_subject(all_excels):
+    """构建主题：单附件时为"附件名_白名单新增"，多附件时为"航司代码_白名单新增_N家"。"""
+    if len(all_excels) == 1:
+        # 单个附件时，使用整个附件名（去除.xlsx后缀）
+        filename = os.path.basename(all_excels[0])
+        # 移除文件扩展名
+        filename_without_ext = os.path.splitext(filename)[0]
+        return f"{filename_without_ext}_白名单新增"
+    elif len(all_excels) > 1:
+        # 多个附件时，使用航司二字码（文件名前缀，可能含数字，如 3U）
+        first_file = os.path.basename(all_excels[0])
+        m = re.match(r'^([A-Z][A-Z0-9]|[0-9][A-Z])', first_file)
+        code = m.group(1) if m else ''
+        return f"{code}_白名单新增_{len(all_excels)}家"
+    return "白名单新增_0家"
+
+
+def file_prefixes(all_excels):
+    """附件文件名的航司二字码前缀列表，无法识别时为 None"""
+    prefixes = []
+    for file_path in all_excels:
+        fname = os.path.basename(file_path)
+        m = re.match(r'^([A-Z][A-Z0-9]|[0-9][A-Z])', fname)
+        prefixes.append(m.group(1) if m else None)
+    return prefixes
+
+
+def build_email_message(sender, recipient, cc_str, all_excels):
+    """
+    构造一个邮件分组对应的邮件
+    
+    Returns:
+        (邮件, 抄送列表, 主题)
+    """
+    # 获取抄送列表
+    cc_list = split_cc(cc_str)
+    
+    # 生成邮件正文：根据用户模板将附件名称列出
+    attachment_names = [os.path.basename(p) for p in all_excels]
+    body_lines = []
+    body_lines.append("经理，您好")
+    body_lines.append("")
+    body_lines.append("附件为本期白名单新增，烦请录入，谢谢！")
+    # 列出所有附件文件名
+    for name in attachment_names:
+        body_lines.append(name)
+    body_lines.append("")
+    body_lines.append("祝好。")
+    body_lines.append("")
+    body_lines.append("姓名/Name：请替换为你的姓名")
+    body_lines.append("部门/Dept：请替换为你的部门")
+    body_lines.append("电话/Tel：请替换为你的电话")
+    body_lines.append("邮箱/Email：请替换为你的邮箱")
+    body_lines.append("官网/Web：请替换为你的官网")
+    body_lines.append("地址/Add：请替换为你的地址")
+    custom_body = "\n".join(body_lines)
+    
+    # 构造 HTML 邮件正文，设置字体 '微软雅黑'，字号 14px
+    html_lines = [f"<p style='font-family:Microsoft YaHei; font-size:14px; margin:0 0 10px 0;'>{line if line else '&nbsp;'}</p>" for line in body_lines]
+    html_body = f"<html><body>{''.join(html_lines)}</body></html>"
+    
+    subject = build_subject(all_excels)
+    
+    # 构造邮件
+    msg = EmailMessage()
+    msg["From"] = sanitize_header(sender)
+    msg["To"] = sanitize_header(recipient)
+    msg["Subject"] = sanitize_header(subject)
+    msg["Message-ID"] = make_msgid()
+    if cc_list:
+        msg["Cc"] = sanitize_header(", ".join(cc_list))
+    # 设置邮件正文：纯文本和 HTML 两个版本
+    msg.set_content(custom_body)
+    msg.add_alternative(html_body, subtype='html')
+    
+    # 添加附件
+    for file_path in all_excels:
+        try:
+            with open_attachment(file_path) as f:
+                data = f.read()
+            filename = os.path.basename(file_path)
+            msg.add_attachment(data, maintype="application", subtype="octet-stream",
+                               filename=filename)
+            metrics.incr('bytes_attached', len(data))
+            logger.debug(f"  - 添加附件: {filename}")
+        except Exception as e:
+            logger.error(f"  添加附件 {file_path} 失败: {e}")
+    return msg, cc_list, subject
+
+
+def sendable_groups(validation_results):
+    """
+    列出可以发送的 (收件人, SendGroup, 附件路径列表)，同时返回跳过的分组数
+    文件夹不存在或未找到匹配附件的分组会被跳过
+    """
+    groups = []
+    skipped = 0
+    for recipient, result in validation_results.items():
+        if not result.folder_exists:
+            logger.warning(f"跳过 {recipient}: 文件夹不存在")
+            skipped += 1
+            continue
+        
+        # 处理每个抄送分组
+        for group in result.groups.values():
+            if not group.match_found:
+                cc_display = group.cc or "无抄送"
+                logger.warning(f"跳过 {recipient} (抄送: {cc_display}): 未找到匹配的附件")
+                skipped += 1
+                continue
+            groups.append((recipient, group, validation_results.paths(group)))
+    return groups, skipped
+
+
+def send_group(server, sender, recipient, group, all_excels, test_mode=False, delivery_store=None):
+    """
+    构造并发送一个分组的邮件，测试模式下只打印
+    
+    Returns:
+        是否发送成功
+    """
+    msg, cc_list, subject = build_email_message(sender, recipient, group.cc, all_excels)
+    
+    # 发送邮件
+    to_addrs = [recipient] + cc_list
+    # 显示用的抄送信息
+    cc_display = group.cc or "无抄送"
+    separate_info = "（单独发送）" if group.separate else ""
+        
+    if test_mode:
+        logger.debug(f"测试模式: 将发送邮件给 {recipient} (抄送: {cc_display}){separate_info}")
+        logger.debug(f"  附件数量: {len(all_excels)}")
+        logger.debug(f"  附件列表: {[os.path.basename(f) for f in all_excels]}")
+        logger.debug(f"  邮件主题: {subject}")
+        return True
+    try:
+        with metrics.timer('send_message'):
+            refused = server.send_message(msg, from_addr=sender, to_addrs=to_addrs)
+        # 打印实际发送的附件列表
+        logger.debug("发送成功:")
+        logger.debug(f"  - 收件人: {recipient}")
+        logger.debug(f"  - 抄送: {cc_list}")
+        # 部分收件人被服务器拒绝时逐个列出
+        for refused_addr, (code, resp) in refused.items():
+            reason = resp.decode('utf-8', 'replace') if isinstance(resp, bytes) else resp
+            logger.warning(f"  - {recipient} 的邮件中被拒绝的收件人: {refused_addr} ({code} {reason})")
+        logger.debug(f"  - 主题: {subject}")
+        logger.debug(f"  - 附件: {[os.path.basename(p) for p in all_excels]}{separate_info}")
+        metrics.incr('messages_sent')
+    except Exception as e:
+        logger.error(f"发送失败 {recipient} (抄送: {cc_display}){separate_info}: {e}")
+        metrics.incr('messages_failed')
+        return False
+    # 邮件已被服务器接受：写入发送记录失败不能算作发送失败，否则下次运行会重复发送
+    if delivery_store is not None:
+        try:
+            delivery_store.record_delivery(recipient, cc_list, [(p, attachment_content(p)) for p in all_excels],
+                                           message_id=msg["Message-ID"])
+        except Exception as e:
+            logger.error(f"发送成功但写入发送记录失败 {recipient} (抄送: {cc_display}){separate_info}: {e}")
+            metrics.incr('delivery_records_failed')
+    return True
+
+
+def open_smtp(smtp_host, smtp_port, sender, password, use_pipelining=True, use_tls=True):
+    """连接并登录 SMTP 服务器，认证失败时抛出 smtplib.SMTPAuthenticationError"""
+    server = PipeliningSMTP(smtp_host, smtp_port, use_pipelining=use_pipelining)
+    try:
+        server.ehlo()
+        if use_tls:
+            server.starttls()
+            server.ehlo()
+        server.login(sender, password)
+    except Exception:
+        server.close()
+        raise
+    return server
+
+
 #发送延时
 def send_customized_emails(smtp_host: str,
                            smtp_port: int,
@@ -259,7 +455,12 @@ def send_customized_emails(smtp_host: str,
                            validation_results: dict,
                            target_dir: str,
                            test_mode=False,
-                           delay_seconds=1):
+                           delay_seconds=1,
+                           use_pipelining=True,
+                           use_tls=True,
+                           delivery_store=None,
+                           move_sent=True,
+                           archive_sent=False):
     """
     根据验证结果发送定制化的邮件
     Send customized emails based on validation results
@@ -273,184 +474,203 @@ def send_customized_emails(smtp_host: str,
         target_dir: 目标目录
         test_mode: 是否为测试模式
         delay_seconds: 每封邮件发送后的延迟秒数
+        use_pipelining: 服务器支持时是否使用 PIPELINING/CHUNKING 批量发送信封命令
+        use_tls: 是否使用 STARTTLS（连接本地测试服务器时关闭）
+        delivery_store: 发送记录，成功发送的附件会写入其中
+        move_sent: 是否将已发送的文件夹移动到"已批量发送"目录
+        archive_sent: 附件为内存附件时，发送成功后是否写入 target/邮箱/ 目录
+    
+    Returns:
+        SendReport；连接或认证失败时没有发送的邮件计为失败
     """
     if not validation_results:
-        print("没有有效的验证结果，无法发送邮件")
-        return
+        logger.warning("没有有效的验证结果，无法发送邮件")
+        return SendReport()
     
+    # 跟踪成功和失败的邮件；跳过的分组（文件夹不存在或本批次没有附件）不算发送失败
+    groups, skipped = sendable_groups(validation_results)
+    report = SendReport(skipped=skipped)
     # 跟踪已成功发送的文件夹
     sent_folders = set()
+    attempted = 0
     
     try:
-        with smtplib.SMTP(smtp_host, smtp_port) as server:
-            server.ehlo()
-            server.starttls()
-            server.ehlo()
-            
-            try:
-                server.login(sender, password)
-            except smtplib.SMTPAuthenticationError:
-                print(f"SMTP认证失败，请检查邮箱 {sender} 和密码是否正确")
-                return
-            
-            # 跟踪成功和失败的邮件
-            success_count = 0
-            failed_count = 0
-            email_count = 0
+        try:
+            server = open_smtp(smtp_host, smtp_port, sender, password, use_pipelining, use_tls)
+        except smtplib.SMTPAuthenticationError:
+            logger.error(f"SMTP认证失败，请检查邮箱 {sender} 和密码是否正确")
+            report.failed += len(groups)
+            return report
+        with server:
+            logger.info(f"SMTP发送方式: {server.transport_mode()}")
             
-            for recipient, result in validation_results.items():
-                if not result['folder_exists']:
-                    print(f"跳过 {recipient}: 文件夹不存在")
-                    failed_count += 1
-                    continue
+            for email_count, (recipient, group, all_excels) in enumerate(groups):
+                # 如果不是第一封邮件，添加延迟
+                if email_count > 0 and not test_mode:
+                    logger.debug(f"延迟 {delay_seconds} 秒后继续发送...")
+                    time.sleep(delay_seconds)
                 
-                # 处理每个抄送分组
-                for group_key, group_data in result['groups'].items():
-                    if not group_data['match_found']:
-                        # 为单独发送的邮件提取抄送信息
-                        if group_data.get('is_send_separately', False):
-                            cc_part = group_key.split('_')[0] if '_' in group_key else ''
-                            cc_display = cc_part if cc_part else "无抄送"
-                        else:
-                            cc_display = group_key if group_key else "无抄送"
-                        print(f"跳过 {recipient} (抄送: {cc_display}): 未找到匹配的附件")
-                        failed_count += 1
-                        continue
-                    
-                    # 如果不是第一封邮件，添加延迟
-                    if email_count > 0 and not test_mode:
-                        print(f"延迟 {delay_seconds} 秒后继续发送...")
-                        time.sleep(delay_seconds)
-                    
-                    email_count += 1
-                    
-                    # 获取邮件内容
-                    row_data = group_data['row_data']
-                    
-                    # 获取抄送列表
-                    cc_list = []
-                    
-                    # 对于单独发送的邮件，从分组键提取抄送信息
-                    if group_data.get('is_send_separately', False):
-                        cc_part = group_key.split('_')[0] if '_' in group_key else ''
-                        if cc_part:
-                            # 支持多个抄送邮箱，用逗号、分号或换行分隔
-                            # 使用正则分割：逗号, 分号; 换行 \r 或 \n
-                            cc_list = [email.strip() for email in re.split(r'[,;\r\n]+', cc_part) if email.strip()]
-                    else:
-                        if group_key:  # group_key 就是 cc_str
-                            # 支持多个抄送邮箱，用逗号、分号或换行分隔
-                            # 使用正则分割：逗号, 分号; 换行 \r 或 \n
-                            cc_list = [email.strip() for email in re.split(r'[,;\r\n]+', group_key) if email.strip()]
-                    
-                    # 获取所有Excel文件并准备邮件主题+正文
-                    all_excels = group_data['matches']
-                    # 生成邮件正文：根据用户模板将附件名称列出
-                    attachment_names = [os.path.basename(p) for p in all_excels]
-                    body_lines = []
-                    body_lines.append("经理，您好")
-                    body_lines.append("")
-                    body_lines.append("附件为本期白名单新增，烦请录入，谢谢！")
-                    # 列出所有附件文件名
-                    for name in attachment_names:
-                        body_lines.append(name)
-                    body_lines.append("")
-                    body_lines.append("祝好。")
-                    body_lines.append("")
-                    body_lines.append("姓名/Name：请替换为你的姓名")
-                    body_lines.append("部门/Dept：请替换为你的部门")
-                    body_lines.append("电话/Tel：请替换为你的电话")
-                    body_lines.append("邮箱/Email：请替换为你的邮箱")
-                    body_lines.append("官网/Web：请替换为你的官网")
-                    body_lines.append("地址/Add：请替换为你的地址")
-                    custom_body = "\n".join(body_lines)
-                    
-                    # 构造 HTML 邮件正文，设置字体 '微软雅黑'，字号 14px
-                    html_lines = [f"<p style='font-family:Microsoft YaHei; font-size:14px; margin:0 0 10px 0;'>{line if line else '&nbsp;'}</p>" for line in body_lines]
-                    html_body = f"<html><body>{''.join(html_lines)}</body></html>"
-                    
-                    # 构建主题：单附件时使用"附件名_白名单新增"，多附件时使用原有逻辑
-                    if len(all_excels) == 1:
-                        # 单个附件时，使用整个附件名（去除.xlsx后缀）
-                        filename = os.path.basename(all_excels[0])
-                        # 移除文件扩展名
-                        filename_without_ext = os.path.splitext(filename)[0]
-                        subject = f"{filename_without_ext}_白名单新增"
-                    elif len(all_excels) > 1:
-                        # 多个附件时，使用原有逻辑
-                        first_file = os.path.basename(all_excels[0])
-                        m = re.match(r'^([A-Z]{2})', first_file)
-                        code = m.group(1) if m else ''
-                        subject = f"{code}_白名单新增_{len(all_excels)}家"
-                    else:
-                        subject = "白名单新增_0家"
-                    
-                    # 构造邮件
-                    msg = EmailMessage()
-                    msg["From"] = sanitize_header(sender)
-                    msg["To"] = sanitize_header(recipient)
-                    msg["Subject"] = sanitize_header(subject)
-                    if cc_list:
-                        msg["Cc"] = sanitize_header(", ".join(cc_list))
-                    # 设置邮件正文：纯文本和 HTML 两个版本
-                    msg.set_content(custom_body)
-                    msg.add_alternative(html_body, subtype='html')
-                    
-                    # 添加附件（已经在上面获取了文件列表）
-                    for file_path in all_excels:
-                        try:
-                            with open(file_path, "rb") as f:
-                                data = f.read()
-                            filename = os.path.basename(file_path)
-                            msg.add_attachment(data, maintype="application", subtype="octet-stream",
-                                               filename=filename)
-                            print(f"  - 添加附件: {filename}")
-                        except Exception as e:
-                            print(f"  添加附件 {file_path} 失败: {e}")
-                    
-                    # 发送邮件
-                    to_addrs = [recipient] + cc_list
-                    # 显示用的抄送信息
-                    if group_data.get('is_send_separately', False):
-                        cc_part = group_key.split('_')[0] if '_' in group_key else ''
-                        cc_display = cc_part if cc_part else "无抄送"
-                        separate_info = "（单独发送）"
-                    else:
-                        cc_display = group_key if group_key else "无抄送"
-                        separate_info = ""
-                        
-                    if test_mode:
-                        print(f"测试模式: 将发送邮件给 {recipient} (抄送: {cc_display}){separate_info}")
-                        print(f"  附件数量: {len(all_excels)}")
-                        print(f"  附件列表: {[os.path.basename(f) for f in all_excels]}")
-                        print(f"  邮件主题: {subject}")
-                        success_count += 1
-                        continue
-                    try:
-                        server.send_message(msg, from_addr=sender, to_addrs=to_addrs)
-                        # 打印实际发送的附件列表
-                        print(f"发送成功:")
-                        print(f"  - 收件人: {recipient}")
-                        print(f"  - 抄送: {cc_list}")
-                        print(f"  - 主题: {subject}")
-                        print(f"  - 附件: {[os.path.basename(p) for p in all_excels]}{separate_info}")
-                        success_count += 1
-                        
+                attempted += 1
+                if send_group(server, sender, recipient, group, all_excels, test_mode, delivery_store):
+                    report.sent += 1
+                    if not test_mode:
+                        report.delivered.extend(all_excels)
                         # 将已成功发送的文件夹添加到集合
-                        folder_path = os.path.dirname(all_excels[0])
-                        sent_folders.add(folder_path)
-                    except Exception as e:
-                        print(f"发送失败 {recipient} (抄送: {cc_display}){separate_info}: {e}")
-                        failed_count += 1
+                        folder = archive_sent_files(all_excels, archive_sent)
+                        if folder:
+                            sent_folders.add(folder)
+                else:
+                    report.failed += 1
             
-            print(f"\n邮件发送摘要: 成功 {success_count} 封，失败 {failed_count} 封")
+            logger.info(f"\n邮件发送摘要: {report.summary()}")
     except Exception as e:
-        print(f"连接SMTP服务器 {smtp_host}:{smtp_port} 失败: {e}")
+        logger.error(f"连接SMTP服务器 {smtp_host}:{smtp_port} 失败: {e}")
+        report.failed += len(groups) - attempted
     
     # 移动已成功发送的文件夹
-    if sent_folders and not test_mode:
-        print("\n开始移动已成功发送的文件夹...")
-        move_sent_folders(sent_folders, target_dir)
+    if sent_folders and not test_mode and move_sent:
+        logger.info("\n开始移动已成功发送的文件夹...")
+        with metrics.timer('move_sent_folders'):
+            move_sent_folders(sent_folders, target_dir)
+    return report
+
+
+def send_scheduled_emails(smtp_host: str,
+                          smtp_port: int,
+                          sender: str,
+                          password: str,
+                          validation_results: dict,
+                          target_dir: str,
+                          domain_limits: DomainLimits,
+                          test_mode=False,
+                          use_pipelining=True,
+                          use_tls=True,
+                          delivery_store=None,
+                          move_sent=True,
+                          archive_sent=False):
+    """
+    按收件域名调度发送邮件
+    Send emails with per-domain concurrency and rate limits instead of a global delay
+    
+    邮件按收件人域名分桶，各域名之间轮转发送；每个工作线程使用自己的 SMTP 连接。
+    限制严格的域名只推迟自己的邮件，总耗时取决于最慢的域名而不是所有延迟之和。
+    参数和返回值与 send_customized_emails 相同，domain_limits 取代 delay_seconds。
+    """
+    if not validation_results:
+        logger.warning("没有有效的验证结果，无法发送邮件")
+        return SendReport()
+    
+    groups, skipped = sendable_groups(validation_results)
+    scheduler = DomainScheduler(groups, domain_limits, lambda job: recipient_domain(job[0]),
+                                throttle=not test_mode)
+    for domain in scheduler.domains():
+        limit = domain_limits.for_domain(domain)
+        logger.info(f"域名 {domain}: 并发 {limit.concurrency}，间隔 {limit.interval:g} 秒")
+    logger.info(f"按域名调度发送: {len(groups)} 封，{len(scheduler.domains())} 个域名，"
+                f"{scheduler.worker_count()} 个连接")
+    return send_from_scheduler(scheduler, smtp_host, smtp_port, sender, password, target_dir, test_mode,
+                               use_pipelining=use_pipelining, use_tls=use_tls, delivery_store=delivery_store,
+                               move_sent=move_sent, archive_sent=archive_sent, skipped=skipped)
+
+
+def send_from_scheduler(scheduler, smtp_host, smtp_port, sender, password, target_dir, test_mode=False,
+                        use_pipelining=True, use_tls=True, delivery_store=None, move_sent=True,
+                        archive_sent=False, skipped=0, workers=None):
+    """
+    用 DomainScheduler 的工作线程发送其中的 (收件人, SendGroup, 附件路径列表) 任务，参数见 send_scheduled_emails
+    任务可以在发送过程中陆续加入（边生成边发送），调用方 close() 之后发送完剩余任务才返回
+    skipped: 调度之前已经跳过的分组数，计入摘要
+    workers: 工作线程数，默认按调度器中的任务计算
+
+    Returns:
+        SendReport；连接或认证失败时队列中剩余的邮件计为失败
+    """
+    lock = threading.Lock()
+    sent_folders = set()
+    per_domain = Counter()
+    report = SendReport(skipped=skipped)
+    
+    def connect():
+        if test_mode:
+            return None
+        server = open_smtp(smtp_host, smtp_port, sender, password, use_pipelining, use_tls)
+        logger.debug(f"{threading.current_thread().name} SMTP发送方式: {server.transport_mode()}")
+        return server
+    
+    def disconnect(server):
+        if server is not None:
+            try:
+                server.quit()
+            except smtplib.SMTPException:
+                server.close()
+    
+    def handle(server, domain, job):
+        recipient, group, all_excels = job
+        ok = send_group(server, sender, recipient, group, all_excels, test_mode, delivery_store)
+        folder = archive_sent_files(all_excels, archive_sent) if ok and not test_mode else None
+        with lock:
+            if ok:
+                report.sent += 1
+                per_domain[domain] += 1
+                if not test_mode:
+                    report.delivered.extend(all_excels)
+                if folder:
+                    sent_folders.add(folder)
+            else:
+                report.failed += 1
+    
+    try:
+        scheduler.run(handle, setup=connect, teardown=disconnect, workers=workers)
+    except smtplib.SMTPAuthenticationError:
+        logger.error(f"SMTP认证失败，请检查邮箱 {sender} 和密码是否正确")
+    except Exception as e:
+        logger.error(f"连接SMTP服务器 {smtp_host}:{smtp_port} 失败: {e}")
+    report.failed += len(scheduler.pending())
+    
+    for domain in scheduler.domains():
+        logger.debug(f"  - {domain}: 成功 {per_domain[domain]} 封")
+    logger.info(f"\n邮件发送摘要: {report.summary()}")
+    
+    # 移动已成功发送的文件夹
+    if sent_folders and not test_mode and move_sent:
+        logger.info("\n开始移动已成功发送的文件夹...")
+        with metrics.timer('move_sent_folders'):
+            move_sent_folders(sent_folders, target_dir)
+    return report
+
+def commit_history(report, history_db):
+    """
+    把发送成功的附件中的旅客记入历史白名单
+    2MU.py 生成文件时按文件名暂存每个文件实际写入的旅客，这里只提交已经发出的文件；
+    数据库不存在（没有经过 2MU.py 生成）时跳过
+    """
+    if not report.delivered or not history_db or not os.path.exists(history_db):
+        return 0
+    with metrics.timer('commit_history'), WhitelistIndex(history_db) as whitelist_index:
+        recorded = whitelist_index.commit(os.path.basename(path) for path in report.delivered)
+    logger.info(f"已记入历史白名单 {recorded} 条")
+    return recorded
+
+def archive_sent_files(all_excels, archive_sent=False):
+    """
+    一封邮件发送成功后，返回附件所在的邮箱文件夹，用于之后移动到"已批量发送"
+    内存附件在 archive_sent 为 True 时先写入归档路径（target/邮箱/文件名），未归档时返回 None
+    """
+    if not isinstance(all_excels[0], InMemoryFile):
+        return os.path.dirname(all_excels[0])
+    if not archive_sent:
+        return None
+    try:
+        with metrics.timer('archive_attachments'):
+            for file in all_excels:
+                file.save()
+    except OSError as e:
+        logger.error(f"归档附件失败 {os.path.dirname(all_excels[0])}: {e}")
+        return None
+    metrics.incr('files_archived', len(all_excels))
+    logger.debug(f"  - 已归档: {[os.path.basename(p) for p in all_excels]}")
+    return os.path.dirname(all_excels[0])
+
 
 def move_sent_folders(folders, target_dir):
     """
@@ -464,9 +684,9 @@ def move_sent_folders(folders, target_dir):
     if not os.path.exists(sent_folder):
         try:
             os.makedirs(sent_folder)
-            print(f"创建文件夹: {sent_folder}")
+            logger.debug(f"创建文件夹: {sent_folder}")
         except Exception as e:
-            print(f"创建文件夹失败: {e}")
+            logger.error(f"创建文件夹失败: {e}")
             return False
     
     # 移动文件夹
@@ -480,185 +700,235 @@ def move_sent_folders(folders, target_dir):
                 folder_name = os.path.basename(folder_path)
                 destination = os.path.join(sent_folder, folder_name)
                 
-                # 如果目标文件夹已存在，先删除
+                # 如果目标文件夹已存在，将文件合并进去，保留以前的发送历史
                 if os.path.exists(destination):
-                    shutil.rmtree(destination)
-                
-                # 移动文件夹
-                shutil.move(folder_path, destination)
-                print(f"移动文件夹: {folder_name} -> {sent_folder}")
+                    for name in os.listdir(folder_path):
+                        shutil.move(os.path.join(folder_path, name), os.path.join(destination, name))
+                    os.rmdir(folder_path)
+                else:
+                    # 移动文件夹
+                    shutil.move(folder_path, destination)
+                logger.debug(f"移动文件夹: {folder_name} -> {sent_folder}")
                 success_count += 1
+                metrics.incr('folders_moved')
             except Exception as e:
-                print(f"移动文件夹失败 {folder_path}: {e}")
+                logger.error(f"移动文件夹失败 {folder_path}: {e}")
                 failed_count += 1
                 failed_folders.append((folder_path, str(e)))
         else:
-            print(f"文件夹不存在，无法移动: {folder_path}")
+            logger.warning(f"文件夹不存在，无法移动: {folder_path}")
             failed_count += 1
             failed_folders.append((folder_path, "文件夹不存在"))
     
-    print(f"\n文件夹移动摘要: 成功 {success_count} 个，失败 {failed_count} 个")
+    logger.info(f"\n文件夹移动摘要: 成功 {success_count} 个，失败 {failed_count} 个")
     if failed_count > 0:
-        print("失败详情:")
+        logger.warning("失败详情:")
         for folder_path, error in failed_folders:
-            print(f"  - {folder_path}: {error}")
+            logger.warning(f"  - {folder_path}: {error}")
     return True
 
 #发送延时
-def main(test_mode=False, delay_seconds=1):
-    """主函数，处理参数并执行邮件验证和发送"""
-    # 配置参数 - 请替换为你实际的SMTP配置
-    smtp_host = "请替换为你的SMTP服务器地址"
-    smtp_port = 587  # 请替换为你的SMTP端口，一般为587或25
-    sender = "请替换为你的发件人邮箱"
-    password = "请替换为你的邮箱密码"  # 请替换为你的邮箱密码或应用专用密码
-    
-    # 定义路径 - 请替换为你实际的路径
-    test_excel_path = r"请替换为你实际的路径\邮件批量发送\MU批量发送列表.xlsx"
-    target_dir = r"请替换为你实际的路径\target"
-    
-    # 验证邮箱和协议号的匹配
-    print("开始验证邮箱和协议号的匹配...")
-    validation_results = verify_email_agreement_match(test_excel_path, target_dir)
-    
-    # 如果没有验证结果，则退出
-    if not validation_results:
-        print("验证失败，无法继续发送邮件")
-        return
+def main(test_mode=False, delay_seconds=1, use_pipelining=True, move_sent=False, delivery_db=None,
+         consolidate=False, max_attachments=None, max_attachment_bytes=None, domain_config=None,
+         preflight=False, preflight_report_path=None,
+         # 配置参数 - 请替换为你实际的SMTP配置
+         smtp_host="请替换为你的SMTP服务器地址",
+         smtp_port=587,  # 请替换为你的SMTP端口，一般为587或25
+         sender="请替换为你的发件人邮箱",
+         password="请替换为你的邮箱密码",  # 请替换为你的邮箱密码或应用专用密码
+         use_tls=True,
+         # 定义路径 - 请替换为你实际的路径
+         test_excel_path=r"请替换为你实际的路径\邮件批量发送\MU批量发送列表.xlsx",
+         target_dir=r"请替换为你实际的路径\target",
+         verify_only=False,
+         assume_yes=False,
+         attachments=None,
+         archive_sent=False,
+         history_db=r"请替换为你实际的路径\output\白名单历史.sqlite3"):
+    """
+    主函数，处理参数并执行邮件验证和发送
+    preflight 为 True 时只检查将要发送的附件并输出报告，不发送邮件；检查未通过时返回 False
+    verify_only 为 True 时只验证并预览，不询问也不发送；assume_yes 为 True 时跳过发送前的确认
+    attachments: 内存中的附件 {邮箱: [InMemoryFile]}，提供时不读取 target 目录中的文件；
+    archive_sent 为 True 时发送成功的附件写入 target/邮箱/ 目录
+    history_db: 历史白名单数据库，发送成功的附件中的旅客记入其中（见 commit_history）
+
+    Returns:
+        发送时为 SendReport，预检时为是否通过，其它情况为 None
+    """
+    # 发送记录，默认保存在 target 根目录
+    delivery_store = None
+    if attachments is not None or os.path.isdir(target_dir):
+        delivery_store = DeliveryStore(delivery_db or default_db_path(target_dir))
     
-    # 打印验证结果摘要
-    total_emails = len(validation_results)
-    total_groups = sum(len(result['groups']) for result in validation_results.values())
-    passed_groups = sum(sum(1 for group_data in result['groups'].values() if group_data['match_found']) 
-                        for result in validation_results.values())
+    try:
+        # 验证邮箱和协议号的匹配
+        logger.info("开始验证邮箱和协议号的匹配...")
+        with metrics.timer('verify_email_agreement_match'):
+            validation_results = verify_email_agreement_match(test_excel_path, target_dir, delivery_store, attachments)
     
-    print(f"\n验证结果摘要: 共 {total_emails} 个邮箱, {total_groups} 个邮件组合, 通过 {passed_groups} 个，失败 {total_groups - passed_groups} 个")
+        # 如果没有验证结果，则退出
+        if not validation_results:
+            logger.warning("验证失败，无法继续发送邮件")
+            return
     
-    if passed_groups == 0:
-        print("没有通过验证的邮箱-协议号组合，无法发送邮件")
-        return
+        # 合并抄送集合相同的分组，减少邮件数量
+        if consolidate:
+            validation_results, before_count, after_count = plan_consolidation(
+                validation_results, max_attachments, max_attachment_bytes)
+            logger.info(f"邮件合并: 合并前 {before_count} 封，合并后 {after_count} 封")
     
-    # ---- 预览邮件发送信息 ----
-    print("\n---- 预览邮件发送信息 ----")
-    for recipient, result in validation_results.items():
-        if not result['folder_exists']:
-            continue
-            
-        for group_key, group_data in result['groups'].items():
-            if not group_data['match_found']:
+        # 打印验证结果摘要
+        total_emails = len(validation_results)
+        total_groups = sum(len(result.groups) for result in validation_results.recipients.values())
+        passed_groups = sum(sum(1 for group in result.groups.values() if group.match_found)
+                            for result in validation_results.recipients.values())
+    
+        logger.info(f"\n验证结果摘要: 共 {total_emails} 个邮箱, {total_groups} 个邮件组合, 通过 {passed_groups} 个，失败 {total_groups - passed_groups} 个")
+    
+        if passed_groups == 0:
+            logger.warning("没有通过验证的邮箱-协议号组合，无法发送邮件")
+            return
+    
+        # 预检模式：检查所有将要发送的附件后退出
+        if preflight:
+            groups, _ = sendable_groups(validation_results)
+            attachments = [path for _, _, all_excels in groups for path in all_excels]
+            started = time.perf_counter()
+            results = run_preflight(attachments)
+            passed = preflight_report(results, time.perf_counter() - started)
+            if preflight_report_path:
+                write_report(results, preflight_report_path)
+            return passed
+    
+        # ---- 预览邮件发送信息 ----
+        logger.info("\n---- 预览邮件发送信息 ----")
+        for recipient, result in validation_results.items():
+            if not result.folder_exists:
                 continue
-                
-            # 获取抄送列表
-            cc_list = []
             
-            # 对于单独发送的邮件，从分组键提取抄送信息
-            if group_data.get('is_send_separately', False):
-                cc_part = group_key.split('_')[0] if '_' in group_key else ''
-                if cc_part:
-                    cc_list = [e.strip() for e in re.split(r'[,;\r\n]+', cc_part) if e.strip()]
-                separate_info = "（单独发送）"
-            else:
-                if group_key:  # group_key 就是 cc_str
-                    cc_list = [e.strip() for e in re.split(r'[,;\r\n]+', group_key) if e.strip()]
-                separate_info = ""
+            for group in result.groups.values():
+                if not group.match_found:
+                    continue
                 
-            # 获取附件列表
-            all_excels = group_data['matches']
+                # 获取抄送列表
+                cc_display = group.cc or "无抄送"
+                cc_list = split_cc(group.cc)
+                separate_info = "（单独发送）" if group.separate else ""
+                
+                # 获取附件列表
+                all_excels = validation_results.paths(group)
             
-            # 生成正文预览所需附件名列表
-            attachment_names = [os.path.basename(p) for p in all_excels]
+                # 生成正文预览所需附件名列表
+                attachment_names = [os.path.basename(p) for p in all_excels]
             
-            # 检测 Excel 文件名前缀是否一致
-            prefixes = []
-            for file_path in all_excels:
-                fname = os.path.basename(file_path)
-                m = re.match(r'^([A-Z]{2})', fname)
-                prefixes.append(m.group(1) if m else None)
-                
-            if len(prefixes) > 0:
-                unique_prefixes = set(prefixes)
-                if None in unique_prefixes or len(unique_prefixes) > 1:
-                    # 对于单独发送的邮件，从分组键提取抄送信息
-                    if group_data.get('is_send_separately', False):
-                        cc_part = group_key.split('_')[0] if '_' in group_key else ''
-                        cc_display = cc_part if cc_part else "无抄送"
-                    else:
-                        cc_display = group_key if group_key else "无抄送"
-                    print(f"错误: 邮箱 {recipient} (抄送: {cc_display}){separate_info} 的 Excel 文件名前缀不一致: {prefixes}")
-                    return
+                # 检测 Excel 文件名前缀是否一致
+                prefixes = file_prefixes(all_excels)
+                if len(prefixes) > 0:
+                    unique_prefixes = set(prefixes)
+                    if None in unique_prefixes or len(unique_prefixes) > 1:
+                        logger.error(f"错误: 邮箱 {recipient} (抄送: {cc_display}){separate_info} 的 Excel 文件名前缀不一致: {prefixes}")
+                        return
                     
-            # 构建主题
-            if len(all_excels) == 1:
-                # 单个附件时，使用整个附件名（去除.xlsx后缀）
-                filename = os.path.basename(all_excels[0])
-                # 移除文件扩展名
-                filename_without_ext = os.path.splitext(filename)[0]
-                subject = f"{filename_without_ext}_白名单新增"
-            elif len(all_excels) > 1:
-                # 多个附件时，使用原有逻辑
-                first_file = os.path.basename(all_excels[0])
-                m = re.match(r'^([A-Z]{2})', first_file)
-                code = m.group(1) if m else ''
-                subject = f"{code}_白名单新增_{len(all_excels)}家"
-            else:
-                subject = "白名单新增_0家"
-                
-            # 打印预览信息
-            # 对于单独发送的邮件，从分组键提取抄送信息
-            if group_data.get('is_send_separately', False):
-                cc_part = group_key.split('_')[0] if '_' in group_key else ''
-                cc_display = cc_part if cc_part else "无抄送"
-            else:
-                cc_display = group_key if group_key else "无抄送"
+                # 构建主题
+                subject = build_subject(all_excels)
                 
-            print(f"\n收件人: {recipient} (抄送: {cc_display}){separate_info}")
-            print(f"抄送: {cc_list}")
-            print(f"主题: {subject}")
-            print(f"附件数量: {len(all_excels)}，文件: {attachment_names}")
+                # 打印预览信息
+                logger.info(f"\n收件人: {recipient} (抄送: {cc_display}){separate_info}")
+                logger.info(f"抄送: {cc_list}")
+                logger.info(f"主题: {subject}")
+                logger.info(f"附件数量: {len(all_excels)}，文件: {attachment_names}")
             
-            # 生成正文预览
-            preview_lines = []
-            preview_lines.append("经理，您好")
-            preview_lines.append("")
-            preview_lines.append("附件为本期白名单新增，烦请录入，谢谢！")
-            for name in attachment_names:
-                preview_lines.append(name)
-            preview_lines.append("")
-            preview_lines.append("祝好。")
-            preview_lines.append("")
-            preview_lines.append("姓名/Name：请替换为你的姓名")
-            preview_lines.append("部门/Dept：请替换为你的部门")
-            preview_lines.append("电话/Tel：请替换为你的电话")
-            preview_lines.append("邮箱/Email：请替换为你的邮箱")
-            preview_lines.append("官网/Web：请替换为你的官网")
-            preview_lines.append("地址/Add：请替换为你的地址")
-            preview_body = "\n".join(preview_lines)
-            print("正文预览:\n" + preview_body)
-            print("----------------------------------------")
-    print("---- 预览结束 ----\n")
-    
-    # 确认是否继续发送邮件
-    proceed = input("是否继续发送邮件？(y/n): ").strip().lower()
-    if proceed != 'y':
-        print("操作已取消")
-        return
-    
-    # 打印发送间隔信息
-    if not test_mode:
-        print(f"\n已设置每封邮件发送间隔为 {delay_seconds} 秒")
-    
-    # 发送邮件，传入目标目录
-    print("开始发送邮件...")
-    send_customized_emails(smtp_host, smtp_port, sender, password, validation_results, target_dir, test_mode, delay_seconds)
+                # 生成正文预览
+                preview_lines = []
+                preview_lines.append("经理，您好")
+                preview_lines.append("")
+                preview_lines.append("附件为本期白名单新增，烦请录入，谢谢！")
+                for name in attachment_names:
+                    preview_lines.append(name)
+                preview_lines.append("")
+                preview_lines.append("祝好。")
+                preview_lines.append("")
+                preview_lines.append("姓名/Name：请替换为你的姓名")
+                preview_lines.append("部门/Dept：请替换为你的部门")
+                preview_lines.append("电话/Tel：请替换为你的电话")
+                preview_lines.append("邮箱/Email：请替换为你的邮箱")
+                preview_lines.append("官网/Web：请替换为你的官网")
+                preview_lines.append("地址/Add：请替换为你的地址")
+                preview_body = "\n".join(preview_lines)
+                logger.info("正文预览:\n" + preview_body)
+                logger.info("----------------------------------------")
+        logger.info("---- 预览结束 ----\n")
+    
+        if verify_only:
+            return
+    
+        # 确认是否继续发送邮件
+        if not assume_yes:
+            flush_logs()
+            proceed = input("是否继续发送邮件？(y/n): ").strip().lower()
+            if proceed != 'y':
+                logger.warning("操作已取消")
+                return
+    
+        # 提供域名限制配置时按域名调度发送，不再使用全局发送间隔
+        if domain_config:
+            domain_limits = DomainLimits.from_file(domain_config)
+            logger.info("开始按域名调度发送邮件...")
+            with metrics.timer('send_scheduled_emails'):
+                report = send_scheduled_emails(smtp_host, smtp_port, sender, password, validation_results,
+                                               target_dir, domain_limits, test_mode, use_pipelining=use_pipelining,
+                                               use_tls=use_tls, delivery_store=delivery_store, move_sent=move_sent,
+                                               archive_sent=archive_sent)
+            commit_history(report, history_db)
+            return report
+    
+        # 打印发送间隔信息
+        if not test_mode:
+            logger.info(f"\n已设置每封邮件发送间隔为 {delay_seconds} 秒")
+    
+        # 发送邮件，传入目标目录
+        logger.info("开始发送邮件...")
+        with metrics.timer('send_customized_emails'):
+            report = send_customized_emails(smtp_host, smtp_port, sender, password, validation_results, target_dir, test_mode, delay_seconds,
+                                            use_pipelining=use_pipelining, use_tls=use_tls, delivery_store=delivery_store,
+                                            move_sent=move_sent, archive_sent=archive_sent)
+        commit_history(report, history_db)
+        return report
+    finally:
+        if delivery_store is not None:
+            delivery_store.close()
 
 if __name__ == "__main__":
     # 创建参数解析器
     parser = argparse.ArgumentParser(description='发送白名单邮件')
     parser.add_argument('--test', action='store_true', help='测试模式：验证逻辑但不发送邮件')
     parser.add_argument('--delay', type=int, default=2, help='每封邮件发送后的延迟秒数，默认为2秒') #发送延时
+    parser.add_argument('--no-pipelining', action='store_true', help='禁用 SMTP PIPELINING/CHUNKING，逐条发送命令')
+    parser.add_argument('--consolidate', action='store_true', help='合并同一收件人下抄送集合相同（忽略顺序、大小写和重复）的邮件')
+    parser.add_argument('--max-attachments', type=int, help='合并后每封邮件的最大附件数')
+    parser.add_argument('--max-attachment-mb', type=float, help='合并后每封邮件的附件总大小上限(MB)')
+    parser.add_argument('--move-sent', action='store_true', help='发送成功后将邮箱文件夹移动到"已批量发送"目录（默认只写入发送记录）')
+    parser.add_argument('--delivery-db', help='发送记录数据库路径，默认为 target/发送记录.sqlite3')
+    parser.add_argument('--history-db', help='历史白名单数据库路径，发送成功的附件中的旅客记入其中')
+    parser.add_argument('--domain-config', help='按收件域名限制并发和发送频率的JSON配置文件，指定后忽略 --delay')
+    parser.add_argument('--preflight', action='store_true', help='预检模式：只检查将要发送的附件是否完整、表头是否正确，不发送邮件')
+    parser.add_argument('--preflight-report', help='预检结果CSV文件路径')
+    add_arguments(parser)
     
     # 解析命令行参数
     args = parser.parse_args()
     
     # 运行主函数
-    main(test_mode=args.test, delay_seconds=args.delay) 
\ No newline at end of file
+    start_run('4mail', quiet=args.quiet, profile_dir=args.profile)
+    # 未指定时使用 main 中配置的历史白名单路径
+    options = {'history_db': args.history_db} if args.history_db else {}
+    result = main(test_mode=args.test, delay_seconds=args.delay, use_pipelining=not args.no_pipelining,
+         move_sent=args.move_sent, delivery_db=args.delivery_db, consolidate=args.consolidate,
+         max_attachments=args.max_attachments,
+         max_attachment_bytes=int(args.max_attachment_mb * 1024 * 1024) if args.max_attachment_mb else None,
+         domain_config=args.domain_config, preflight=args.preflight,
+         preflight_report_path=args.preflight_report, **options)
+    finish_run(args.metrics_file)
+    if result is False or getattr(result, 'failed', 0):
+        sys.exit(1) 
\ No newline at end of file
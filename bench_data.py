@@ -0,0 +1,147 @@
+import argparse
+import os
+import random
+from datetime import date, timedelta
+
+import pandas as pd
+
+# 原始导出文件的列顺序，与 raw_data.xlsx 一致
+RAW_COLUMNS = ['公司名称', '员工姓名', '英文姓氏', '英文名', '员工生日', '联系电话', '员工类别',
+               '航司二字码', '协议号', '航司名称', '证件信息', '登记日期', '创建类型']
+
+# 批量发送列表的列顺序，与 MU批量发送列表.xlsx 一致
+CONTACT_COLUMNS = ['序号', '协议客户名称', '签署区域', '协议号', '客户经理/邮箱', '航司对接人',
+                   '航司对接人邮箱', '抄送邮箱', '是否单独发送', '是否自动发送', '备注']
+
+SURNAMES = ['ZHANG', 'WANG', 'LI', 'ZHAO', 'CHEN', 'LIU', 'YANG', 'HUANG', 'ZHOU', 'WU']
+SURNAMES_CN = ['张', '王', '李', '赵', '陈', '刘', '杨', '黄', '周', '吴']
+GIVEN_CN = ['伟', '芳', '娜', '敏', '静', '磊', '洋', '勇', '艳', '杰', '军', '涛', '明', '超', '霞', '平']
+GIVEN_PY = ['WEI', 'FANG', 'NA', 'MIN', 'JING', 'LEI', 'YANG', 'YONG', 'YAN', 'JIE', 'JUN', 'TAO', 'MING', 'CHAO', 'XIA', 'PING']
+REGIONS = ['北京', '上海', '广州', '深圳', '成都', '杭州', '武汉', '西安']
+OTHER_DOCUMENTS = ['港澳通行证', '台胞证', '外国人永久居留证', '回乡证']
+
+# 默认证件类型比例：身份证 / 护照 / 其他证件
+DEFAULT_MIX = {'身份证': 0.7, '护照': 0.2, '其他': 0.1}
+
+
+def parse_mix(text):
+    """解析 "身份证:0.7,护照:0.2,其他:0.1" 形式的证件比例"""
+    mix = {}
+    for part in text.split(','):
+        key, _, value = part.partition(':')
+        mix[key.strip()] = float(value)
+    return mix
+
+
+def agreement_ids(agreements):
+    return [f"{3100000 + i}" for i in range(agreements)]
+
+
+def _random_document(rng, kind, birthday):
+    if kind == '身份证':
+        region = f"{rng.randint(110000, 659000)}"
+        return f"身份证|{region}{birthday:%Y%m%d}{rng.randint(100, 999)}{rng.choice('0123456789X')}"
+    if kind == '护照':
+        return f"{rng.choice(['普通护照', '普通护照', '公务护照'])}|E{rng.randint(10000000, 99999999)}"
+    return f"{rng.choice(OTHER_DOCUMENTS)}|{rng.choice('CHTW')}{rng.randint(10000000, 99999999)}"
+
+
+def generate_raw_data(agreements=50, travellers=1000, docs_per_traveller=2, mix=None, seed=0):
+    """
+    生成与企业白名单导出格式一致的原始数据
+    Generate a raw whitelist export with the same columns as raw_data.xlsx
+
+    Args:
+        agreements: 协议号数量
+        travellers: 旅客（行）数量
+        docs_per_traveller: 每位旅客最多的证件数量，实际数量在1到该值之间随机
+        mix: 证件类型比例 {'身份证': x, '护照': y, '其他': z}
+        seed: 随机种子
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds, weights = list(mix), list(mix.values())
+    ids = agreement_ids(agreements)
+    rows = []
+    for t in range(travellers):
+        agreement_id = ids[t % agreements] if t < agreements else rng.choice(ids)
+        surname = rng.randrange(len(SURNAMES))
+        given = [rng.randrange(len(GIVEN_CN)) for _ in range(rng.randint(1, 2))]
+        birthday = date(1960, 1, 1) + timedelta(days=rng.randint(0, 365 * 45))
+        count = rng.randint(1, max(1, docs_per_traveller))
+        documents = [_random_document(rng, kind, birthday) for kind in rng.choices(kinds, weights, k=count)]
+        rows.append({
+            # 部分公司名称留空或与协议客户名称不一致，由 1MU_update_company_name.py 补齐
+            '公司名称': '' if t % 7 == 0 else f"公司{agreement_id}(系统登记)",
+            '员工姓名': SURNAMES_CN[surname] + ''.join(GIVEN_CN[g] for g in given),
+            '英文姓氏': SURNAMES[surname],
+            '英文名': ''.join(GIVEN_PY[g] for g in given),
+            '员工生日': f"{birthday:%Y-%m-%d}",
+            '联系电话': f"1{rng.randint(3000000000, 9999999999)}",
+            '员工类别': '普通员工',
+            '航司二字码': 'MU',
+            '协议号': agreement_id,
+            '航司名称': '东方航空',
+            '证件信息': ','.join(documents),
+            '登记日期': f"{date(2024, 11, 1) + timedelta(days=rng.randint(0, 20)):%Y-%m-%d}",
+            '创建类型': rng.choice(['手工录入', '批量导入']),
+        })
+    return pd.DataFrame(rows, columns=RAW_COLUMNS)
+
+
+def generate_contact_list(agreements=50, agreements_per_contact=3, cc_per_contact=2, separate_ratio=0.1, seed=0):
+    """生成协议号与航司对接人邮箱的批量发送列表（同时作为联系人列表使用）"""
+    rng = random.Random(seed)
+    rows = []
+    for i, agreement_id in enumerate(agreement_ids(agreements)):
+        contact = i // max(1, agreements_per_contact)
+        ccs = [f"manager{contact}-{c}@tmc.example.com" for c in range(cc_per_contact)]
+        rows.append({
+            '序号': i + 1,
+            '协议客户名称': f"测试公司{agreement_id}",
+            '签署区域': rng.choice(REGIONS),
+            '协议号': agreement_id,
+            '客户经理/邮箱': ccs[0] if ccs else '',
+            '航司对接人': f"对接人{contact}",
+            '航司对接人邮箱': f"contact{contact}@ceair.example.com",
+            '抄送邮箱': ','.join(ccs),
+            '是否单独发送': '是' if rng.random() < separate_ratio else '',
+            '是否自动发送': '是',
+            '备注': '',
+        })
+    return pd.DataFrame(rows, columns=CONTACT_COLUMNS)
+
+
+def write_inputs(output_dir, agreements=50, travellers=1000, docs_per_traveller=2, mix=None,
+                 agreements_per_contact=3, cc_per_contact=2, seed=0):
+    """写出 raw_data.xlsx 和 MU批量发送列表.xlsx，返回 {'raw': 路径, 'contacts': 路径}"""
+    os.makedirs(output_dir, exist_ok=True)
+    raw_path = os.path.join(output_dir, 'raw_data.xlsx')
+    contacts_path = os.path.join(output_dir, 'MU批量发送列表.xlsx')
+    generate_raw_data(agreements, travellers, docs_per_traveller, mix, seed).to_excel(
+        raw_path, index=False, sheet_name='EnterpriseCCExport')
+    generate_contact_list(agreements, agreements_per_contact, cc_per_contact, seed=seed).to_excel(
+        contacts_path, index=False)
+    return {'raw': raw_path, 'contacts': contacts_path}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成合成的白名单原始数据和批量发送列表')
+    parser.add_argument('output_dir', help='输出目录')
+    parser.add_argument('--agreements', type=int, default=50, help='协议号数量')
+    parser.add_argument('--travellers', type=int, default=1000, help='旅客数量')
+    parser.add_argument('--docs', type=int, default=2, help='每位旅客最多的证件数量')
+    parser.add_argument('--mix', default='身份证:0.7,护照:0.2,其他:0.1', help='证件类型比例')
+    parser.add_argument('--agreements-per-contact', type=int, default=3, help='每个航司对接人负责的协议号数量')
+    parser.add_argument('--cc', type=int, default=2, help='每个协议的抄送人数')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    paths = write_inputs(args.output_dir, args.agreements, args.travellers, args.docs, parse_mix(args.mix),
+                         args.agreements_per_contact, args.cc, args.seed)
+    print(f"原始数据：{paths['raw']}")
+    print(f"批量发送列表：{paths['contacts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import math
+import os
+import random
+import tempfile
+import time
+
+import pandas as pd
+
+from domain_scheduler import DomainLimit, DomainLimits
+from smtp_sink import SMTPSink
+
+# 4mail.py 的模块名以数字开头，只能通过 importlib 导入
+mailer = importlib.import_module('4mail')
+
+
+def build_synthetic_batch(root, recipients=20, agreements_per_recipient=3, attachment_bytes=20000,
+                          cc_per_recipient=2, seed=0):
+    """
+    生成与 3MUmails.py 输出结构一致的 target/ 目录和对应的批量发送列表
+    Build a synthetic target/ tree plus sending list for benchmarking
+
+    Returns:
+        (发送列表路径, target目录路径)
+    """
+    rng = random.Random(seed)
+    target_dir = os.path.join(root, 'target')
+    os.makedirs(target_dir, exist_ok=True)
+    rows = []
+    for r in range(recipients):
+        email = f"contact{r}@airline{r % 5}.example.com"
+        cc = ",".join(f"cc{r}-{c}@tmc.example.com" for c in range(cc_per_recipient))
+        folder = os.path.join(target_dir, email)
+        os.makedirs(folder, exist_ok=True)
+        for a in range(agreements_per_recipient):
+            agreement_id = f"B{r:04d}{a:02d}"
+            company = f"测试公司{r}-{a}"
+            with open(os.path.join(folder, f"MU_{agreement_id}_{company}.xlsx"), 'wb') as f:
+                f.write(rng.randbytes(attachment_bytes))
+            rows.append({
+                '协议号': agreement_id,
+                '协议客户名称': company,
+                '航司对接人邮箱': email,
+                '抄送邮箱': cc,
+                '是否单独发送': '',
+            })
+    excel_path = os.path.join(root, 'MU批量发送列表.xlsx')
+    pd.DataFrame(rows).to_excel(excel_path, index=False)
+    return excel_path, target_dir
+
+
+def percentile(values, pct):
+    """最近秩法计算百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _send_with_mailer(sink, excel_path, target_dir, **kwargs):
+    validation_results = mailer.verify_email_agreement_match(excel_path, target_dir)
+    started = time.perf_counter()
+    mailer.send_customized_emails(sink.host, sink.port, 'bench@tmc.example.com', 'secret',
+                                  validation_results, target_dir, test_mode=False, delay_seconds=0,
+                                  use_tls=False, **kwargs)
+    return started
+
+
+def _send_scheduled(sink, excel_path, target_dir):
+    # 合成数据中的收件人分布在 5 个域名上；每个域名 2 个连接、不设间隔
+    limits = DomainLimits(DomainLimit(concurrency=2, interval=0.0), max_connections=10)
+    validation_results = mailer.verify_email_agreement_match(excel_path, target_dir)
+    started = time.perf_counter()
+    mailer.send_scheduled_emails(sink.host, sink.port, 'bench@tmc.example.com', 'secret',
+                                 validation_results, target_dir, limits, use_tls=False)
+    return started
+
+
+# 发送方式：名称 -> (SMTPSink 参数, 发送函数)
+SEND_MODES = {
+    'standard': ({'pipelining': False, 'chunking': False},
+                 lambda sink, excel_path, target_dir: _send_with_mailer(sink, excel_path, target_dir,
+                                                                       use_pipelining=False)),
+    'pipelining': ({'pipelining': True, 'chunking': False},
+                   lambda sink, excel_path, target_dir: _send_with_mailer(sink, excel_path, target_dir)),
+    'chunking': ({'pipelining': True, 'chunking': True},
+                 lambda sink, excel_path, target_dir: _send_with_mailer(sink, excel_path, target_dir)),
+    'scheduled': ({'pipelining': True, 'chunking': True}, _send_scheduled),
+}
+
+
+def run_benchmark(mode, recipients=20, agreements_per_recipient=3, attachment_bytes=20000,
+                  cc_per_recipient=2, latency=0.02, fail_rate=0.0, verbose=False):
+    """在本地SMTP替身上运行一种发送方式并返回吞吐和延迟指标"""
+    sink_options, send = SEND_MODES[mode]
+    with tempfile.TemporaryDirectory() as root:
+        excel_path, target_dir = build_synthetic_batch(root, recipients, agreements_per_recipient,
+                                                       attachment_bytes, cc_per_recipient)
+        with SMTPSink(latency=latency, fail_rate=fail_rate, seed=0, **sink_options) as sink:
+            output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+            with output:
+                started = send(sink, excel_path, target_dir)
+            elapsed = time.perf_counter() - started
+            received = sorted(sink.messages, key=lambda m: m.finished_at)
+
+    # 每封邮件的耗时取相邻两封邮件完成时间之差（包含客户端构造邮件的时间）
+    latencies = []
+    previous = started
+    for message in received:
+        latencies.append(message.finished_at - previous)
+        previous = message.finished_at
+    total_bytes = sum(len(message.data) for message in received)
+    return {
+        'mode': mode,
+        'messages': len(received),
+        'bytes': total_bytes,
+        'seconds': round(elapsed, 4),
+        'messages_per_sec': round(len(received) / elapsed, 2) if elapsed else 0.0,
+        'bytes_per_sec': round(total_bytes / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='邮件发送吞吐基准测试（使用本地SMTP替身）')
+    parser.add_argument('--modes', default=','.join(SEND_MODES), help=f"要测试的发送方式，逗号分隔，可选: {', '.join(SEND_MODES)}")
+    parser.add_argument('--recipients', type=int, default=20, help='收件人数量')
+    parser.add_argument('--agreements', type=int, default=3, help='每个收件人的协议号数量')
+    parser.add_argument('--attachment-kb', type=int, default=20, help='每个附件的大小(KB)')
+    parser.add_argument('--cc', type=int, default=2, help='每封邮件的抄送人数')
+    parser.add_argument('--latency', type=float, default=0.02, help='模拟的网络往返延迟(秒)')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='随机失败概率')
+    parser.add_argument('--json', help='将结果写入指定的JSON文件')
+    parser.add_argument('--verbose', action='store_true', help='显示发送过程的原始输出')
+    args = parser.parse_args()
+
+    results = []
+    for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+        if mode not in SEND_MODES:
+            print(f"未知的发送方式: {mode}")
+            continue
+        result = run_benchmark(mode, args.recipients, args.agreements, args.attachment_kb * 1024,
+                               args.cc, args.latency, args.fail_rate, args.verbose)
+        results.append(result)
+        print(f"{mode:<12} 邮件 {result['messages']:>5} 封  耗时 {result['seconds']:>8.3f}s  "
+              f"{result['messages_per_sec']:>8.2f} 封/s  {result['bytes_per_sec'] / 1024:>10.1f} KB/s  "
+              f"p50 {result['p50_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到：{args.json}")
+
+
+if __name__ == "__main__":
+    main()
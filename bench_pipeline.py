@@ -0,0 +1,203 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import bench_data
+from excel_utils import (
+    extract_birthday_and_add_to_column,
+    split_info_to_next_row,
+    split_column_and_add,
+    convert_names_to_pinyin
+)
+from ingest import RAW_EXPORT, read_frame
+from layouts import DEFAULT_LAYOUT
+
+# 脚本文件名以数字开头，只能通过 importlib 导入
+update_names = importlib.import_module('1MU_update_company_name')
+builder = importlib.import_module('2MU')
+router = importlib.import_module('3MUmails')
+mailer = importlib.import_module('4mail')
+
+
+def current_rss_bytes():
+    """当前进程的常驻内存（字节），Linux 读取 /proc，Windows 调用 psapi"""
+    if sys.platform.startswith('linux'):
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb)
+        return counters.WorkingSetSize
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class StageRecorder:
+    """记录每个阶段的耗时和峰值内存；峰值内存由后台线程按固定间隔采样得到"""
+
+    def __init__(self, interval=0.01, quiet=True):
+        self.interval = interval
+        self.quiet = quiet
+        self.stages = []
+
+    @contextlib.contextmanager
+    def stage(self, name, rows=None):
+        peak = [current_rss_bytes()]
+        stop = threading.Event()
+
+        def sample():
+            while not stop.wait(self.interval):
+                peak[0] = max(peak[0], current_rss_bytes())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        output = contextlib.redirect_stdout(io.StringIO()) if self.quiet else contextlib.nullcontext()
+        record = {'stage': name, 'rows': rows}
+        started = time.perf_counter()
+        try:
+            with output:
+                yield record
+        finally:
+            elapsed = time.perf_counter() - started
+            stop.set()
+            sampler.join()
+            peak[0] = max(peak[0], current_rss_bytes())
+            record['seconds'] = round(elapsed, 4)
+            record['peak_rss_mb'] = round(peak[0] / 1024 / 1024, 1)
+            self.stages.append(record)
+            print(f"{name:<36} {elapsed:>9.3f}s  峰值内存 {record['peak_rss_mb']:>8.1f} MB"
+                  + (f"  行数 {record['rows']}" if record['rows'] is not None else ''))
+
+
+def run_pipeline(workdir, recorder, agreements=50, travellers=1000, docs_per_traveller=2, mix=None,
+                 agreements_per_contact=3, seed=0):
+    """在 workdir 中生成输入并按 1MU → 2MU → 3MUmails → 4mail 验证 的顺序逐阶段计时"""
+    with recorder.stage('generate_inputs', rows=travellers):
+        paths = bench_data.write_inputs(workdir, agreements, travellers, docs_per_traveller, mix,
+                                        agreements_per_contact, seed=seed)
+    updated_path = os.path.join(workdir, 'MUwhitelist_updated.xlsx')
+    output_dir = os.path.join(workdir, 'output')
+    target_dir = os.path.join(workdir, 'target')
+    os.makedirs(output_dir, exist_ok=True)
+
+    with recorder.stage('1MU.update_company_names', rows=travellers):
+        update_names.update_company_names(paths['raw'], paths['contacts'], updated_path)
+
+    # 以下各阶段与 2MU.main 的调用顺序保持一致
+    with recorder.stage('2MU.read_excel') as record:
+        df = read_frame(updated_path, RAW_EXPORT)
+        record['rows'] = len(df)
+    with recorder.stage('2MU.extract_birthday_and_add_to_column', rows=len(df)):
+        df = extract_birthday_and_add_to_column(df)
+    with recorder.stage('2MU.split_info_to_next_row') as record:
+        df = split_info_to_next_row(df)
+        record['rows'] = len(df)
+    with recorder.stage('2MU.split_column_and_add', rows=len(df)):
+        df = split_column_and_add(df)
+    with recorder.stage('2MU.convert_names_to_pinyin', rows=len(df)):
+        df = convert_names_to_pinyin(df)
+    # 2MU.main 使用默认列名"姓名"，原始导出中不存在该列，上一步实际不做转换；
+    # 这里在副本上对"员工姓名"单独计时，衡量拼音转换本身的开销
+    with recorder.stage('excel_utils.pinyin(员工姓名)', rows=len(df)):
+        convert_names_to_pinyin(df.copy(), name_col='员工姓名')
+    # 按协议号生成工作表、修改格式并直接写成独立文件（不保存合并工作簿）
+    with recorder.stage('2MU.render_layout', rows=agreements):
+        builder.render_layout(df, output_dir, DEFAULT_LAYOUT)
+
+    with recorder.stage('3MUmails.route_files', rows=agreements):
+        mapping = router.load_email_mapping(paths['contacts'])
+        router.route_files_to_email_folders(mapping, output_dir, target_dir)
+
+    with recorder.stage('4mail.verify_email_agreement_match', rows=agreements):
+        mailer.verify_email_agreement_match(paths['contacts'], target_dir)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare_reports(baseline, current):
+    """按阶段打印两份报告的耗时比值（当前/基线）"""
+    base = {s['stage']: s for s in baseline['stages']}
+    print(f"\n与基线 {baseline['meta'].get('commit')} 比较：")
+    for stage in current['stages']:
+        old = base.get(stage['stage'])
+        if not old or not old['seconds']:
+            continue
+        ratio = stage['seconds'] / old['seconds']
+        print(f"{stage['stage']:<36} {old['seconds']:>9.3f}s -> {stage['seconds']:>9.3f}s  x{ratio:.2f}  "
+              f"内存 {old['peak_rss_mb']:.1f} -> {stage['peak_rss_mb']:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='白名单流水线各阶段的耗时与内存基准测试')
+    parser.add_argument('--agreements', type=int, default=50, help='协议号数量')
+    parser.add_argument('--travellers', type=int, default=1000, help='旅客数量')
+    parser.add_argument('--docs', type=int, default=2, help='每位旅客最多的证件数量')
+    parser.add_argument('--mix', default='身份证:0.7,护照:0.2,其他:0.1', help='证件类型比例')
+    parser.add_argument('--agreements-per-contact', type=int, default=3, help='每个航司对接人负责的协议号数量')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workdir', help='保留中间文件的工作目录，默认使用临时目录')
+    parser.add_argument('--report', default='bench_pipeline.json', help='JSON报告输出路径')
+    parser.add_argument('--compare', help='用于比较的基线JSON报告')
+    parser.add_argument('--verbose', action='store_true', help='显示各脚本的原始输出')
+    args = parser.parse_args()
+
+    recorder = StageRecorder(quiet=not args.verbose)
+    params = {'agreements': args.agreements, 'travellers': args.travellers, 'docs_per_traveller': args.docs,
+              'mix': bench_data.parse_mix(args.mix), 'agreements_per_contact': args.agreements_per_contact,
+              'seed': args.seed}
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir or stack.enter_context(tempfile.TemporaryDirectory())
+        run_pipeline(workdir, recorder, **params)
+
+    report = {
+        'meta': {
+            'commit': git_revision(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'params': params,
+        },
+        'stages': recorder.stages,
+    }
+    with open(args.report, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n报告已保存到：{args.report}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare_reports(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
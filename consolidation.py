@@ -0,0 +1,65 @@
+import os
+import re
+
+from delivery_store import canonical_cc
+from send_records import SendGroup, ValidationResults, attachment_size
+
+
+def split_cc(cc_str):
+    """拆分抄送字符串，支持逗号、分号或换行分隔"""
+    return [e.strip() for e in re.split(r'[,;\r\n]+', cc_str) if e.strip()]
+
+
+def _chunk_files(indices, files, max_attachments=None, max_bytes=None):
+    """按附件数量和总大小上限把附件索引列表切分为若干封邮件"""
+    chunks, current, current_bytes = [], [], 0
+    for index in indices:
+        size = attachment_size(files[index])
+        full = (max_attachments and len(current) >= max_attachments) or \
+               (max_bytes and current and current_bytes + size > max_bytes)
+        if full:
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(index)
+        current_bytes += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def plan_consolidation(validation_results, max_attachments=None, max_bytes=None):
+    """
+    合并同一收件人下抄送集合相同的分组
+    Merge sending-list groups whose CC sets are equal after canonicalization
+
+    抄送地址统一为小写、去重、排序后比较，因此顺序、大小写或重复不同的行会合并为一封邮件；
+    标记为"是否单独发送"的分组保持一个附件一封；合并后的附件按数量和总大小上限再拆分。
+
+    Returns:
+        (合并后的验证结果, 合并前邮件数, 合并后邮件数)
+    """
+    files = validation_results.files
+    consolidated = ValidationResults(files)
+    for recipient, result in validation_results.items():
+        target = consolidated.recipient(recipient, result.folder_exists)
+        merged = {}
+        separate = {}
+        for group in result.groups.values():
+            cc_str = canonical_cc(split_cc(group.cc))
+            if group.separate:
+                for index in group.files:
+                    separate.setdefault(f"{cc_str}_{os.path.basename(files[index])}",
+                                        SendGroup(cc_str, True, [index]))
+                continue
+            merged.setdefault(cc_str, SendGroup(cc_str)).add(group.files)
+
+        for cc_str, group in merged.items():
+            if not group.match_found:
+                target.groups[cc_str] = group
+                continue
+            for index, chunk in enumerate(_chunk_files(list(group.files), files, max_attachments, max_bytes)):
+                key = cc_str if index == 0 else f"{cc_str}#{index + 1}"
+                target.groups[key] = SendGroup(cc_str, False, chunk)
+        target.groups.update(separate)
+
+    return consolidated, validation_results.message_count(), consolidated.message_count()
@@ -0,0 +1,191 @@
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+from send_records import attachment_content
+
+# 发送记录数据库的默认文件名，放在 target 根目录下
+DELIVERY_DB_NAME = '发送记录.sqlite3'
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    agreement TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    cc TEXT NOT NULL DEFAULT '',
+    file_name TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    message_id TEXT,
+    sent_at TEXT NOT NULL,
+    content_hash TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_recipient_agreement ON deliveries (recipient, agreement);
+CREATE INDEX IF NOT EXISTS idx_deliveries_hash ON deliveries (file_hash);
+"""
+
+
+def default_db_path(target_dir):
+    return os.path.join(target_dir, DELIVERY_DB_NAME)
+
+
+def agreement_from_filename(filename):
+    """从 MU_协议号_公司名.xlsx 形式的文件名中提取协议号，格式不符时返回 None"""
+    parts = os.path.basename(filename).split('_')
+    return parts[1] if len(parts) > 1 else None
+
+
+def file_sha256(path_or_bytes):
+    """计算文件内容（路径或字节串）的 SHA-256"""
+    digest = hashlib.sha256()
+    if isinstance(path_or_bytes, (bytes, bytearray, memoryview)):
+        digest.update(path_or_bytes)
+    else:
+        with open(path_or_bytes, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def layout_prefix(filename):
+    """文件名前缀（航司二字码），如 MU_协议号_公司名.xlsx 中的 MU"""
+    return os.path.basename(filename).split('_')[0]
+
+
+def content_digest(path_or_bytes, prefix=''):
+    """
+    附件内容（路径或字节串）的摘要：文件名前缀、各工作表名称和单元格值的 SHA-256
+    openpyxl 保存时写入时间戳，内容相同、先后生成的两个文件字节不同；按单元格值比较才能识别重新生成的文件。
+    prefix 为文件名前缀：不同航司布局的同一协议号文件单元格可能相同，但要分别发送。
+    无法作为 xlsx 打开的文件按字节计算。
+    """
+    from openpyxl import load_workbook
+
+    source = io.BytesIO(path_or_bytes) if isinstance(path_or_bytes, (bytes, bytearray, memoryview)) else path_or_bytes
+    try:
+        workbook = load_workbook(source, read_only=True)
+    except Exception:
+        return file_sha256(path_or_bytes)
+    digest = hashlib.sha256(repr(prefix).encode('utf-8'))
+    try:
+        for sheet in workbook.worksheets:
+            digest.update(repr(sheet.title).encode('utf-8'))
+            for row in sheet.iter_rows(values_only=True):
+                digest.update(repr(row).encode('utf-8'))
+    finally:
+        workbook.close()
+    return digest.hexdigest()
+
+
+def canonical_cc(cc_list):
+    """抄送列表的规范形式：小写、去重、排序后以逗号连接"""
+    return ','.join(sorted({cc.strip().lower() for cc in cc_list if cc and cc.strip()}))
+
+
+class DeliveryStore:
+    """
+    已发送邮件的记录（SQLite）
+    Indexed record of which agreement file was delivered to which recipient
+
+    每个成功发送的附件记录一行：协议号、收件人、抄送、文件名、文件哈希、内容摘要、Message-ID、发送时间。
+    替代"移动到已批量发送文件夹"作为是否已发送的依据；是否已发送按协议号、收件人和内容摘要（含文件名前缀）判断。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+        # 旧版本的数据库没有 content_hash 列，这些记录只能按文件哈希比较
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(deliveries)")}
+        if 'content_hash' not in columns:
+            with self._conn:
+                self._conn.execute("ALTER TABLE deliveries ADD COLUMN content_hash TEXT")
+
+    def record_delivery(self, recipient, cc_list, files, message_id=None, sent_at=None):
+        """
+        记录一封已成功发送的邮件
+
+        Args:
+            recipient: 主收件人
+            cc_list: 抄送列表
+            files: [(文件名, 文件路径或内容字节串), ...]
+            message_id: 邮件的 Message-ID
+        """
+        sent_at = sent_at or datetime.now().isoformat(timespec='seconds')
+        cc = canonical_cc(cc_list)
+        rows = []
+        for file_name, content in files:
+            file_name = os.path.basename(file_name)
+            rows.append((agreement_from_filename(file_name) or '', recipient.lower(), cc, file_name,
+                         file_sha256(content), content_digest(content, layout_prefix(file_name)), message_id, sent_at))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO deliveries (agreement, recipient, cc, file_name, file_hash, content_hash, message_id, "
+                "sent_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def was_sent(self, agreement, recipient, content_hash=None, file_hash=None):
+        """
+        协议号是否已发送给该收件人；提供 content_hash 时要求单元格内容相同
+        没有内容摘要的旧记录用 file_hash（文件字节）比较
+        """
+        query = "SELECT 1 FROM deliveries WHERE recipient = ? AND agreement = ?"
+        params = [recipient.lower(), agreement]
+        if content_hash is not None:
+            query += " AND (content_hash = ? OR (content_hash IS NULL AND file_hash = ?))"
+            params.extend([content_hash, file_hash])
+        with self._lock:
+            return self._conn.execute(query + " LIMIT 1", params).fetchone() is not None
+
+    def file_was_sent(self, path, recipient):
+        """
+        该协议号、该航司布局的文件是否已经以相同的单元格内容发送给该收件人，path 也可以是内存附件
+        先按 (收件人, 协议号) 索引查询，有发送记录时才解析工作簿计算内容摘要；
+        大多数文件没有发送过，route 和 verify 不必为每个文件打开一次工作簿
+        """
+        agreement = agreement_from_filename(path)
+        if agreement is None:
+            return False
+        with self._lock:
+            recorded = self._conn.execute(
+                "SELECT content_hash, file_hash FROM deliveries WHERE recipient = ? AND agreement = ?",
+                (recipient.lower(), agreement)).fetchall()
+        if not recorded:
+            return False
+        content = attachment_content(path)
+        digests = {content_hash for content_hash, _ in recorded if content_hash is not None}
+        if digests and content_digest(content, layout_prefix(path)) in digests:
+            return True
+        # 没有内容摘要的旧记录按文件字节比较
+        legacy = {file_hash for content_hash, file_hash in recorded if content_hash is None}
+        return bool(legacy) and file_sha256(content) in legacy
+
+    def history(self, agreement=None, recipient=None):
+        """查询发送历史，按发送时间排序"""
+        query = "SELECT agreement, recipient, cc, file_name, file_hash, message_id, sent_at FROM deliveries"
+        conditions, params = [], []
+        if agreement is not None:
+            conditions.append("agreement = ?")
+            params.append(agreement)
+        if recipient is not None:
+            conditions.append("recipient = ?")
+            params.append(recipient.lower())
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            return self._conn.execute(query + " ORDER BY sent_at, id", params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,231 @@
+import json
+import threading
+import time
+from collections import Counter, OrderedDict, deque, namedtuple
+
+# 每个域名的发送限制：同时发送的连接数、相邻两封邮件开始发送的最小间隔（秒）
+DomainLimit = namedtuple('DomainLimit', ['concurrency', 'interval'])
+
+# 配置文件中未列出的域名使用的限制，与 4mail.py 默认的 --delay 2 一致
+DEFAULT_LIMIT = DomainLimit(concurrency=1, interval=2.0)
+
+# 同时打开的 SMTP 连接总数上限
+DEFAULT_MAX_CONNECTIONS = 4
+
+
+def recipient_domain(address):
+    """收件人邮箱的域名（小写）"""
+    return address.rsplit('@', 1)[-1].strip().lower()
+
+
+def worker_demand(limits, counts):
+    """
+    需要的工作线程数：不超过连接总数上限，也不超过各域名并发数之和
+    counts 为 {域名: 邮件数}
+    """
+    demand = sum(min(limits.for_domain(domain).concurrency, count) for domain, count in counts.items())
+    return max(1, min(limits.max_connections, demand))
+
+
+def _parse_limit(entry, fallback):
+    """解析配置中的一个限制项：concurrency、min_interval（秒）、per_minute（每分钟封数）"""
+    concurrency = max(1, int(entry.get('concurrency', fallback.concurrency)))
+    if 'per_minute' in entry:
+        interval = float(entry.get('min_interval', 0))
+    else:
+        interval = float(entry.get('min_interval', fallback.interval))
+    if entry.get('per_minute'):
+        interval = max(interval, 60.0 / float(entry['per_minute']))
+    return DomainLimit(concurrency, interval)
+
+
+class DomainLimits:
+    """
+    按收件域名的发送限制
+    Per-domain concurrency and rate limits for outbound mail
+
+    域名按后缀匹配：配置 "ceair.com" 同样适用于 "mail.ceair.com"，未匹配的域名使用 default。
+    """
+
+    def __init__(self, default=DEFAULT_LIMIT, domains=None, max_connections=DEFAULT_MAX_CONNECTIONS):
+        self.default = default
+        self.domains = {name.lower(): limit for name, limit in (domains or {}).items()}
+        self.max_connections = max(1, int(max_connections))
+
+    @classmethod
+    def from_file(cls, path):
+        """
+        从 JSON 配置文件读取限制，格式:
+            {"max_connections": 4,
+             "default": {"concurrency": 1, "min_interval": 2},
+             "domains": {"ceair.com": {"concurrency": 1, "per_minute": 10}}}
+        """
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        default = _parse_limit(config.get('default', {}), DEFAULT_LIMIT)
+        domains = {name: _parse_limit(entry, default) for name, entry in config.get('domains', {}).items()}
+        return cls(default, domains, config.get('max_connections', DEFAULT_MAX_CONNECTIONS))
+
+    def for_domain(self, domain):
+        parts = domain.lower().split('.')
+        for start in range(len(parts)):
+            limit = self.domains.get('.'.join(parts[start:]))
+            if limit is not None:
+                return limit
+        return self.default
+
+
+class DomainScheduler:
+    """
+    按收件域名分桶、在各域名之间轮转的发送调度器
+    Round-robin dispatcher that enforces per-domain concurrency and spacing
+
+    工作线程调用 acquire() 取得下一封可以发送的邮件：依次轮询各域名，跳过已达到并发上限
+    或尚未到达最小间隔的域名；都不可用时等待最早可用的域名。因此限制严格的域名只会推迟
+    自己的邮件，其他域名的邮件照常发送。
+
+    closed 为 False 时任务可以在发送过程中用 add() 陆续加入，队列暂时为空时工作线程等待，
+    直到调用 close() 后才在发送完剩余任务时结束（边生成边发送）。
+    """
+
+    def __init__(self, jobs, limits, domain_of, throttle=True, closed=True):
+        """
+        Args:
+            jobs: 待发送的任务列表，按原顺序在各自域名内发送
+            limits: DomainLimits
+            domain_of: 从任务取得域名的函数
+            throttle: 为 False 时忽略最小间隔（测试模式）
+            closed: 为 False 时之后还会用 add() 加入任务
+        """
+        self.limits = limits
+        self.throttle = throttle
+        self.domain_of = domain_of
+        self._queues = OrderedDict()
+        for job in jobs:
+            self._queues.setdefault(domain_of(job), deque()).append(job)
+        self._order = deque(self._queues)
+        self._active = Counter()
+        self._next_at = {}
+        self._cancelled = False
+        self._closed = closed
+        self._finished = False
+        self._cond = threading.Condition()
+
+    def domains(self):
+        return list(self._queues)
+
+    def pending(self):
+        """尚未取出的任务"""
+        with self._cond:
+            return [job for queue in self._queues.values() for job in queue]
+
+    def worker_count(self):
+        """实际需要的工作线程数，见 worker_demand"""
+        return worker_demand(self.limits, {domain: len(queue) for domain, queue in self._queues.items()})
+
+    def add(self, job):
+        """
+        加入一个任务（closed 为 False 时），等待中的工作线程会被唤醒
+        run() 已经结束（例如连接失败）时不再加入，返回 False：此前加入的任务都留在 pending() 中
+        """
+        with self._cond:
+            if self._finished:
+                return False
+            domain = self.domain_of(job)
+            if domain not in self._queues:
+                self._queues[domain] = deque()
+                self._order.append(domain)
+            self._queues[domain].append(job)
+            self._cond.notify_all()
+            return True
+
+    def close(self):
+        """不再加入任务，工作线程发送完剩余任务后结束"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def acquire(self):
+        """取得下一个可以发送的 (域名, 任务)；全部发送完（且已 close）或已取消时返回 None"""
+        with self._cond:
+            while True:
+                if self._cancelled or (self._closed and not any(self._queues.values())):
+                    return None
+                now = time.monotonic()
+                wait = None
+                for _ in range(len(self._order)):
+                    domain = self._order[0]
+                    self._order.rotate(-1)
+                    queue = self._queues[domain]
+                    if not queue:
+                        continue
+                    limit = self.limits.for_domain(domain)
+                    if self._active[domain] >= limit.concurrency:
+                        continue
+                    next_at = self._next_at.get(domain, now) if self.throttle else now
+                    if next_at > now:
+                        wait = next_at - now if wait is None else min(wait, next_at - now)
+                        continue
+                    self._active[domain] += 1
+                    self._next_at[domain] = now + limit.interval
+                    return domain, queue.popleft()
+                self._cond.wait(wait)
+
+    def release(self, domain):
+        with self._cond:
+            self._active[domain] -= 1
+            self._cond.notify_all()
+
+    def cancel(self):
+        """停止分配新任务，未取出的任务留在 pending() 中"""
+        with self._cond:
+            self._cancelled = True
+            self._cond.notify_all()
+
+    def run(self, handle, setup=None, teardown=None, workers=None):
+        """
+        用 worker_count() 个线程发送全部任务
+
+        Args:
+            handle: handle(state, domain, job)，发送一个任务
+            setup: 每个工作线程开始时调用，返回值作为 state（例如一个 SMTP 连接）
+            teardown: teardown(state)，工作线程结束时调用
+            workers: 工作线程数，默认为 worker_count()；任务陆续加入时由调用方按计划估算
+        任一线程抛出异常时取消剩余任务，并在所有线程结束后重新抛出第一个异常
+        """
+        errors = []
+
+        def worker():
+            try:
+                state = setup() if setup else None
+            except BaseException as e:
+                errors.append(e)
+                self.cancel()
+                return
+            try:
+                while True:
+                    item = self.acquire()
+                    if item is None:
+                        break
+                    domain, job = item
+                    try:
+                        handle(state, domain, job)
+                    finally:
+                        self.release(domain)
+            except BaseException as e:
+                errors.append(e)
+                self.cancel()
+            finally:
+                if teardown:
+                    teardown(state)
+
+        threads = [threading.Thread(target=worker, name=f'send-{i}', daemon=True)
+                   for i in range(workers or self.worker_count())]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with self._cond:
+            self._finished = True
+        if errors:
+            raise errors[0]
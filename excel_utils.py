@@ -7,8 +7,12 @@ from openpyxl.styles import Alignment, Font, PatternFill
 from openpyxl.styles.numbers import FORMAT_TEXT
 import os
 import re
+from functools import lru_cache
 
-# 获取拼音
+from metrics import logger, metrics
+
+# 获取拼音，结果按字缓存（监控模式下在多个批次之间复用）
+@lru_cache(maxsize=None)
 def get_char_pinyin(char):
     return ''.join(lazy_pinyin(char))
 
@@ -32,7 +36,8 @@ def extract_birthday_and_add_to_column(df, id_col='证件信息', birthday_col='
 # 拆分信息列
 def split_info_to_next_row(df, col='证件信息'):
     if col in df.columns:
-        expanded_rows = df[col].str.split(',', expand=True).stack().reset_index(level=1, drop=True).to_frame(col)
+        # dropna: pandas 3 的 stack() 保留证件数较少的行补齐的空值，这些空行会被 format_sheet 合并进相邻行
+        expanded_rows = df[col].str.split(',', expand=True).stack().dropna().reset_index(level=1, drop=True).to_frame(col)
         df = df.drop(columns=[col]).join(expanded_rows).reset_index(drop=True)
     return df
 
@@ -64,6 +69,15 @@ def clean_string(s):
     invalid_chars = r'[:\/<>|"?*\t]'
     return re.sub(invalid_chars, '', str(s))[:31]
 
+# 协议号对应的工作表名
+def sheet_title(agreement_value):
+    return clean_string(str(agreement_value))[:31]  # Excel工作表名最大长度为31字符
+
+# 把一个协议号的数据（含表头）写入工作表
+def append_group(ws, group):
+    for row in dataframe_to_rows(group, index=False, header=True):
+        ws.append(row)
+
 # 保存到独立工作表
 def save_grouped_to_sheets(df, save_path, file_name, company_name_col='公司名称', agreement_col='协议号', add_and_merge_header=None, set_header_titles_and_format=None):
     grouped = df.groupby(agreement_col)  # 按协议号分组
@@ -73,7 +87,7 @@ def save_grouped_to_sheets(df, save_path, file_name, company_name_col='公司名
     first_sheet = True
 
     for agreement_value, group in grouped:
-        sheet_name = clean_string(str(agreement_value))[:31]  # Excel工作表名最大长度为31字符
+        sheet_name = sheet_title(agreement_value)
 
         if first_sheet:
             ws = wb.active
@@ -82,8 +96,7 @@ def save_grouped_to_sheets(df, save_path, file_name, company_name_col='公司名
         else:
             ws = wb.create_sheet(title=sheet_name)
 
-        for row in dataframe_to_rows(group, index=False, header=True):
-            ws.append(row)
+        append_group(ws, group)
 
         if add_and_merge_header:
             add_and_merge_header(ws)
@@ -91,5 +104,7 @@ def save_grouped_to_sheets(df, save_path, file_name, company_name_col='公司名
             set_header_titles_and_format(ws)
 
     file_path = os.path.join(save_path, file_name)
-    wb.save(file_path)
-    print(f"保存文件：{file_path}")
\ No newline at end of file
+    with metrics.timer('save'):
+        wb.save(file_path)
+    metrics.incr('files_written')
+    logger.info(f"保存文件：{file_path}")
\ No newline at end of file
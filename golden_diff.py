@@ -0,0 +1,283 @@
+import argparse
+import contextlib
+import importlib
+import importlib.util
+import io
+import os
+import sys
+import tempfile
+import time
+
+import bench_data
+import excel_utils
+from ingest import RAW_EXPORT, read_frame
+from layouts import DEFAULT_LAYOUT
+from whitelist_index import WhitelistIndex
+
+# 黄金输出对比：用当前的 2MU.py 和一个替代实现处理同样的输入，逐个单元格比较生成的文件
+# （值、合并单元格、数字格式、填充），并报告两者的耗时比值。
+# format_sheet、按证件类型合并行的循环、write_individual_file 的改写
+# （身份证行优先、C/D 列拼成 SURNAME/GIVENNAME、清空B列、删除 J–M 列等）在采用前先用它确认输出不变。
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BUILDER_PATH = os.path.join(BASE_DIR, '2MU.py')
+
+# 替代实现可以覆盖的 2MU.py 中的函数（excel_utils 中的函数通过 2MU 的命名空间调用，同样可以覆盖）
+REPLACEABLE = ('extract_birthday_and_add_to_column', 'split_info_to_next_row', 'split_column_and_add',
+               'convert_names_to_pinyin', 'sheet_title', 'append_group', 'write_individual_file',
+               'copy_sheet', 'render_layout')
+
+# 替代实现也可以只覆盖东航布局的这两个方法，见 layouts.AirlineLayout
+LAYOUT_METHODS = ('format_sheet', 'finish_sheet')
+
+# 仓库中的示例工作簿：(原始数据, 更新公司名称用的发送列表；None 表示已经更新过)
+SAMPLE_INPUTS = [
+    ('(raw_data_after certain replacement)MUwhitelist_updated.xlsx', None),
+    ('raw_data.xlsx', '(mails_storage)MU批量发送列表.xlsx'),
+]
+
+# 合成输入：多证件拆行、身份证与护照混合、没有身份证、单个协议号等情况
+GENERATED_CASES = {
+    'mixed': dict(agreements=20, travellers=300, docs_per_traveller=2),
+    'multi_docs': dict(agreements=10, travellers=200, docs_per_traveller=3,
+                       mix={'身份证': 0.4, '护照': 0.4, '其他': 0.2}),
+    'no_id_card': dict(agreements=8, travellers=150, docs_per_traveller=2,
+                       mix={'身份证': 0.0, '护照': 0.7, '其他': 0.3}),
+    'single': dict(agreements=1, travellers=5, docs_per_traveller=1),
+}
+
+
+def _import_candidate(candidate):
+    """candidate 为模块名或 .py 文件路径"""
+    if candidate.endswith('.py'):
+        name = '_golden_candidate_' + os.path.splitext(os.path.basename(candidate))[0]
+        spec = importlib.util.spec_from_file_location(name, candidate)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        return module
+    return importlib.import_module(candidate)
+
+
+def load_implementation(candidate=None):
+    """
+    加载一份独立的 2MU 模块，两份实现互不影响
+    candidate 中定义的 REPLACEABLE 函数替换 2MU 中的同名函数，定义的 LAYOUT_METHODS 替换东航布局的方法
+
+    Returns:
+        (模块, 被替换的名称列表)
+    """
+    name = '_golden_2MU_' + ('reference' if candidate is None else 'candidate')
+    spec = importlib.util.spec_from_file_location(name, BUILDER_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if candidate is None:
+        return module, []
+
+    overrides = _import_candidate(candidate)
+    replaced = [func for func in REPLACEABLE if hasattr(overrides, func)]
+    for func in replaced:
+        setattr(module, func, getattr(overrides, func))
+
+    methods = {method: getattr(overrides, method) for method in LAYOUT_METHODS if hasattr(overrides, method)}
+    if methods:
+        reference_layout = module.get_layout(DEFAULT_LAYOUT)
+        layout = type(f'Candidate{type(reference_layout).__name__}', (type(reference_layout),), methods)()
+        get_layout = module.get_layout
+        module.get_layout = lambda code: layout if code == DEFAULT_LAYOUT else get_layout(code)
+        replaced += [f'{DEFAULT_LAYOUT}.{method}' for method in methods]
+
+    if not replaced:
+        raise ValueError(f"替代实现 {candidate} 中没有可替换的函数: {', '.join(REPLACEABLE + LAYOUT_METHODS)}")
+    return module, replaced
+
+
+def load_input(raw_path, contact_list=None):
+    """读取原始数据；提供发送列表时先更新公司名称（与 update-names 相同）"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = read_frame(raw_path, RAW_EXPORT)
+        if contact_list is not None:
+            updater = importlib.import_module('1MU_update_company_name')
+            df = updater.apply_company_names(df, updater.load_company_mapping(contact_list))
+    return df
+
+
+def render(module, df, output_dir, repeat=1):
+    """
+    用一份实现生成文件（不过滤历史白名单），返回最短耗时（秒）
+    只比较第一次生成的文件；每次运行前清空拼音缓存，先运行的实现不会替后运行的实现预热
+    """
+    best = None
+    for attempt in range(repeat):
+        run_dir = output_dir if attempt == 0 else f"{output_dir}_{attempt}"
+        os.makedirs(run_dir)
+        index_path = os.path.join(os.path.dirname(run_dir), os.path.basename(run_dir) + '.sqlite3')
+        excel_utils.get_char_pinyin.cache_clear()
+        with WhitelistIndex(index_path) as whitelist_index, contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            module.build(df.copy(), run_dir, whitelist_index, include_known=True)
+            elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _describe(value):
+    return repr(value) if isinstance(value, str) else str(value)
+
+
+def _fill(cell):
+    fill = cell.fill
+    color = fill.fgColor
+    return (fill.fill_type, color.type, color.rgb if color.type == 'rgb' else color.value)
+
+
+def compare_workbooks(expected_path, actual_path, limit=20):
+    """
+    逐个单元格比较两个工作簿：工作表名、合并单元格、值、数字格式、填充
+    返回差异说明列表，最多 limit 条
+    """
+    from openpyxl import load_workbook
+
+    expected_wb = load_workbook(expected_path)
+    actual_wb = load_workbook(actual_path)
+    diffs = []
+    if expected_wb.sheetnames != actual_wb.sheetnames:
+        diffs.append(f"工作表 {expected_wb.sheetnames} != {actual_wb.sheetnames}")
+    for sheet_name in expected_wb.sheetnames:
+        if sheet_name not in actual_wb.sheetnames:
+            continue
+        expected, actual = expected_wb[sheet_name], actual_wb[sheet_name]
+        expected_merged = {str(r) for r in expected.merged_cells.ranges}
+        actual_merged = {str(r) for r in actual.merged_cells.ranges}
+        if expected_merged != actual_merged:
+            diffs.append(f"[{sheet_name}] 合并单元格: 缺少 {sorted(expected_merged - actual_merged)}，"
+                         f"多出 {sorted(actual_merged - expected_merged)}")
+        if (expected.max_row, expected.max_column) != (actual.max_row, actual.max_column):
+            diffs.append(f"[{sheet_name}] 范围 {expected.dimensions} != {actual.dimensions}")
+
+        for row in range(1, max(expected.max_row, actual.max_row) + 1):
+            for col in range(1, max(expected.max_column, actual.max_column) + 1):
+                a, b = expected.cell(row, col), actual.cell(row, col)
+                if a.value != b.value:
+                    diffs.append(f"[{sheet_name}] {a.coordinate} 值 {_describe(a.value)} != {_describe(b.value)}")
+                if a.number_format != b.number_format:
+                    diffs.append(f"[{sheet_name}] {a.coordinate} 数字格式 {a.number_format!r} != {b.number_format!r}")
+                if _fill(a) != _fill(b):
+                    diffs.append(f"[{sheet_name}] {a.coordinate} 填充 {_fill(a)} != {_fill(b)}")
+                if len(diffs) >= limit:
+                    return diffs
+    return diffs
+
+
+def compare_dirs(expected_dir, actual_dir, limit=20):
+    """
+    比较两个输出目录中的所有 .xlsx 文件（按文件名对应）
+
+    Returns:
+        (比较的文件数, {文件名: 差异说明列表})，只列出有差异的文件
+    """
+    def listing(directory):
+        return {name for name in os.listdir(directory) if name.endswith('.xlsx') and not name.startswith('~$')}
+
+    expected, actual = listing(expected_dir), listing(actual_dir)
+    diffs = {}
+    for name in sorted(expected - actual):
+        diffs[name] = ["替代实现没有生成该文件"]
+    for name in sorted(actual - expected):
+        diffs[name] = ["当前实现没有生成该文件"]
+    for name in sorted(expected & actual):
+        file_diffs = compare_workbooks(os.path.join(expected_dir, name), os.path.join(actual_dir, name), limit)
+        if file_diffs:
+            diffs[name] = file_diffs
+    return len(expected | actual), diffs
+
+
+def print_diffs(diffs):
+    for name, file_diffs in diffs.items():
+        print(f"  {name}:")
+        for diff in file_diffs:
+            print(f"    - {diff}")
+
+
+def run_case(name, df, reference, candidate, workdir, repeat=1, limit=20):
+    """对一组输入运行两份实现并比较，返回结果摘要"""
+    if df.empty:
+        print(f"{name:<40} 没有数据行，跳过")
+        return {'case': name, 'skipped': True}
+    expected_dir = os.path.join(workdir, name, 'reference')
+    actual_dir = os.path.join(workdir, name, 'candidate')
+    reference_seconds = render(reference, df, expected_dir, repeat)
+    candidate_seconds = render(candidate, df, actual_dir, repeat)
+    files, diffs = compare_dirs(expected_dir, actual_dir, limit)
+    ratio = candidate_seconds / reference_seconds if reference_seconds else float('nan')
+    status = "一致" if not diffs else f"{len(diffs)} 个文件有差异"
+    print(f"{name:<40} {len(df):>6} 行 {files:>4} 个文件  {status:<14} "
+          f"{reference_seconds:>8.3f}s -> {candidate_seconds:>8.3f}s  x{ratio:.2f}")
+    print_diffs(diffs)
+    return {'case': name, 'files': files, 'diffs': diffs,
+            'reference_seconds': reference_seconds, 'candidate_seconds': candidate_seconds}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='对比当前 2MU.py 与替代实现生成的文件，并报告耗时比值')
+    parser.add_argument('--candidate', help=f"替代实现的模块名或 .py 路径，其中定义要替换的函数：{', '.join(REPLACEABLE)}，"
+                                            f"或东航布局的 {', '.join(LAYOUT_METHODS)}")
+    parser.add_argument('--compare-dirs', nargs=2, metavar=('EXPECTED', 'ACTUAL'),
+                        help='只比较两个已有的输出目录（例如不同提交生成的 output），不运行任何实现')
+    parser.add_argument('--cases', help=f"只运行这些合成输入，逗号分隔，可选 {', '.join(GENERATED_CASES)}")
+    parser.add_argument('--scale', type=float, default=1.0, help='合成输入的旅客数量倍数')
+    parser.add_argument('--no-samples', action='store_true', help='不使用仓库中的示例工作簿')
+    parser.add_argument('--repeat', type=int, default=1, help='每份实现重复运行的次数，取最短耗时')
+    parser.add_argument('--limit', type=int, default=20, help='每个文件最多列出的差异条数')
+    parser.add_argument('--workdir', help='保留生成文件的工作目录，默认使用临时目录')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.compare_dirs:
+        files, diffs = compare_dirs(*args.compare_dirs, limit=args.limit)
+        print(f"比较 {files} 个文件，{len(diffs)} 个有差异")
+        print_diffs(diffs)
+        sys.exit(1 if diffs else 0)
+    if not args.candidate:
+        parser.error('需要 --candidate 或 --compare-dirs')
+
+    reference, _ = load_implementation()
+    candidate, replaced = load_implementation(args.candidate)
+    print(f"替代实现 {args.candidate} 替换了: {', '.join(replaced)}\n")
+
+    cases = args.cases.split(',') if args.cases else list(GENERATED_CASES)
+    unknown = [case for case in cases if case not in GENERATED_CASES]
+    if unknown:
+        parser.error(f"未知的合成输入: {', '.join(unknown)}")
+
+    results = []
+    with contextlib.ExitStack() as stack:
+        workdir = args.workdir or stack.enter_context(tempfile.TemporaryDirectory())
+        os.makedirs(workdir, exist_ok=True)
+        if not args.no_samples:
+            for raw_name, contact_name in SAMPLE_INPUTS:
+                raw_path = os.path.join(BASE_DIR, raw_name)
+                contact_path = os.path.join(BASE_DIR, contact_name) if contact_name else None
+                df = load_input(raw_path, contact_path)
+                results.append(run_case(os.path.splitext(raw_name)[0], df, reference, candidate, workdir,
+                                        args.repeat, args.limit))
+        for case in cases:
+            params = dict(GENERATED_CASES[case])
+            params['travellers'] = max(1, int(params['travellers'] * args.scale))
+            paths = bench_data.write_inputs(os.path.join(workdir, case, 'input'), seed=args.seed, **params)
+            df = load_input(paths['raw'], paths['contacts'])
+            results.append(run_case(case, df, reference, candidate, workdir, args.repeat, args.limit))
+
+    ran = [r for r in results if not r.get('skipped')]
+    failed = [r['case'] for r in ran if r['diffs']]
+    reference_total = sum(r['reference_seconds'] for r in ran)
+    candidate_total = sum(r['candidate_seconds'] for r in ran)
+    if reference_total:
+        print(f"\n合计耗时 {reference_total:.3f}s -> {candidate_total:.3f}s  x{candidate_total / reference_total:.2f}")
+    if failed:
+        print(f"输出不一致: {', '.join(failed)}")
+        sys.exit(1)
+    print("所有输出一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import xlsx_reader
+from metrics import logger, metrics
+from whitelist_index import normalize_agreement
+
+# 输入文件的列声明：每个读取 Excel 的地方都通过这里，只解析需要的列，
+# 协议号统一为字符串，低基数的文本列用 category 保存，缺列时在解析数据之前就报错。
+
+AGREEMENT_COL = '协议号'
+
+
+class SchemaError(ValueError):
+    """输入文件不符合声明的列结构"""
+
+
+class Schema:
+    """
+    一种输入文件的列结构
+    Declared column layout of one input workbook
+
+    columns 为文件的完整列顺序，required 为处理时必需的列；strings 中的列读成字符串，
+    categories 中的列读成 category，not_null 中的列不允许为空。
+    """
+
+    def __init__(self, name, columns, required, strings=(), categories=(), not_null=()):
+        self.name = name
+        self.columns = list(columns)
+        self.required = list(required)
+        self.strings = set(strings)
+        self.categories = set(categories)
+        self.not_null = list(not_null)
+
+    def check(self, path, header, wanted):
+        """检查表头中是否包含 wanted 中的所有列，缺列时抛出 SchemaError"""
+        missing = [column for column in wanted if column not in header]
+        if missing:
+            raise SchemaError(f"{self.name}缺少必要的列: {', '.join(missing)} ({path})")
+
+
+# 原始导出数据，以及 1MU_update_company_name.py 更新公司名称后的数据（列结构相同）。
+# 2MU.py 的 modify_sheets 按列位置处理，所以读取后仍按 columns 的顺序排列，未读取的列留空。
+RAW_EXPORT = Schema(
+    '原始白名单数据',
+    columns=['公司名称', '员工姓名', '英文姓氏', '英文名', '员工生日', '联系电话', '员工类别',
+             '航司二字码', '协议号', '航司名称', '证件信息', '登记日期', '创建类型'],
+    required=['公司名称', '员工姓名', '英文姓氏', '英文名', '员工生日', '协议号', '证件信息'],
+    strings=['员工姓名', '英文姓氏', '英文名', '协议号', '证件信息'],
+    categories=['公司名称'],
+    not_null=['协议号'],
+)
+
+# 批量发送列表：公司名称映射、邮箱映射和邮件发送共用，各阶段只读取自己用到的列
+CONTACT_LIST = Schema(
+    '批量发送列表',
+    columns=['序号', '协议客户名称', '签署区域', '协议号', '客户经理/邮箱', '航司对接人', '航司对接人邮箱',
+             '抄送邮箱', '是否单独发送', '是否自动发送', '备注'],
+    required=['协议号', '协议客户名称', '航司对接人邮箱'],
+    strings=['协议客户名称', '协议号', '航司对接人邮箱', '抄送邮箱', '是否单独发送'],
+)
+
+
+def _check_not_null(path, schema, df):
+    for column in schema.not_null:
+        if column not in df.columns:
+            continue
+        empty = df.index[df[column].isna()]
+        if len(empty):
+            # Excel 行号 = DataFrame 行号 + 表头所在的第 1 行 + 1
+            rows = ', '.join(str(i + 2) for i in empty[:10])
+            raise SchemaError(f"{schema.name}中有 {len(empty)} 行{column}为空（第 {rows} 行）：{path}")
+
+
+def read_frame(path, schema, columns=None, sheet=0, all_columns=False):
+    """
+    按 schema 读取工作表为 DataFrame
+    Read a worksheet with only the declared columns and dtypes
+
+    通过 xlsx_reader.iter_frames 流式解析，不经过 openpyxl 的单元格模型。
+    columns 为 None 时读取 schema.required，结果按 schema.columns 的顺序排列（未读取的列为空）；
+    指定 columns 时只返回这些列。缺少列或必填列为空时抛出 SchemaError。
+    all_columns 为 True 时读取表头中的所有列并保持表头顺序，用于读取后整表写回的文件（1MU_update_company_name.py）：
+    声明的列按 schema 设置类型，其它列保留读取到的值（数字、日期不变）。
+    """
+    import pandas as pd
+
+    header = xlsx_reader.read_header(path, sheet)
+    if all_columns:
+        schema.check(path, header, schema.required)
+        wanted = list(dict.fromkeys(column for column in header if column))
+    else:
+        wanted = list(columns) if columns is not None else schema.required
+        schema.check(path, header, wanted)
+
+    # 流式读取，只解析需要的列；字符串列中的数字保留原文，不经过浮点数
+    strings = [column for column in wanted if column in schema.strings]
+    frames = list(xlsx_reader.iter_frames(path, wanted, sheet=sheet, raw_numbers=strings))
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    for column in wanted:
+        if column in schema.strings:
+            # 空值跳过：astype('str') 会把 None/NaN 变成 'None'/'nan'，非空检查和空的英文名都会失效
+            df[column] = df[column].map(lambda value: str(value).strip() or None, na_action='ignore')
+        if column == AGREEMENT_COL:
+            df[column] = df[column].map(normalize_agreement, na_action='ignore')
+        if column in schema.categories:
+            df[column] = df[column].astype('category')
+    _check_not_null(path, schema, df)
+
+    if not all_columns:
+        df = df.reindex(columns=schema.columns) if columns is None else df[wanted]
+    logger.debug(f"读取 {path}：{len(df)} 行，解析 {len(wanted)}/{len(header)} 列")
+    return df
+
+
+def resolve_inputs(input_path):
+    """
+    输入可以是单个文件、目录（其中所有 .xlsx）或通配符，返回按文件名排序的文件列表
+    Excel 打开文件时生成的 ~$ 临时文件被忽略
+    """
+    if os.path.isdir(input_path):
+        paths = glob.glob(os.path.join(input_path, '*.xlsx'))
+    elif glob.has_magic(input_path):
+        paths = glob.glob(input_path)
+    else:
+        return [input_path] if os.path.exists(input_path) else []
+    return sorted((p for p in paths if not os.path.basename(p).startswith('~$')), key=os.path.basename)
+
+
+def read_frames(paths, schema, workers=None, all_columns=False):
+    """
+    读取多个结构相同的文件并合并
+    Parse several exports in a process pool and merge them in path order
+
+    每个文件在单独的进程中解析，合并顺序与 paths 一致；所有列都相同的重复行
+    （同一旅客的同一证件出现在多个文件中）只保留第一次出现的一行。all_columns 见 read_frame。
+    """
+    import pandas as pd
+
+    if len(paths) == 1:
+        frames = [read_frame(paths[0], schema, all_columns=all_columns)]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(paths))) as pool:
+            frames = list(pool.map(read_frame, paths, [schema] * len(paths), [None] * len(paths),
+                                   [0] * len(paths), [all_columns] * len(paths)))
+    df = pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
+
+    # 各文件的 category 取值不同，合并后重新转换
+    for column in schema.categories:
+        if column in df.columns and df[column].dtype != 'category':
+            df[column] = df[column].astype('category')
+
+    before = len(df)
+    df = df.drop_duplicates(ignore_index=True)
+    if before != len(df):
+        metrics.incr('rows_deduplicated', before - len(df))
+        logger.info(f"{len(paths)} 个文件共 {before} 行，去除重复行 {before - len(df)} 行")
+    return df
+
+
+def read_records(path, schema, columns, sheet=0):
+    """
+    不依赖 pandas 的读取方式，检查列后返回 xlsx_reader.read_records 的结果
+    协议号统一为字符串，其它 strings 中的列去掉两端空白
+    """
+    header, records = xlsx_reader.read_records(path, sheet)
+    schema.check(path, header, columns)
+    for _, row in records:
+        for column in columns:
+            value = row.get(column)
+            if value is None or column not in schema.strings:
+                continue
+            value = normalize_agreement(value) if column == AGREEMENT_COL else str(value).strip()
+            row[column] = value or None
+    return header, records
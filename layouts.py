@@ -0,0 +1,308 @@
+import importlib
+import os
+
+# 航司白名单模板（布局插件）
+# 2MU.py 先把数据整理成与航司无关的 DataFrame，再按每个航司的布局生成文件。
+# 新的航司在单独的模块中继承 AirlineLayout 并用 @register 注册，通过 load_plugins 导入。
+
+# 已注册的布局 {航司二字码: 布局实例}
+_LAYOUTS = {}
+
+DEFAULT_LAYOUT = 'MU'
+
+
+class AirlineLayout:
+    """
+    航司白名单模板
+    Base class for one airline's whitelist template
+
+    2MU.py 的处理顺序：render_layout 为每个协议号生成一个工作表（A列为公司名称），
+    调用 format_sheet（插入表头、按证件类型分配各列），复制为独立文件并删除A列后
+    调用 finish_sheet 设置最终的表头格式，文件名由 file_name 生成。
+    """
+
+    # 航司二字码：文件名前缀，邮件主题和预检按它识别航司
+    code = None
+    name = None
+    # 独立文件的表头 {单元格: 内容}，附件预检时核对
+    header_cells = {}
+    # 独立文件名，agreement 为工作表名（协议号），company 为公司名称
+    file_pattern = '{code}_{agreement}_{company}.xlsx'
+
+    @property
+    def workbook_name(self):
+        """所有协议号的合并工作簿文件名"""
+        return f"{self.code}协议号拆分.xlsx"
+
+    def file_name(self, agreement, company):
+        file_name = self.file_pattern.format(code=self.code, agreement=agreement, company=company or "Empty")
+        return file_name.replace("/", "-")  # 防止非法字符
+
+    def format_sheet(self, sheet):
+        """在合并工作簿的工作表上生成航司模板（删除A列之前）"""
+        raise NotImplementedError
+
+    def finish_sheet(self, sheet):
+        """独立文件删除A列之后设置表头格式"""
+        raise NotImplementedError
+
+
+def register(layout_class):
+    """注册布局的类装饰器"""
+    _LAYOUTS[layout_class.code] = layout_class()
+    return layout_class
+
+
+def load_plugins(modules):
+    """导入布局插件模块（模块中用 @register 注册布局）"""
+    for module in modules or ():
+        importlib.import_module(module)
+
+
+def get_layout(code):
+    try:
+        return _LAYOUTS[code]
+    except KeyError:
+        raise KeyError(f"未注册的航司布局: {code}（可用: {', '.join(available())}）") from None
+
+
+def available():
+    return sorted(_LAYOUTS)
+
+
+def layout_for_file(path):
+    """按文件名前缀（航司二字码）找到生成该文件的布局，找不到时返回 None"""
+    return _LAYOUTS.get(os.path.basename(path).split('_')[0])
+
+
+@register
+class MULayout(AirlineLayout):
+    """东航白名单新增模板（2024.11.21）"""
+
+    code = 'MU'
+    name = '东方航空'
+    header_cells = {
+        'A1': "姓名信息(中英文至少填写一项）",
+        'D1': "证件信息（至少填写一种证件）",
+        'H1': "C0客户必填",
+        'A2': "员工姓名（中）",
+        'B2': "员工姓名（英/拼音）",
+        'C2': "生日",
+        'D2': "身份证号码",
+        'E2': "护照号码",
+        'F2': "其他证件类型（下拉选择）",
+        'G2': "其他证件号",
+        'H2': "所属企业名称",
+        'I2': "企业所在地",
+    }
+
+    def format_sheet(self, sheet):
+        """
+        合并工作簿中的列：A公司名称 B员工姓名 C英文姓氏 D英文名 E员工生日 ... M证件号码 N证件类型，
+        按N列的证件类型把证件号码放到身份证/护照/其他证件列，同一旅客的多行合并，最后删除J-M列
+        """
+        from openpyxl.styles import Alignment, Font, PatternFill
+        from openpyxl.styles.numbers import FORMAT_TEXT
+        from openpyxl.utils.cell import column_index_from_string
+
+        # 取消所有合并单元格
+        if sheet.merged_cells.ranges:
+            merged_cells = list(sheet.merged_cells)
+            for merged_cell in merged_cells:
+                sheet.unmerge_cells(str(merged_cell))
+
+        # 插入新行
+        sheet.insert_rows(1)
+
+        # 在新行的B1, E1, I1设置内容
+        sheet["B1"] = "姓名信息(中英文至少填写一项）"
+        sheet["E1"] = "证件信息（至少填写一种证件）"
+        sheet["I1"] = "C0客户必填"
+
+        # 合并单元格
+        sheet.merge_cells("B1:D1")
+        sheet.merge_cells("E1:H1")
+        sheet.merge_cells("I1:J1")
+
+        # 设置字体样式
+        for cell_range in ["B1:D1", "E1:H1", "I1:J1"]:
+            for row in sheet[cell_range]:
+                for cell in row:
+                    cell.alignment = Alignment(horizontal="center", vertical="center")
+                    cell.font = Font(name="宋体", bold=True)
+
+        # 设置新行的行高
+        sheet.row_dimensions[1].height = 23
+
+        # 修改原来的第一行（现在是第二行）为新内容
+        headers = [
+            "员工姓名（中）", "员工姓名（英/拼音）", "生日", "身份证号码",
+            "护照号码", "其他证件类型（下拉选择）", "其他证件号", "所属企业名称", "企业所在地"
+        ]
+        for col_idx, header in enumerate(headers, start=2):
+            cell = sheet.cell(row=2, column=col_idx)  # 修改第二行
+            cell.value = header
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            cell.font = Font(name="宋体", bold=True)
+
+        # 设置第二行的行高为34.5
+        sheet.row_dimensions[2].height = 34.5
+
+        # 设置列宽
+        for col, width in zip(["B", "C", "D"], [28.75, 28.75, 28.75]):
+            sheet.column_dimensions[col].width = width
+        for col, width in zip(["E", "F", "G", "H"], [28.5, 28.5, 28.5, 28.5]):
+            sheet.column_dimensions[col].width = width
+        for col, width in zip(["I", "J"], [15.5, 15.5]):
+            sheet.column_dimensions[col].width = width
+
+        # 设置E, F, H列单元格格式为纯文本
+        for col_letter in ["E", "F", "H"]:
+            for row in sheet.iter_rows(min_col=column_index_from_string(col_letter),
+                                       max_col=column_index_from_string(col_letter),
+                                       min_row=3):
+                for cell in row:
+                    cell.number_format = FORMAT_TEXT
+
+        # 设置颜色填充
+        red_fill = PatternFill(start_color="FFFF0000", end_color="FFFF0000", fill_type="solid")
+        yellow_fill = PatternFill(start_color="FFFFFF00", end_color="FFFFFF00", fill_type="solid")
+
+        for col_letter in ["B", "C", "E", "F", "G", "H"]:
+            sheet[f"{col_letter}2"].fill = red_fill  # B2, C2, E2-H2填充红色
+        for col_letter in ["D", "I", "J"]:
+            sheet[f"{col_letter}2"].fill = yellow_fill  # D2, I2, J2填充黄色
+
+        # 删除G3:L3及以下单元格内容
+        for row in sheet.iter_rows(min_row=3, max_row=sheet.max_row, min_col=7, max_col=12):  # G列到L列
+            for cell in row:
+                cell.value = None
+
+        # 筛选替换逻辑
+        max_row = sheet.max_row  # 由于后续可能删除行，需要提前获取最大行数
+        for row_index in range(3, max_row + 1):
+            n_value = sheet[f"N{row_index}"].value
+            if n_value == "身份证":  # 检测N列内容是否为"身份证"
+                id_value = sheet[f"M{row_index}"].value  # 获取对应M列单元格的值
+                sheet[f"E{row_index}"].value = id_value  # 将M列值复制到E列
+                sheet[f"C{row_index}"].value = None  # 清空C列单元格内容
+                sheet[f"D{row_index}"].value = None  # 清空D列单元格内容
+                sheet[f"F{row_index}"].value = None  # 清空F列单元格内容
+
+            elif n_value in ["普通护照", "公务护照"]:  # 检测N列内容是否为护照
+                c_value = sheet[f"C{row_index}"].value or ""
+                d_value = sheet[f"D{row_index}"].value or ""
+                # 合并C列和D列内容，转大写并去除空格
+                combined_value = (str(c_value).replace(" ", "") + "/" + str(d_value).replace(" ", "")).upper()# 合并C列和D列内容，中间添加"/"，转大写并去除空格
+                sheet[f"C{row_index}"].value = combined_value  # 设置合并后的值到C列
+                sheet[f"D{row_index}"].value = sheet[f"E{row_index}"].value  # 将E列内容复制到D列
+                sheet[f"F{row_index}"].value = sheet[f"M{row_index}"].value  # 将M列内容复制到F列
+                sheet[f"E{row_index}"].value = None  # 删除E列单元格内容
+
+            elif n_value:  # 如果N列内容既不是身份证也不是护照类型
+                sheet[f"G{row_index}"].value = n_value  # 将N列内容复制到G列
+                sheet[f"H{row_index}"].value = sheet[f"M{row_index}"].value  # 将M列内容复制到H列
+                # 合并C列和D列内容，转大写去空格
+                c_value = sheet[f"C{row_index}"].value or ""
+                d_value = sheet[f"D{row_index}"].value or ""
+                combined_value = (str(c_value).replace(" ", "") + "/" + str(d_value).replace(" ", "")).upper()# 合并C列和D列内容，中间添加"/"，转大写并去除空格
+                sheet[f"C{row_index}"].value = combined_value
+                sheet[f"D{row_index}"].value = sheet[f"E{row_index}"].value  # 将E列内容复制到D列
+                # 删除F列内容
+                sheet[f"F{row_index}"].value = None
+                sheet[f"E{row_index}"].value = None  # 删除E列单元格内容
+
+        # 检查B列相邻单元格内容，当N列内容没有“身份证”时合并相邻行
+        row = 3
+        while row < sheet.max_row:
+            b_value = sheet[f"B{row}"].value
+            n_value = sheet[f"N{row}"].value
+            b_next = sheet[f"B{row + 1}"].value
+            n_next = sheet[f"N{row + 1}"].value
+
+            if b_value == b_next and "身份证" not in [n_value, n_next]:
+                for col in range(2, sheet.max_column + 1):  # 遍历列
+                    current_cell = sheet.cell(row=row, column=col)
+                    next_cell = sheet.cell(row=row + 1, column=col)
+
+                    if current_cell.value is None and next_cell.value is not None:
+                        current_cell.value = next_cell.value  # 将下一行内容合并到当前行
+                sheet.delete_rows(row + 1)  # 删除下一行
+                continue  # 继续检查当前行
+            row += 1
+
+        # 检查B列相邻单元格内容，当相邻行N列内容有“身份证”时保留身份证行
+        rows_to_delete = []
+        row = 3
+        while row < sheet.max_row:
+            b_value = sheet[f"B{row}"].value
+            n_value = sheet[f"N{row}"].value
+            b_next = sheet[f"B{row + 1}"].value
+            n_next = sheet[f"N{row + 1}"].value
+
+            if b_value == b_next:  # 如果B列内容相邻一致
+                if "身份证" in [n_value, n_next]:  # 如果N列中有身份证
+                    if n_value == "身份证":
+                        rows_to_delete.append(row + 1)  # 删除下一行
+                    elif n_next == "身份证":
+                        rows_to_delete.append(row)  # 删除当前行
+                    row += 1  # 跳过下一行
+            row += 1
+
+        # 删除收集到的行
+        for row in sorted(rows_to_delete, reverse=True):
+            sheet.delete_rows(row)
+
+        # 删除B列单元格内容，当对应C列单元格有内容时
+        for row in range(3, sheet.max_row + 1):
+            if sheet[f"C{row}"].value:  # 如果C列有内容
+                sheet[f"B{row}"].value = None  # 删除对应B列内容
+
+        # 删除J-M列
+        sheet.delete_cols(11, 4)  # 从J列开始删除4列
+
+    def finish_sheet(self, sheet):
+        from openpyxl.styles import Alignment, Font
+        from openpyxl.utils import get_column_letter
+
+        # 获取最大列数
+        max_col = sheet.max_column
+
+        # 重新设置首行格式
+        sheet.merge_cells(start_row=1, start_column=1, end_row=1, end_column=3)  # 合并A1到C1
+        sheet.merge_cells(start_row=1, start_column=4, end_row=1, end_column=7)  # 合并D1到G1
+
+        # 检查是否存在H列和I列
+        if max_col >= 8:  # H列的索引是8
+            if max_col >= 9:  # I列的索引是9
+                sheet.merge_cells(start_row=1, start_column=8, end_row=1, end_column=9)  # 合并H1到I1
+            else:
+                # 只有H列存在，不需要合并
+                pass
+        else:
+            # H列不存在，跳过合并
+            pass
+
+        # 设置首行内容
+        sheet.cell(row=1, column=1, value="姓名信息(中英文至少填写一项）")
+        sheet.cell(row=1, column=4, value="证件信息（至少填写一种证件）")
+
+        if max_col >= 8:
+            sheet.cell(row=1, column=8, value="C0客户必填")
+        else:
+            pass  # H列不存在，跳过设置
+
+        # 设置首行字体和对齐方式
+        for col in range(1, max_col + 1):
+            cell = sheet.cell(row=1, column=col)
+            cell.alignment = Alignment(horizontal="center", vertical="center")
+            cell.font = Font(name="宋体", bold=True)
+
+        # 设置列宽
+        for col_idx, width in zip(range(1, max_col + 1), [28.75]*3 + [28.5]*4 + [15.5]*2):
+            if col_idx <= max_col:
+                col_letter = get_column_letter(col_idx)
+                sheet.column_dimensions[col_letter].width = width
+
+        # 设置行高
+        sheet.row_dimensions[1].height = 23
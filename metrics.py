@@ -0,0 +1,180 @@
+import contextlib
+import json
+import logging
+import logging.handlers
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+
+# 所有脚本共用的日志记录器；逐行的进度信息使用 debug，摘要使用 info
+logger = logging.getLogger('whitelist')
+logger.propagate = False
+
+# 默认的指标文件，每次运行追加写入
+DEFAULT_METRICS_FILE = 'whitelist_metrics.jsonl'
+
+
+class _StdoutHandler(logging.StreamHandler):
+    """始终写入当前的 sys.stdout，便于调用方用 redirect_stdout 屏蔽输出"""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+
+def _stdout_handler():
+    handler = _StdoutHandler()
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    return handler
+
+
+# 未调用 setup_logging 时（例如被其他脚本导入），行为与原来的 print 一致：全部立即输出
+logger.addHandler(_stdout_handler())
+logger.setLevel(logging.DEBUG)
+
+
+def setup_logging(quiet=False, buffer_size=500):
+    """
+    配置缓冲日志：普通信息先缓存，满 buffer_size 条或出现 WARNING 以上级别时统一输出
+    Configure leveled, buffered console logging
+
+    Args:
+        quiet: 安静模式，只输出 INFO 及以上级别，省略逐行的进度信息
+        buffer_size: 缓冲的日志条数
+    """
+    for handler in list(logger.handlers):
+        handler.flush()
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.MemoryHandler(buffer_size, flushLevel=logging.WARNING,
+                                                     target=_stdout_handler()))
+    logger.setLevel(logging.INFO if quiet else logging.DEBUG)
+
+
+def flush_logs():
+    """立即输出缓冲中的日志（等待用户输入之前调用）"""
+    for handler in logger.handlers:
+        handler.flush()
+
+
+class Metrics:
+    """
+    运行指标：阶段计时器和计数器
+    Stage timers and counters collected during one run
+
+    计时器按名称聚合（次数、总耗时、最大耗时），嵌套的计时器名称用"/"连接，
+    因此在循环中为每个工作表计时也不会产生大量记录。
+    设置 profiler（profiling.StageProfiler）后，主线程中最外层的计时阶段同时被剖析。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.profiler = None
+        self.reset()
+
+    def reset(self, script=None):
+        with self._lock:
+            self.script = script
+            self.run_id = uuid.uuid4().hex[:12]
+            self.started_at = time.time()
+            self.timers = {}
+            self.counters = Counter()
+
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        stack = self._stack()
+        full_name = '/'.join(stack + [name])
+        profiled = self.profiler is not None and not stack and threading.current_thread() is threading.main_thread()
+        stack.append(name)
+        started = time.perf_counter()
+        try:
+            with self.profiler.stage(name) if profiled else contextlib.nullcontext():
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            stack.pop()
+            with self._lock:
+                entry = self.timers.setdefault(full_name, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+                entry['count'] += 1
+                entry['seconds'] += elapsed
+                entry['max_seconds'] = max(entry['max_seconds'], elapsed)
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def records(self):
+        """返回本次运行的 JSON 记录列表：每个计时器一条、计数器一条、运行摘要一条"""
+        base = {'run_id': self.run_id, 'script': self.script}
+        lines = []
+        with self._lock:
+            for name, entry in self.timers.items():
+                lines.append({**base, 'type': 'timer', 'name': name, 'count': entry['count'],
+                              'seconds': round(entry['seconds'], 6), 'max_seconds': round(entry['max_seconds'], 6)})
+            lines.append({**base, 'type': 'counters', 'values': dict(self.counters)})
+            lines.append({**base, 'type': 'run',
+                          'started_at': datetime.fromtimestamp(self.started_at).isoformat(timespec='seconds'),
+                          'seconds': round(time.time() - self.started_at, 6)})
+        return lines
+
+    def write_jsonl(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, 'a', encoding='utf-8') as f:
+            for record in self.records():
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+
+# 所有脚本共用的指标实例
+metrics = Metrics()
+
+
+def add_arguments(parser):
+    """为脚本的命令行添加 --quiet、--metrics-file 和 --profile 参数"""
+    parser.add_argument('--quiet', action='store_true', help='安静模式：不输出逐行的处理信息')
+    parser.add_argument('--metrics-file', default=DEFAULT_METRICS_FILE,
+                        help=f'运行结束时追加写入的JSON-lines指标文件，默认为 {DEFAULT_METRICS_FILE}')
+    parser.add_argument('--profile', nargs='?', const='profile', metavar='DIR',
+                        help='用 cProfile 和 tracemalloc 剖析每个阶段，结果写入 DIR（默认为 profile），结束时打印热点摘要')
+
+
+def start_run(script, quiet=False, profile_dir=None):
+    """开始一次运行：重置指标并配置日志；指定 profile_dir 时开启性能剖析"""
+    metrics.reset(script)
+    setup_logging(quiet)
+    if metrics.profiler is not None:
+        metrics.profiler.close()
+        metrics.profiler = None
+    if profile_dir:
+        from profiling import StageProfiler
+        metrics.profiler = StageProfiler(profile_dir)
+
+
+def finish_run(metrics_file=DEFAULT_METRICS_FILE):
+    """结束一次运行：输出剩余日志、打印计时摘要并写入指标文件"""
+    for name, entry in list(metrics.timers.items()):
+        if '/' not in name:
+            logger.info(f"[计时] {name}: {entry['seconds']:.3f} 秒")
+    if metrics.counters:
+        logger.info("[计数] " + "，".join(f"{k}={v}" for k, v in sorted(metrics.counters.items())))
+    if metrics.profiler is not None:
+        for line in metrics.profiler.write_reports(metrics.script):
+            logger.info(line)
+    if metrics_file:
+        metrics.write_jsonl(metrics_file)
+        logger.info(f"指标已写入：{metrics_file}")
+    flush_logs()
@@ -0,0 +1,184 @@
+import argparse
+import csv
+import os
+import time
+import zipfile
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from xml.etree import ElementTree
+
+from layouts import DEFAULT_LAYOUT, get_layout, layout_for_file
+from metrics import add_arguments, finish_run, logger, metrics, start_run
+from send_records import open_attachment
+from xlsx_reader import read_shared_strings, sheet_paths
+
+# 2MU.py 生成的独立文件只有一个工作表
+EXPECTED_SHEETS = 1
+
+# 2MU.py 生成的东航独立文件前两行表头（删除A列之后），{单元格: 内容}
+MU_HEADER_CELLS = get_layout('MU').header_cells
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+
+PreflightResult = namedtuple('PreflightResult', ['path', 'ok', 'problems', 'size'])
+
+
+def _header_rows(cells):
+    return max(int(''.join(ch for ch in ref if ch.isdigit())) for ref in cells)
+
+
+def read_header_cells(archive, sheet_path, max_row):
+    """流式读取工作表前 max_row 行的单元格文本，读到后面的行即停止"""
+    values = {}
+    shared = {}
+    row_number = 0
+    with archive.open(sheet_path) as f:
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag != f'{_NS}row':
+                continue
+            row_number = int(elem.get('r') or row_number + 1)
+            if row_number > max_row:
+                break
+            for cell in elem.iter(f'{_NS}c'):
+                ref, cell_type = cell.get('r'), cell.get('t')
+                if cell_type == 'inlineStr':
+                    values[ref] = ''.join(t.text or '' for t in cell.iter(f'{_NS}t'))
+                    continue
+                v = cell.find(f'{_NS}v')
+                if v is None or v.text is None:
+                    continue
+                if cell_type == 's':
+                    shared[ref] = int(v.text)
+                else:
+                    values[ref] = v.text
+            elem.clear()
+    strings = read_shared_strings(archive, shared.values())
+    for ref, index in shared.items():
+        values[ref] = strings.get(index, '')
+    return values
+
+
+def expected_header(path):
+    """按文件名前缀（航司二字码）找到对应布局的表头，无法识别时按东航模板检查"""
+    layout = layout_for_file(path) or get_layout(DEFAULT_LAYOUT)
+    return layout.header_cells
+
+
+def preflight_file(path, expected_sheets=EXPECTED_SHEETS, header_cells=None):
+    """
+    检查一个将要发送的附件
+    Check one attachment without loading it through openpyxl
+
+    检查项：文件可读、zip 中央目录和每个成员的 CRC、工作表数量、前两行表头与 2MU.py 的格式一致。
+    header_cells 为 None 时按文件名对应的航司布局检查表头；path 也可以是内存附件。
+    """
+    if header_cells is None:
+        header_cells = expected_header(path)
+    problems = []
+    try:
+        with open_attachment(path) as f:
+            magic = f.read(4)
+            size = f.seek(0, os.SEEK_END)
+    except OSError as e:
+        return PreflightResult(path, False, [f"文件无法读取: {e}"], 0)
+    if size == 0:
+        return PreflightResult(path, False, ["文件为空"], 0)
+    if magic != b'PK\x03\x04':
+        return PreflightResult(path, False, ["不是xlsx(zip)文件"], size)
+
+    try:
+        with open_attachment(path) as f, zipfile.ZipFile(f) as archive:
+            bad_member = archive.testzip()
+            if bad_member is not None:
+                return PreflightResult(path, False, [f"CRC校验失败: {bad_member}"], size)
+            sheets = sheet_paths(archive)
+            if len(sheets) != expected_sheets:
+                problems.append(f"工作表数量为 {len(sheets)}，应为 {expected_sheets}")
+            if sheets and header_cells:
+                values = read_header_cells(archive, sheets[0][1], _header_rows(header_cells))
+                for ref, expected in header_cells.items():
+                    actual = (values.get(ref) or '').strip()
+                    if actual != expected:
+                        problems.append(f"表头 {ref} 为 '{actual}'，应为 '{expected}'")
+    except (zipfile.BadZipFile, zlib.error, EOFError) as e:
+        problems.append(f"zip结构损坏: {e}")
+    except KeyError as e:
+        problems.append(f"缺少工作簿部件: {e}")
+    except ElementTree.ParseError as e:
+        problems.append(f"XML解析失败: {e}")
+    return PreflightResult(path, not problems, problems, size)
+
+
+def run_preflight(paths, workers=None, expected_sheets=EXPECTED_SHEETS, header_cells=None):
+    """
+    在线程池中检查所有附件，按输入顺序返回 PreflightResult 列表
+    解压和 CRC 计算在 zlib 中进行，不持有 GIL，因此线程池可以并行
+    """
+    paths = list(dict.fromkeys(paths))
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    with metrics.timer('preflight'), ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda p: preflight_file(p, expected_sheets, header_cells), paths))
+    metrics.incr('preflight_passed', sum(1 for r in results if r.ok))
+    metrics.incr('preflight_failed', sum(1 for r in results if not r.ok))
+    return results
+
+
+def report(results, elapsed=None):
+    """打印检查报告：失败的文件逐个列出，最后一行为总体结论。返回是否全部通过"""
+    failed = [r for r in results if not r.ok]
+    for result in failed:
+        logger.error(f"未通过: {result.path}")
+        for problem in result.problems:
+            logger.error(f"  - {problem}")
+    timing = f"，耗时 {elapsed:.2f} 秒" if elapsed is not None else ""
+    verdict = "通过" if not failed else "未通过"
+    logger.info(f"\n附件预检{verdict}: 共 {len(results)} 个文件，"
+                f"通过 {len(results) - len(failed)} 个，失败 {len(failed)} 个{timing}")
+    return not failed
+
+
+def write_report(results, report_path):
+    """将检查结果写入CSV文件（utf-8-sig，便于用Excel打开）"""
+    with open(report_path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['文件', '结果', '大小', '问题'])
+        for result in results:
+            writer.writerow([result.path, '通过' if result.ok else '失败', result.size, '；'.join(result.problems)])
+    logger.info(f"预检报告已保存到：{report_path}")
+
+
+def find_attachments(directory):
+    """列出目录下（含子目录）所有将被发送的Excel文件，跳过"已批量发送"目录和临时文件"""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = [d for d in dirs if d != '已批量发送']
+        for name in files:
+            if name.lower().endswith(('.xls', '.xlsx', '.xlsm')) and not name.startswith('~$'):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='发送前检查附件是否为完整、格式正确的白名单文件')
+    parser.add_argument('paths', nargs='+', help='要检查的文件或目录（目录会递归查找Excel文件）')
+    parser.add_argument('--workers', type=int, help='线程数，默认为CPU核数的4倍（最多32）')
+    parser.add_argument('--report', help='将检查结果写入指定的CSV文件')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    start_run('preflight', quiet=args.quiet, profile_dir=args.profile)
+    paths = []
+    for path in args.paths:
+        paths.extend(find_attachments(path) if os.path.isdir(path) else [path])
+    started = time.perf_counter()
+    results = run_preflight(paths, args.workers)
+    ok = report(results, time.perf_counter() - started)
+    if args.report:
+        write_report(results, args.report)
+    finish_run(args.metrics_file)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+import contextlib
+import cProfile
+import os
+import pstats
+import re
+import time
+import tracemalloc
+from datetime import datetime
+
+# 性能剖析（--profile）：每个最外层的计时阶段（metrics.timer）在 cProfile 和 tracemalloc 下运行，
+# 结束时写出 .prof 文件（可用 snakeviz、pstats 查看）和内存分配报告，并打印热点摘要。
+# 剖析本身会让运行慢很多，得到的耗时只用于比较各函数的占比。
+
+DEFAULT_PROFILE_DIR = 'profile'
+
+# 内存分配报告中列出的行数
+TOP_ALLOCATIONS = 25
+
+# 热点摘要中每个阶段列出的函数数
+TOP_FUNCTIONS = 5
+
+# tracemalloc 保存的调用栈深度；报告按分配所在的行汇总，只需要一层
+TRACE_FRAMES = 1
+
+
+def _file_part(name):
+    """阶段名、脚本名中不能用作文件名的字符替换为下划线"""
+    return re.sub(r'[\\/:*?"<>|\s]+', '_', name).strip('_') or 'run'
+
+
+def _mb(size):
+    return size / 1024 / 1024
+
+
+class _StageRecord:
+    __slots__ = ('profile', 'calls', 'seconds', 'peak', 'net', 'allocations')
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.calls = 0
+        self.seconds = 0.0
+        self.peak = 0
+        self.net = None
+        self.allocations = []
+
+
+class StageProfiler:
+    """
+    按阶段收集 cProfile 统计和 tracemalloc 内存分配
+    Collect cProfile stats and tracemalloc snapshots for each top-level stage
+
+    同名阶段多次运行时 cProfile 统计累加，内存峰值取最大值，分配报告保留净分配最多的一次。
+    只剖析主线程中的阶段；进程池中的子进程不在剖析范围内。
+    """
+
+    def __init__(self, directory=DEFAULT_PROFILE_DIR, top=TOP_ALLOCATIONS):
+        self.directory = directory
+        self.top = top
+        self.stages = {}
+        self._owns_tracemalloc = False
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACE_FRAMES)
+            self._owns_tracemalloc = True
+        record = self.stages.setdefault(name, _StageRecord())
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        started = time.perf_counter()
+        record.profile.enable()
+        try:
+            yield
+        finally:
+            record.profile.disable()
+            record.seconds += time.perf_counter() - started
+            record.calls += 1
+            _, peak = tracemalloc.get_traced_memory()
+            record.peak = max(record.peak, peak - baseline)
+            # 排除 tracemalloc 自身和导入机制的分配
+            ignore = (tracemalloc.Filter(False, tracemalloc.__file__),
+                      tracemalloc.Filter(False, '<frozen importlib._bootstrap*>'))
+            after = tracemalloc.take_snapshot().filter_traces(ignore)
+            differences = after.compare_to(before.filter_traces(ignore), 'lineno')
+            net = sum(stat.size_diff for stat in differences)
+            if record.net is None or net > record.net:
+                record.net = net
+                record.allocations = differences[:self.top]
+
+    def hotspots(self, name, limit=TOP_FUNCTIONS):
+        """阶段中自身耗时最多的函数 [(自身耗时, 累计耗时, 调用次数, 'file:line(func)')]"""
+        stats = pstats.Stats(self.stages[name].profile)
+        rows = []
+        for (filename, line, func), (_, calls, tottime, cumtime, _) in stats.stats.items():
+            if filename == __file__ or func == "<method 'disable' of '_lsprof.Profiler' objects>":
+                continue
+            location = f"{os.path.basename(filename)}:{line}({func})" if line else func
+            rows.append((tottime, cumtime, calls, location))
+        rows.sort(reverse=True)
+        return rows[:limit]
+
+    def write_reports(self, script):
+        """
+        写出每个阶段的 .prof 和 .alloc.txt，返回热点摘要的文本行列表，然后清空已收集的数据
+        文件名为 <脚本>_<时间>_<阶段>，监控模式下每个批次写一组
+        """
+        if not self.stages:
+            return []
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = f"{_file_part(script or 'run')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        lines = []
+        for name, record in self.stages.items():
+            base = os.path.join(self.directory, f"{prefix}_{_file_part(name)}")
+            record.profile.dump_stats(base + '.prof')
+            with open(base + '.alloc.txt', 'w', encoding='utf-8') as f:
+                f.write(f"{name}: {record.calls} 次，{record.seconds:.3f} 秒，"
+                        f"内存峰值 {_mb(record.peak):.1f} MB，净分配 {_mb(record.net or 0):+.1f} MB\n")
+                f.write(f"净分配最多的一次运行中分配最多的 {len(record.allocations)} 行：\n")
+                for stat in record.allocations:
+                    f.write(f"{stat}\n")
+
+            lines.append(f"[剖析] {name}: {record.seconds:.3f} 秒，内存峰值 {_mb(record.peak):.1f} MB，"
+                         f"净分配 {_mb(record.net or 0):+.1f} MB")
+            for tottime, cumtime, calls, location in self.hotspots(name):
+                lines.append(f"    自身 {tottime:8.3f}s  累计 {cumtime:8.3f}s  {calls:>8} 次  {location}")
+        lines.append(f"剖析结果已写入：{self.directory}（{prefix}_*.prof / *.alloc.txt）")
+        self.stages = {}
+        return lines
+
+    def close(self):
+        if self._owns_tracemalloc:
+            tracemalloc.stop()
+            self._owns_tracemalloc = False
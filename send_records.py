@@ -0,0 +1,166 @@
+import io
+import os
+
+
+class InMemoryFile(str):
+    """
+    内存中生成的附件
+    An attachment held in memory, addressed by the path it is archived to after delivery
+
+    字符串值为归档路径（target/邮箱/文件名），与按邮箱分类后磁盘上的路径相同，
+    因此文件表、分组键和日志中按路径处理附件的地方不需要区分；内容保存在 data 中。
+    """
+
+    def __new__(cls, path, data):
+        self = super().__new__(cls, path)
+        self.data = data
+        return self
+
+    def save(self):
+        """写入归档路径"""
+        os.makedirs(os.path.dirname(self), exist_ok=True)
+        with open(self, 'wb') as f:
+            f.write(self.data)
+
+
+def attachment_content(path):
+    """内存附件返回内容字节串，磁盘文件返回路径本身（delivery_store.file_sha256 两者都接受）"""
+    return path.data if isinstance(path, InMemoryFile) else path
+
+
+def open_attachment(path):
+    """以二进制方式打开附件"""
+    return io.BytesIO(path.data) if isinstance(path, InMemoryFile) else open(path, 'rb')
+
+
+def attachment_size(path):
+    """附件字节数，文件不存在时为 0"""
+    if isinstance(path, InMemoryFile):
+        return len(path.data)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+class FileTable:
+    """
+    附件文件表：每个路径只保存一次，分组中只保存它在表中的索引
+    Shared table of attachment paths referenced by index
+    """
+
+    __slots__ = ('paths', '_index')
+
+    def __init__(self):
+        self.paths = []
+        self._index = {}
+
+    def add(self, path):
+        """加入一个路径并返回其索引，已存在时返回原索引"""
+        index = self._index.get(path)
+        if index is None:
+            index = len(self.paths)
+            self.paths.append(path)
+            self._index[path] = index
+        return index
+
+    def __getitem__(self, index):
+        return self.paths[index]
+
+    def __len__(self):
+        return len(self.paths)
+
+
+class SendGroup:
+    """
+    一封待发送的邮件：抄送字符串、附件索引（按加入顺序去重）、是否单独发送
+    """
+
+    __slots__ = ('cc', 'files', 'separate')
+
+    def __init__(self, cc='', separate=False, files=()):
+        self.cc = cc
+        self.separate = separate
+        # dict 作为有序集合，重复加入的附件只保留一次
+        self.files = dict.fromkeys(files)
+
+    def add(self, indices):
+        for index in indices:
+            self.files[index] = None
+
+    @property
+    def match_found(self):
+        return bool(self.files)
+
+    def __repr__(self):
+        return f"SendGroup(cc={self.cc!r}, separate={self.separate}, files={list(self.files)})"
+
+
+class RecipientResult:
+    """一个收件人的验证结果：文件夹是否存在，以及 {分组键: SendGroup}"""
+
+    __slots__ = ('folder_exists', 'groups')
+
+    def __init__(self, folder_exists):
+        self.folder_exists = folder_exists
+        self.groups = {}
+
+
+class ValidationResults:
+    """
+    verify_email_agreement_match 的结果
+    Validation results keyed by recipient, sharing one attachment file table
+
+    分组键与原来一致：普通分组为抄送字符串，单独发送的分组为"抄送_文件名"。
+    """
+
+    __slots__ = ('files', 'recipients')
+
+    def __init__(self, files=None):
+        self.files = files if files is not None else FileTable()
+        self.recipients = {}
+
+    def recipient(self, email, folder_exists):
+        """取得收件人的结果，不存在时创建"""
+        result = self.recipients.get(email)
+        if result is None:
+            result = self.recipients[email] = RecipientResult(folder_exists)
+        return result
+
+    def items(self):
+        return self.recipients.items()
+
+    def paths(self, group):
+        """分组的附件路径列表"""
+        return [self.files[index] for index in group.files]
+
+    def message_count(self):
+        """将要发送的邮件数量（文件夹存在且找到匹配附件的分组数）"""
+        return sum(1 for result in self.recipients.values() if result.folder_exists
+                   for group in result.groups.values() if group.match_found)
+
+    def __len__(self):
+        return len(self.recipients)
+
+
+class SendReport:
+    """
+    一次发送的结果：成功、失败的邮件数，跳过的分组数，以及发送成功的邮件中的附件
+    Message counts of one send run and the attachments that were actually delivered
+
+    skipped 为文件夹不存在或本批次没有匹配附件的分组，不算发送失败。
+    delivered 用于发送后把这些文件中的旅客记入历史白名单；测试模式不发送邮件，delivered 为空。
+    """
+
+    __slots__ = ('sent', 'failed', 'skipped', 'delivered')
+
+    def __init__(self, sent=0, failed=0, skipped=0):
+        self.sent = sent
+        self.failed = failed
+        self.skipped = skipped
+        self.delivered = []
+
+    def summary(self):
+        text = f"成功 {self.sent} 封，失败 {self.failed} 封"
+        return text + f"，跳过 {self.skipped} 个分组" if self.skipped else text
+
+    def __repr__(self):
+        return (f"SendReport(sent={self.sent}, failed={self.failed}, skipped={self.skipped}, "
+                f"delivered={len(self.delivered)})")
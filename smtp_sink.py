@@ -0,0 +1,332 @@
+import argparse
+import base64
+import random
+import re
+import select
+import socketserver
+import threading
+import time
+from collections import namedtuple
+from email import message_from_bytes, policy
+
+# 收到的一封邮件：信封发件人、信封收件人、原始内容、开始时间(MAIL FROM)、完成时间
+ReceivedMessage = namedtuple('ReceivedMessage', ['mail_from', 'rcpt_tos', 'data', 'started_at', 'finished_at'])
+
+
+def parse_message(received):
+    """将收到的原始邮件解析为 EmailMessage，便于断言主题、抄送和附件"""
+    return message_from_bytes(received.data, policy=policy.default)
+
+
+class _SinkHandler(socketserver.BaseRequestHandler):
+    """单个 SMTP 会话。应答先缓存，等需要读取客户端输入时才统一发出，每次发出模拟一次网络往返"""
+
+    def setup(self):
+        self.sink = self.server.sink
+        self.buffer = b''
+        self.pending = []
+        self.authenticated = self.sink.auth is None
+        self.reset_transaction()
+
+    def reset_transaction(self):
+        self.mail_from = None
+        self.rcpt_tos = []
+        self.chunks = []
+        self.started_at = None
+
+    # ---- 底层读写 ----
+    def reply(self, line):
+        self.pending.append(line.encode('utf-8') + b"\r\n")
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.sink.latency:
+            time.sleep(self.sink.latency)
+        self.request.sendall(b''.join(self.pending))
+        self.pending = []
+
+    def fill(self):
+        # 客户端已经流水线发出的数据直接读取，只有真正需要等待客户端时才发出应答
+        readable, _, _ = select.select([self.request], [], [], 0)
+        if not readable:
+            self.flush()
+        data = self.request.recv(65536)
+        if not data:
+            raise ConnectionError("客户端已断开")
+        self.buffer += data
+
+    def read_line(self):
+        while b"\r\n" not in self.buffer:
+            self.fill()
+        line, self.buffer = self.buffer.split(b"\r\n", 1)
+        return line
+
+    def read_bytes(self, size):
+        while len(self.buffer) < size:
+            self.fill()
+        data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+    # ---- 会话 ----
+    def handle(self):
+        self.reply(f"220 {self.sink.hostname} ESMTP whitelist sink")
+        try:
+            while True:
+                line = self.read_line().decode('utf-8', 'replace')
+                verb, _, arg = line.partition(' ')
+                handler = getattr(self, f"smtp_{verb.upper()}", None)
+                if handler is None:
+                    self.reply("500 command not recognized")
+                    continue
+                if handler(arg.strip()) == 'quit':
+                    self.flush()
+                    return
+        except (ConnectionError, OSError):
+            return
+
+    def smtp_EHLO(self, arg):
+        lines = [self.sink.hostname]
+        if self.sink.size_limit:
+            lines.append(f"SIZE {self.sink.size_limit}")
+        lines.append("8BITMIME")
+        lines.append("SMTPUTF8")
+        if self.sink.pipelining:
+            lines.append("PIPELINING")
+        if self.sink.chunking:
+            lines.append("CHUNKING")
+        lines.append("AUTH PLAIN LOGIN")
+        for line in lines[:-1]:
+            self.reply(f"250-{line}")
+        self.reply(f"250 {lines[-1]}")
+        self.reset_transaction()
+
+    def smtp_HELO(self, arg):
+        self.reply(f"250 {self.sink.hostname}")
+        self.reset_transaction()
+
+    def smtp_NOOP(self, arg):
+        self.reply("250 OK")
+
+    def smtp_RSET(self, arg):
+        self.reset_transaction()
+        self.reply("250 OK")
+
+    def smtp_QUIT(self, arg):
+        self.reply("221 Bye")
+        return 'quit'
+
+    def smtp_AUTH(self, arg):
+        mechanism, _, initial = arg.partition(' ')
+        mechanism = mechanism.upper()
+        if mechanism == 'PLAIN':
+            if not initial:
+                self.reply("334 ")
+                initial = self.read_line().decode('ascii')
+            parts = base64.b64decode(initial).split(b'\0')
+            username, password = parts[-2].decode('utf-8'), parts[-1].decode('utf-8')
+        elif mechanism == 'LOGIN':
+            if initial:
+                username = base64.b64decode(initial).decode('utf-8')
+            else:
+                self.reply("334 " + base64.b64encode(b"Username:").decode('ascii'))
+                username = base64.b64decode(self.read_line()).decode('utf-8')
+            self.reply("334 " + base64.b64encode(b"Password:").decode('ascii'))
+            password = base64.b64decode(self.read_line()).decode('utf-8')
+        else:
+            self.reply("504 unrecognized authentication type")
+            return
+        if self.sink.auth is not None and (username, password) != tuple(self.sink.auth):
+            self.reply("535 authentication credentials invalid")
+            return
+        self.authenticated = True
+        self.reply("235 authentication successful")
+
+    def smtp_MAIL(self, arg):
+        if not self.authenticated:
+            self.reply("530 authentication required")
+            return
+        match = re.match(r'FROM:\s*<([^>]*)>(.*)$', arg, re.IGNORECASE)
+        if not match:
+            self.reply("501 syntax: MAIL FROM:<address>")
+            return
+        size = re.search(r'\bSIZE=(\d+)', match.group(2), re.IGNORECASE)
+        if size and self.sink.size_limit and int(size.group(1)) > self.sink.size_limit:
+            self.reply("552 message size exceeds fixed maximum message size")
+            return
+        self.reset_transaction()
+        self.mail_from = match.group(1)
+        self.started_at = time.perf_counter()
+        self.reply("250 OK")
+
+    def smtp_RCPT(self, arg):
+        if self.mail_from is None:
+            self.reply("503 need MAIL command")
+            return
+        match = re.match(r'TO:\s*<([^>]*)>', arg, re.IGNORECASE)
+        if not match:
+            self.reply("501 syntax: RCPT TO:<address>")
+            return
+        address = match.group(1)
+        if address.lower() in self.sink.fail_recipients:
+            self.reply("550 mailbox unavailable")
+            return
+        self.rcpt_tos.append(address)
+        self.reply("250 OK")
+
+    def smtp_DATA(self, arg):
+        if self.mail_from is None or not self.rcpt_tos:
+            self.reply("554 no valid recipients")
+            return
+        self.reply("354 End data with <CR><LF>.<CR><LF>")
+        lines = []
+        while True:
+            line = self.read_line()
+            if line == b'.':
+                break
+            lines.append(line[1:] if line.startswith(b'.') else line)
+        self.finish_message(b"\r\n".join(lines) + b"\r\n")
+
+    def smtp_BDAT(self, arg):
+        parts = arg.split()
+        size = int(parts[0])
+        last = len(parts) > 1 and parts[1].upper() == 'LAST'
+        chunk = self.read_bytes(size)
+        if self.mail_from is None or not self.rcpt_tos:
+            self.reply("554 no valid recipients")
+            return
+        self.chunks.append(chunk)
+        if last:
+            self.finish_message(b''.join(self.chunks))
+        else:
+            self.reply(f"250 {size} octets received")
+
+    def finish_message(self, data):
+        if self.sink.size_limit and len(data) > self.sink.size_limit:
+            self.reply("552 message size exceeds fixed maximum message size")
+        elif self.sink.should_fail():
+            self.reply("451 requested action aborted: injected failure")
+        else:
+            self.sink.store(ReceivedMessage(self.mail_from, list(self.rcpt_tos), data,
+                                            self.started_at, time.perf_counter()))
+            self.reply("250 OK queued")
+        self.reset_transaction()
+
+
+class _SinkServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+    本地 SMTP 替身服务器，用于测量和回归测试邮件发送性能
+    Local SMTP stand-in that stores every accepted message for later assertions
+
+    Args:
+        host, port: 监听地址，端口为0时自动分配
+        latency: 每次网络往返附加的延迟秒数
+        fail_rate: 邮件在正文结束时被随机拒绝(451)的概率
+        fail_recipients: 一律拒绝(550)的收件人地址
+        size_limit: SIZE 扩展声明的最大字节数，超出时返回552
+        auth: (用户名, 密码)，为 None 时接受任意凭据
+        pipelining, chunking: 是否声明对应的 ESMTP 扩展
+        seed: 失败注入的随机种子
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0, fail_recipients=(),
+                 size_limit=0, auth=None, pipelining=True, chunking=True, seed=None):
+        self.hostname = 'whitelist-sink.local'
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_recipients = {addr.lower() for addr in fail_recipients}
+        self.size_limit = size_limit
+        self.auth = auth
+        self.pipelining = pipelining
+        self.chunking = chunking
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._messages = []
+        self._server = _SinkServer((host, port), _SinkHandler)
+        self._server.sink = self
+        self._thread = None
+
+    @property
+    def host(self):
+        return self._server.server_address[0]
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def messages(self):
+        with self._lock:
+            return list(self._messages)
+
+    def store(self, received):
+        with self._lock:
+            self._messages.append(received)
+
+    def should_fail(self):
+        if not self.fail_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.fail_rate
+
+    def clear(self):
+        with self._lock:
+            self._messages.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地SMTP替身服务器')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=2525)
+    parser.add_argument('--latency', type=float, default=0.0, help='每次往返附加的延迟秒数')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='随机拒绝邮件的概率')
+    parser.add_argument('--fail-recipient', action='append', default=[], help='始终拒绝的收件人，可重复')
+    parser.add_argument('--size-limit', type=int, default=0, help='最大邮件字节数，0表示不限')
+    parser.add_argument('--auth', help='要求的凭据，格式为 用户名:密码')
+    parser.add_argument('--no-pipelining', action='store_true')
+    parser.add_argument('--no-chunking', action='store_true')
+    args = parser.parse_args()
+
+    sink = SMTPSink(args.host, args.port, latency=args.latency, fail_rate=args.fail_rate,
+                    fail_recipients=args.fail_recipient, size_limit=args.size_limit,
+                    auth=tuple(args.auth.split(':', 1)) if args.auth else None,
+                    pipelining=not args.no_pipelining, chunking=not args.no_chunking)
+    sink.start()
+    print(f"SMTP替身服务器已启动: {sink.host}:{sink.port}，按 Ctrl+C 退出")
+    seen = 0
+    try:
+        while True:
+            time.sleep(1)
+            messages = sink.messages
+            for received in messages[seen:]:
+                subject = parse_message(received)['Subject']
+                print(f"收到邮件: {received.mail_from} -> {received.rcpt_tos}，主题: {subject}，{len(received.data)} 字节")
+            seen = len(messages)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.stop()
+
+
+if __name__ == "__main__":
+    main()
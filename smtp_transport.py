@@ -0,0 +1,139 @@
+import re
+import smtplib
+
+# BDAT 每个分块的最大字节数
+CHUNK_SIZE = 1024 * 1024
+
+
+def _fix_eols(data):
+    """统一换行符为 CRLF"""
+    return re.sub(r'(?:\r\n|\n|\r(?!\n))', "\r\n", data)
+
+
+def _quote_periods(bindata):
+    """DATA 模式下对行首的"."做转义"""
+    return re.sub(br'(?m)^\.', b'..', bindata)
+
+
+class PipeliningSMTP(smtplib.SMTP):
+    """
+    支持 ESMTP PIPELINING / CHUNKING 的 SMTP 连接
+    SMTP connection that batches envelope commands when the server offers PIPELINING
+
+    - 服务器支持 PIPELINING 时，MAIL FROM、所有 RCPT TO 和 DATA 一次性发出，只等待一次往返
+    - 同时支持 CHUNKING 时，正文使用 BDAT 发送，连同信封命令一起流水线发出
+    - 都不支持时，退回 smtplib.SMTP 的逐条命令发送
+    返回值与异常与 smtplib.SMTP.sendmail 保持一致：被拒绝的收件人以 {地址: (代码, 信息)} 返回，
+    全部被拒绝时抛出 SMTPRecipientsRefused。
+    """
+
+    def __init__(self, *args, use_pipelining=True, use_chunking=True, **kwargs):
+        self.use_pipelining = use_pipelining
+        self.use_chunking = use_chunking
+        super().__init__(*args, **kwargs)
+
+    def transport_mode(self):
+        """返回当前连接实际使用的发送方式：chunking / pipelining / standard"""
+        self.ehlo_or_helo_if_needed()
+        if not (self.use_pipelining and self.has_extn('pipelining')):
+            return 'standard'
+        if self.use_chunking and self.has_extn('chunking'):
+            return 'chunking'
+        return 'pipelining'
+
+    def sendmail(self, from_addr, to_addrs, msg, mail_options=(), rcpt_options=()):
+        mode = self.transport_mode()
+        if mode == 'standard':
+            return super().sendmail(from_addr, to_addrs, msg, mail_options, rcpt_options)
+
+        if isinstance(msg, str):
+            msg = _fix_eols(msg).encode('ascii')
+        if isinstance(to_addrs, str):
+            to_addrs = [to_addrs]
+
+        esmtp_opts = []
+        if self.has_extn('size'):
+            esmtp_opts.append("size=%d" % len(msg))
+        esmtp_opts.extend(mail_options)
+
+        # 组装信封命令
+        commands = [self._command_line("mail", "FROM:%s" % smtplib.quoteaddr(from_addr), esmtp_opts)]
+        for addr in to_addrs:
+            commands.append(self._command_line("rcpt", "TO:%s" % smtplib.quoteaddr(addr), rcpt_options))
+
+        if mode == 'chunking':
+            return self._send_chunked(commands, to_addrs, from_addr, msg)
+        return self._send_pipelined(commands, to_addrs, from_addr, msg)
+
+    def _command_line(self, cmd, args, options):
+        optionlist = ''
+        if options:
+            optionlist = ' ' + ' '.join(options)
+        line = f"{cmd} {args}{optionlist}\r\n"
+        return line.encode(self.command_encoding)
+
+    def _read_envelope_replies(self, to_addrs):
+        """按顺序读取 MAIL 和每个 RCPT 的应答，返回 (MAIL 应答, 被拒绝的收件人)"""
+        mail_reply = self.getreply()
+        senderrs = {}
+        for addr in to_addrs:
+            code, resp = self.getreply()
+            if code not in (250, 251):
+                senderrs[addr] = (code, resp)
+        return mail_reply, senderrs
+
+    def _check_envelope(self, mail_reply, senderrs, to_addrs, from_addr):
+        code, resp = mail_reply
+        if code != 250:
+            if code == 421:
+                self.close()
+            else:
+                self._rset()
+            raise smtplib.SMTPSenderRefused(code, resp, from_addr)
+        if len(senderrs) == len(to_addrs):
+            self._rset()
+            raise smtplib.SMTPRecipientsRefused(senderrs)
+
+    def _send_pipelined(self, commands, to_addrs, from_addr, msg):
+        # 信封命令和 DATA 一次发出
+        self.send(b''.join(commands) + b"DATA\r\n")
+        mail_reply, senderrs = self._read_envelope_replies(to_addrs)
+        data_code, data_resp = self.getreply()
+
+        if data_code == 354 and (mail_reply[0] != 250 or len(senderrs) == len(to_addrs)):
+            # 服务器已进入 DATA 状态但信封无效：发送空正文结束本次事务
+            self.send(b".\r\n")
+            self.getreply()
+        self._check_envelope(mail_reply, senderrs, to_addrs, from_addr)
+        if data_code != 354:
+            self._rset()
+            raise smtplib.SMTPDataError(data_code, data_resp)
+
+        q = _quote_periods(msg)
+        if q[-2:] != b"\r\n":
+            q = q + b"\r\n"
+        self.send(q + b".\r\n")
+        code, resp = self.getreply()
+        if code != 250:
+            self._rset()
+            raise smtplib.SMTPDataError(code, resp)
+        return senderrs
+
+    def _send_chunked(self, commands, to_addrs, from_addr, msg):
+        # 正文按 BDAT 分块，与信封命令一起流水线发出
+        chunks = [msg[i:i + CHUNK_SIZE] for i in range(0, len(msg), CHUNK_SIZE)] or [b'']
+        payload = [b''.join(commands)]
+        for index, chunk in enumerate(chunks):
+            last = " LAST" if index == len(chunks) - 1 else ""
+            payload.append(f"BDAT {len(chunk)}{last}\r\n".encode('ascii'))
+            payload.append(chunk)
+        self.send(b''.join(payload))
+
+        mail_reply, senderrs = self._read_envelope_replies(to_addrs)
+        bdat_replies = [self.getreply() for _ in chunks]
+        self._check_envelope(mail_reply, senderrs, to_addrs, from_addr)
+        for code, resp in bdat_replies:
+            if code != 250:
+                self._rset()
+                raise smtplib.SMTPDataError(code, resp)
+        return senderrs
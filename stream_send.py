@@ -0,0 +1,234 @@
+import importlib
+import threading
+from collections import Counter
+
+from consolidation import plan_consolidation
+from delivery_store import DeliveryStore, default_db_path
+from domain_scheduler import DomainLimit, DomainLimits, DomainScheduler, recipient_domain, worker_demand
+from ingest import CONTACT_LIST, read_records
+from metrics import flush_logs, logger, metrics
+from send_records import SendReport
+
+# 边生成边发送：以前 build、route、send 依次执行，所有文件生成并分类完、整个发送列表验证和预览完
+# 才开始发送第一封邮件。这里在生成之前按本批次的协议号列出发送计划并确认一次，
+# 之后每个邮箱的协议号全部生成后，它的邮件立即进入发送队列，生成和发送同时进行，
+# 一个大批次的总耗时约为 max(生成, 发送) 而不是两者之和。
+
+# 发送计划预览中每个邮箱最多列出的协议号数
+PLAN_PREVIEW_AGREEMENTS = 10
+
+
+class StreamingSender:
+    """
+    边生成边发送
+    Queue each recipient's message as soon as all of its agreements are built and routed
+
+    plan 和 add 分别作为 2MU.build 的 on_plan、on_file 回调（独立文件在内存中生成）。
+    每个邮箱的文件齐全后只用该邮箱在发送列表中的行验证（与 4mail.verify_email_agreement_match 相同），
+    指定 consolidate 时合并抄送相同的分组，然后加入发送队列；发送在后台线程中进行，
+    未指定 domain_config 时使用一个连接、每封邮件间隔 delay_seconds 秒，与 send 相同。
+    """
+
+    def __init__(self, contact_list, target_dir, smtp_host, smtp_port, sender, password,
+                 delivery_db=None, test_mode=False, delay_seconds=2, use_pipelining=True, use_tls=True,
+                 domain_config=None, consolidate=False, max_attachments=None, max_attachment_bytes=None,
+                 move_sent=False, archive_sent=False, assume_yes=False, history_db=None):
+        """
+        参数与 4mail.main 相同；archive_sent 为 True 时发送成功的附件写入 target/邮箱/
+        history_db: 历史白名单数据库，发送成功的附件中的旅客记入其中
+        """
+        self.target_dir = target_dir
+        self.smtp = dict(smtp_host=smtp_host, smtp_port=smtp_port, sender=sender, password=password)
+        self.test_mode = test_mode
+        self.delay_seconds = delay_seconds
+        self.send_options = dict(use_pipelining=use_pipelining, use_tls=use_tls, move_sent=move_sent,
+                                 archive_sent=archive_sent)
+        self.domain_config = domain_config
+        self.consolidate = consolidate
+        self.max_attachments = max_attachments
+        self.max_attachment_bytes = max_attachment_bytes
+        self.assume_yes = assume_yes
+        self.history_db = history_db
+
+        self.router = importlib.import_module('3MUmails')
+        self.mailer = importlib.import_module('4mail')
+        with metrics.timer('load_mappings'):
+            self.mapping = self.router.load_email_mapping(contact_list)
+            _, self.records = read_records(contact_list, CONTACT_LIST, ['航司对接人邮箱', '协议号'])
+        self.delivery_store = DeliveryStore(delivery_db or default_db_path(target_dir))
+
+        self.approved = False
+        self.agreements = {}    # {邮箱: 本批次的协议号集合}
+        self.remaining = {}     # {邮箱: 尚未生成的文件数}
+        self.files = {}         # {邮箱: [InMemoryFile, ...]}
+        self.skipped = 0
+        self.queued = 0
+        self.unsent = 0
+        self.scheduler = None
+        self._thread = None
+        self._result = None
+
+    def plan(self, agreements, layouts):
+        """
+        列出发送计划并确认（build 的 on_plan）：本批次每个协议号对应的邮箱，以及不会发送的协议号
+        layouts 为 {布局代码: 该布局生成的协议号列表}，每个布局只生成该布局的新增旅客
+        确认后启动发送线程；取消时返回 False，build 不生成文件
+        """
+        unplanned = []
+        for agreement in agreements:
+            email = (self.mapping.get(agreement) or '').strip()
+            if not self.mailer.is_valid_email(email):
+                unplanned.append(agreement)
+                continue
+            self.agreements.setdefault(email, set()).add(agreement)
+        layout_agreements = [set(planned) for planned in layouts.values()]
+        for email, planned in self.agreements.items():
+            self.remaining[email] = sum(len(planned & built) for built in layout_agreements)
+
+        logger.info("\n---- 发送计划 ----")
+        for email, planned in self.agreements.items():
+            cc_displays = sorted({str(row.get('抄送邮箱') or '').strip() or '无抄送'
+                                  for _, row in self._records_for(email)})
+            shown = sorted(planned)[:PLAN_PREVIEW_AGREEMENTS]
+            more = f" 等 {len(planned)} 个" if len(planned) > len(shown) else ""
+            logger.info(f"收件人: {email} (抄送: {'; '.join(cc_displays)})  协议号: {shown}{more}")
+        if unplanned:
+            logger.warning(f"以下 {len(unplanned)} 个协议号不在发送列表中或邮箱无效，生成后不发送: "
+                           f"{sorted(unplanned)[:PLAN_PREVIEW_AGREEMENTS]}")
+        mode = "按域名调度" if self.domain_config else f"每封间隔 {self.delay_seconds} 秒"
+        logger.info(f"发送计划: {len(self.agreements)} 个邮箱，{len(agreements) - len(unplanned)} 个协议号，"
+                    f"{len(layouts)} 个航司布局，{mode}")
+        logger.info("---- 计划结束 ----\n")
+
+        if not self.agreements:
+            logger.warning("本批次没有可以发送的协议号")
+            return False
+        if not self.assume_yes:
+            flush_logs()
+            proceed = input("是否按此计划边生成边发送？(y/n): ").strip().lower()
+            if proceed != 'y':
+                logger.warning("操作已取消")
+                return False
+        self.approved = True
+        self._start()
+        return True
+
+    def _start(self):
+        if self.domain_config:
+            limits = DomainLimits.from_file(self.domain_config)
+            domain_of = lambda job: recipient_domain(job[0])
+            counts = Counter(recipient_domain(email) for email in self.agreements)
+        else:
+            # 所有邮件在同一个队列中：一个连接，相邻两封邮件开始发送的间隔为 delay_seconds
+            limits = DomainLimits(DomainLimit(1, float(self.delay_seconds)), max_connections=1)
+            domain_of = lambda job: ''
+            counts = {'': len(self.agreements)}
+        self.scheduler = DomainScheduler([], limits, domain_of, throttle=not self.test_mode, closed=False)
+        workers = worker_demand(limits, counts)
+        logger.info(f"开始边生成边发送: {workers} 个连接")
+
+        def send():
+            self._result = self.mailer.send_from_scheduler(
+                self.scheduler, target_dir=self.target_dir, test_mode=self.test_mode,
+                delivery_store=self.delivery_store, workers=workers, **self.smtp, **self.send_options)
+
+        self._thread = threading.Thread(target=send, name='stream-send')
+        self._thread.start()
+
+    def _records_for(self, email):
+        """发送列表中该邮箱、且协议号属于本批次的行"""
+        planned = self.agreements.get(email, ())
+        return [(row_number, row) for row_number, row in self.records
+                if str(row['航司对接人邮箱'] or '').strip() == email and row['协议号'] in planned]
+
+    def add(self, file):
+        """
+        分配一个生成的独立文件 (文件名, 内容字节串)（build 的 on_file）
+        该邮箱的文件全部生成后加入发送队列
+        """
+        if not self.approved:
+            return
+        filename, data = file
+        routed = self.router.route_in_memory_file(self.mapping, filename, data, self.target_dir)
+        if routed is None:
+            return
+        email, routed_file = routed
+        if email not in self.remaining:
+            metrics.incr('files_unplanned')
+            logger.debug(f"文件 {filename} 的邮箱 {email} 不在发送计划中，不发送")
+            return
+        self.files.setdefault(email, []).append(routed_file)
+        self.remaining[email] -= 1
+        if self.remaining[email] == 0:
+            self._enqueue(email)
+
+    def _enqueue(self, email):
+        """验证一个邮箱的文件并把它的邮件加入发送队列"""
+        files = self.files.pop(email, [])
+        self.remaining.pop(email, None)
+        with metrics.timer('queue_recipient'):
+            results = self.mailer.match_contact_records(self._records_for(email), self.target_dir,
+                                                        self.delivery_store, {email: files})
+            if self.consolidate:
+                results, _, _ = plan_consolidation(results, self.max_attachments, self.max_attachment_bytes)
+            groups, skipped = self.mailer.sendable_groups(results)
+        self.skipped += skipped
+        queued = 0
+        for recipient, group, all_excels in groups:
+            prefixes = self.mailer.file_prefixes(all_excels)
+            if None in prefixes or len(set(prefixes)) > 1:
+                logger.error(f"错误: 邮箱 {recipient} (抄送: {group.cc or '无抄送'}) 的 Excel 文件名前缀不一致: "
+                             f"{prefixes}，不发送")
+                self.skipped += 1
+                continue
+            # 发送线程因连接或认证失败已经结束时 add 返回 False，之后生成的邮件不再发送；
+            # 检查和加入在调度器的锁中完成，不会有邮件加入已经结束的队列而既不发送也不计为失败
+            if not self.scheduler.add((recipient, group, all_excels)):
+                self.unsent += 1
+                continue
+            queued += 1
+        self.queued += queued
+        metrics.incr('messages_queued', queued)
+        logger.info(f"{email} 的 {len(files)} 个文件已生成，{queued} 封邮件加入发送队列")
+
+    def finish(self):
+        """
+        生成结束后调用：文件不全的邮箱（部分文件未生成或分配到其它邮箱）按已有的文件发送，
+        等待发送队列清空，把发送成功的附件中的旅客记入历史白名单
+
+        Returns:
+            send_from_scheduler 的 SendReport；发送中止后没有加入队列的邮件计为失败
+        """
+        for email in [email for email, count in self.remaining.items() if count > 0]:
+            if self.files.get(email):
+                logger.warning(f"邮箱 {email} 还有 {self.remaining[email]} 个文件没有生成，按已生成的文件发送")
+                self._enqueue(email)
+            else:
+                logger.warning(f"邮箱 {email} 没有生成任何文件，不发送")
+                self.remaining.pop(email)
+        self.close()
+        if self.skipped:
+            logger.warning(f"跳过 {self.skipped} 个未找到附件或附件有误的邮件分组")
+        if self.unsent:
+            logger.error(f"发送已中止，之后生成的 {self.unsent} 封邮件没有发送")
+        # 发送线程异常退出时没有结果，加入队列的邮件都计为失败
+        report = self._result if self._result is not None else SendReport(failed=self.queued)
+        report.skipped += self.skipped
+        report.failed += self.unsent
+        self.mailer.commit_history(report, self.history_db)
+        return report
+
+    def close(self):
+        """不再加入邮件，等待已加入的邮件发送完成"""
+        if self.scheduler is not None:
+            self.scheduler.close()
+            with metrics.timer('wait_for_send_queue'):
+                self._thread.join()
+            self.scheduler = None
+        self.delivery_store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,207 @@
+import importlib
+import json
+import os
+import time
+from datetime import datetime
+
+from delivery_store import DeliveryStore, default_db_path, file_sha256
+from ingest import RAW_EXPORT, read_frame
+from metrics import finish_run, flush_logs, logger, metrics
+from whitelist_index import WHITELIST_INDEX_NAME, WhitelistIndex
+
+# 监控模式：常驻进程定时轮询投放目录，只处理新增或内容有变化的原始导出文件。
+# 各阶段脚本只导入一次，发送列表映射、历史白名单和发送记录连接、拼音缓存在批次之间保持，
+# 每个批次不再承担 pandas/openpyxl 的导入和映射文件的重复读取。
+
+# 已处理文件的记录，保存在 output 目录
+MANIFEST_NAME = '监控处理记录.json'
+
+# 每个批次的生成文件放在 output/监控批次/<文件名>_<时间>/ 下
+BATCH_DIR_NAME = '监控批次'
+
+
+def _signature(stat):
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+class FolderWatcher:
+    """
+    投放目录监控
+    Poll a drop folder and run update-names, build and route for each new raw export
+
+    文件的大小和修改时间连续 settle_polls 次轮询不变才认为已写完；大小或修改时间变化但内容
+    (sha256) 与上次处理时相同的文件只更新记录，不重新处理。处理失败的文件同样记入清单，
+    再次修改或重新放入（大小或修改时间变化）后重试，内容相同也重新处理。
+    旅客在发送成功后才记入历史白名单，失败的批次重试时会重新生成全部旅客。
+    """
+
+    def __init__(self, drop_dir, contact_list, output_dir, target_dir,
+                 history_db=None, delivery_db=None, settle_polls=2, on_batch=None, metrics_file=None,
+                 layouts=None, layout_plugins=(), combined_sheets=0):
+        """
+        on_batch: 每个批次分类完成后调用 on_batch(文件名, 生成的文件列表)，用于接着发送邮件
+        metrics_file: 每个批次结束时追加写入的指标文件
+        layouts / layout_plugins: 生成的航司布局，见 2MU.build
+        combined_sheets: 大于 0 时每个批次另外保存合并工作簿，见 2MU.render_layout
+        """
+        self.drop_dir = drop_dir
+        self.contact_list = contact_list
+        self.output_dir = output_dir
+        self.target_dir = target_dir
+        self.settle_polls = settle_polls
+        self.on_batch = on_batch
+        self.metrics_file = metrics_file
+        self.layouts = layouts
+        self.layout_plugins = layout_plugins
+        self.combined_sheets = combined_sheets
+
+        # 各阶段脚本只导入一次
+        self.updater = importlib.import_module('1MU_update_company_name')
+        self.builder = importlib.import_module('2MU')
+        self.router = importlib.import_module('3MUmails')
+
+        self.manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+        self.manifest = self._load_manifest()
+        self._pending = {}
+        self._contact_signature = None
+        self.company_mapping = {}
+        self.email_mapping = {}
+
+        self.whitelist_index = WhitelistIndex(history_db or os.path.join(output_dir, WHITELIST_INDEX_NAME))
+        self.delivery_store = DeliveryStore(delivery_db or default_db_path(target_dir))
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _save_manifest(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def refresh_mappings(self):
+        """发送列表有变化时重新读取公司名称映射和邮箱映射"""
+        signature = _signature(os.stat(self.contact_list))
+        if signature == self._contact_signature:
+            return
+        with metrics.timer('load_mappings'):
+            self.company_mapping = self.updater.load_company_mapping(self.contact_list)
+            self.email_mapping = self.router.load_email_mapping(self.contact_list)
+        if self._contact_signature is not None:
+            logger.info("发送列表已更新，已重新读取映射")
+        self._contact_signature = signature
+
+    def scan(self, wait_stable=True):
+        """
+        扫描投放目录，返回需要处理的 [(文件名, 大小和修改时间)]
+        wait_stable 为 False 时不等待文件稳定（只轮询一次时使用）
+        """
+        ready = []
+        present = set()
+        for entry in sorted(os.scandir(self.drop_dir), key=lambda e: e.name):
+            name = entry.name
+            if not entry.is_file() or not name.endswith('.xlsx') or name.startswith('~$'):
+                continue
+            present.add(name)
+            signature = _signature(entry.stat())
+            record = self.manifest.get(name)
+            if record and record['size'] == signature['size'] and record['mtime_ns'] == signature['mtime_ns']:
+                self._pending.pop(name, None)
+                continue
+
+            # 等待文件写完：连续多次轮询大小和修改时间都不变
+            previous, polls = self._pending.get(name, (None, 0))
+            polls = polls + 1 if previous == signature else 1
+            self._pending[name] = (signature, polls)
+            if not wait_stable or polls >= self.settle_polls:
+                ready.append((name, signature))
+
+        for name in set(self._pending) - present:
+            del self._pending[name]
+        return ready
+
+    def process(self, name, signature):
+        """处理一个原始导出文件：更新公司名称、生成独立文件、按邮箱分类"""
+        path = os.path.join(self.drop_dir, name)
+        digest = file_sha256(path)
+        record = self.manifest.get(name)
+        if record and record.get('sha256') == digest and record.get('status') != 'failed':
+            logger.info(f"{name} 内容未变化，跳过")
+            record.update(signature)
+            self._save_manifest()
+            return None
+
+        metrics.reset(f'whitelist watch {name}')
+        stem = os.path.splitext(name)[0]
+        batch_dir = os.path.join(self.output_dir, BATCH_DIR_NAME,
+                                 f"{stem}_{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+        record = dict(signature, sha256=digest, processed_at=datetime.now().isoformat(timespec='seconds'))
+        logger.info(f"开始处理：{name}")
+        try:
+            self.refresh_mappings()
+            with metrics.timer('read_excel'):
+                df = read_frame(path, RAW_EXPORT)
+            metrics.incr('rows_read', len(df))
+            df = self.updater.apply_company_names(df, self.company_mapping)
+            written = self.builder.build(df, batch_dir, self.whitelist_index, batch=name,
+                                         layouts=self.layouts, layout_plugins=self.layout_plugins,
+                                         combined_sheets=self.combined_sheets)
+            if written:
+                with metrics.timer('route_files_to_email_folders'):
+                    self.router.route_files_to_email_folders(self.email_mapping, batch_dir, self.target_dir,
+                                                             self.delivery_store)
+        except Exception as e:
+            logger.exception(f"处理 {name} 失败：{e}")
+            record.update(status='failed', error=str(e))
+            written = None
+        else:
+            record.update(status='ok', batch_dir=batch_dir, files=len(written))
+            metrics.incr('batches_processed')
+        self.manifest[name] = record
+        self._save_manifest()
+
+        if written and self.on_batch:
+            self.on_batch(name, written)
+        self.builder.wait_for_combined_workbooks()
+        finish_run(self.metrics_file)
+        return written
+
+    def poll(self, wait_stable=True):
+        """轮询一次，返回本次处理的文件数"""
+        ready = self.scan(wait_stable)
+        for name, signature in ready:
+            self._pending.pop(name, None)
+            self.process(name, signature)
+        return len(ready)
+
+    def run(self, interval=30, once=False):
+        """
+        持续轮询投放目录，Ctrl+C 退出
+        once 为 True 时只处理当前已有的文件后返回
+        """
+        logger.info(f"开始监控：{self.drop_dir}（每 {interval} 秒轮询一次）")
+        flush_logs()
+        try:
+            while True:
+                if self.poll(wait_stable=not once):
+                    flush_logs()
+                if once:
+                    return
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            logger.info("监控已停止")
+            flush_logs()
+
+    def close(self):
+        self.whitelist_index.close()
+        self.delivery_store.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,331 @@
+import argparse
+import importlib
+import json
+import os
+import sys
+
+from layouts import load_plugins
+from metrics import add_arguments, finish_run, logger, metrics, start_run
+from whitelist_index import WHITELIST_INDEX_NAME
+
+# 统一命令行入口：python whitelist.py <子命令>
+# pandas、openpyxl、pypinyin 只在需要它们的子命令中导入（各阶段脚本通过 importlib 延迟加载），
+# 因此 --help、route、verify 不承担这些库的导入时间。
+
+# 默认的配置文件，位于当前目录
+DEFAULT_CONFIG = 'whitelist_config.json'
+
+# 未在配置文件中保存密码时，从该环境变量读取
+PASSWORD_ENV = 'WHITELIST_SMTP_PASSWORD'
+
+# 路径配置项: 配置文件中的键 -> 说明
+PATH_SETTINGS = {
+    'raw_data': '原始白名单数据 (RawData.xlsx)；也可以是目录或通配符，多个导出文件合并为一个批次',
+    'contact_list': '批量发送列表 (MU批量发送列表.xlsx)，同时用作公司名称映射和邮箱映射',
+    'updated_data': '更新公司名称后的数据 (MUwhitelist_updated.xlsx)',
+    'output_dir': '2MU.py 的输出目录',
+    'target_dir': '按邮箱分类后的目录',
+    'history_db': '历史白名单数据库，默认为 output_dir/白名单历史.sqlite3',
+    'delivery_db': '发送记录数据库，默认为 target_dir/发送记录.sqlite3',
+    'domain_config': '按域名限制发送的JSON配置文件',
+    'drop_dir': '监控模式的投放目录，新的原始导出文件放在这里',
+}
+
+SMTP_DEFAULTS = {'host': None, 'port': 587, 'sender': None, 'password': None, 'use_tls': True}
+
+
+def load_config(path, required=False):
+    """
+    读取JSON配置文件；配置中的相对路径以配置文件所在目录为基准
+    文件不存在且 required 为 False 时返回空配置
+    """
+    if not os.path.exists(path):
+        if required:
+            raise SystemExit(f"配置文件不存在：{path}")
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    for key in PATH_SETTINGS:
+        if config.get(key):
+            config[key] = os.path.join(base, config[key])
+    return config
+
+
+def resolve_settings(args):
+    """合并配置文件和命令行参数，命令行优先"""
+    config = load_config(args.config or DEFAULT_CONFIG, required=args.config is not None)
+    settings = {key: getattr(args, key, None) or config.get(key) for key in PATH_SETTINGS}
+    smtp = dict(SMTP_DEFAULTS, **config.get('smtp', {}))
+    settings['smtp_host'] = getattr(args, 'smtp_host', None) or smtp['host']
+    settings['smtp_port'] = getattr(args, 'smtp_port', None) or smtp['port']
+    settings['sender'] = getattr(args, 'sender', None) or smtp['sender']
+    settings['password'] = smtp['password'] or os.environ.get(PASSWORD_ENV)
+    settings['use_tls'] = smtp['use_tls'] and not getattr(args, 'no_tls', False)
+    delay = getattr(args, 'delay', None)
+    settings['delay'] = delay if delay is not None else config.get('delay', 2)
+    layouts = getattr(args, 'layouts', None)
+    settings['layouts'] = layouts.split(',') if layouts else config.get('layouts')
+    settings['layout_plugins'] = config.get('layout_plugins', []) + (getattr(args, 'layout_plugin', None) or [])
+    combined_sheets = getattr(args, 'combined_sheets', None)
+    settings['combined_sheets'] = combined_sheets if combined_sheets is not None else config.get('combined_sheets', 0)
+    return settings
+
+
+def require(settings, *keys):
+    missing = [key for key in keys if not settings.get(key)]
+    if missing:
+        raise SystemExit("缺少配置：" + "，".join(
+            f"{key} (--{key.replace('_', '-')})" for key in missing) + f"，请在 {DEFAULT_CONFIG} 或命令行中指定")
+
+
+def cmd_update_names(settings, args):
+    require(settings, 'raw_data', 'contact_list', 'updated_data')
+    module = importlib.import_module('1MU_update_company_name')
+    with metrics.timer('update_company_names'):
+        module.update_company_names(settings['raw_data'], settings['contact_list'], settings['updated_data'],
+                                    workers=args.workers)
+
+
+def cmd_build(settings, args, in_memory=False, on_plan=None, on_file=None):
+    require(settings, 'updated_data', 'output_dir')
+    module = importlib.import_module('2MU')
+    return module.main(input_file=settings['updated_data'], output_dir=settings['output_dir'],
+                       index_path=settings['history_db'], include_known=args.include_known, workers=args.workers,
+                       layouts=settings['layouts'], layout_plugins=settings['layout_plugins'], in_memory=in_memory,
+                       combined_sheets=settings['combined_sheets'], on_plan=on_plan, on_file=on_file)
+
+
+def cmd_route(settings, args):
+    require(settings, 'contact_list', 'output_dir', 'target_dir')
+    module = importlib.import_module('3MUmails')
+    module.main(settings['contact_list'], settings['output_dir'], settings['target_dir'], settings['delivery_db'])
+
+
+def _mail_options(settings, args):
+    return dict(
+        test_excel_path=settings['contact_list'],
+        target_dir=settings['target_dir'],
+        delivery_db=settings['delivery_db'],
+        consolidate=args.consolidate,
+        max_attachments=args.max_attachments,
+        max_attachment_bytes=int(args.max_attachment_mb * 1024 * 1024) if args.max_attachment_mb else None,
+        preflight=args.preflight,
+        preflight_report_path=args.preflight_report,
+    )
+
+
+def cmd_verify(settings, args):
+    require(settings, 'contact_list', 'target_dir')
+    mailer = importlib.import_module('4mail')
+    return mailer.main(verify_only=True, **_mail_options(settings, args))
+
+
+def _require_smtp(settings, args):
+    if not args.test and not args.preflight:
+        require(settings, 'smtp_host', 'sender')
+        if not settings['password']:
+            import getpass
+            settings['password'] = getpass.getpass(f"SMTP密码 ({settings['sender']}): ")
+
+
+def _history_db(settings):
+    """历史白名单数据库路径：未配置 history_db 时为 output_dir 下的默认文件，两者都未配置时为 None"""
+    if settings['history_db']:
+        return settings['history_db']
+    if settings['output_dir']:
+        return os.path.join(settings['output_dir'], WHITELIST_INDEX_NAME)
+    return None
+
+
+def cmd_send(settings, args, attachments=None, archive_sent=False):
+    require(settings, 'contact_list', 'target_dir')
+    _require_smtp(settings, args)
+    mailer = importlib.import_module('4mail')
+    return mailer.main(test_mode=args.test, delay_seconds=settings['delay'], use_pipelining=not args.no_pipelining,
+                       move_sent=args.move_sent, domain_config=settings['domain_config'],
+                       smtp_host=settings['smtp_host'], smtp_port=int(settings['smtp_port']),
+                       sender=settings['sender'], password=settings['password'], use_tls=settings['use_tls'],
+                       assume_yes=args.yes, attachments=attachments, archive_sent=archive_sent,
+                       history_db=_history_db(settings), **_mail_options(settings, args))
+
+
+def cmd_run_all(settings, args):
+    """依次执行全部阶段；未配置 raw_data 时跳过公司名称更新"""
+    if settings['raw_data']:
+        cmd_update_names(settings, args)
+    else:
+        logger.info("未配置 raw_data，跳过公司名称更新")
+    cmd_build(settings, args)
+    cmd_route(settings, args)
+    return cmd_send(settings, args)
+
+
+def cmd_build_send(settings, args):
+    """
+    生成并直接发送：独立文件只在内存中生成，按协议号分配给航司对接人邮箱后直接作为附件发送，
+    不经过 output_dir 和 target_dir 中的逐个文件；指定 --archive 时发送成功的附件写入 target/邮箱/
+    build 只暂存旅客，cmd_send 发送后按返回的 SendReport 只把发送成功的附件记入历史白名单
+    """
+    require(settings, 'updated_data', 'contact_list', 'output_dir', 'target_dir')
+    _require_smtp(settings, args)
+    if args.stream:
+        return _build_send_streaming(settings, args)
+    files = cmd_build(settings, args, in_memory=True)
+    if not files:
+        logger.info("没有生成新的文件，无需发送")
+        return None
+    router = importlib.import_module('3MUmails')
+    with metrics.timer('load_email_mapping'):
+        mapping = router.load_email_mapping(settings['contact_list'])
+    with metrics.timer('route_in_memory'):
+        attachments = router.route_in_memory(mapping, files, settings['target_dir'])
+    return cmd_send(settings, args, attachments, archive_sent=args.archive)
+
+
+def _build_send_streaming(settings, args):
+    """边生成边发送：确认一次发送计划后，每个邮箱的协议号全部生成就开始发送它的邮件"""
+    if args.preflight:
+        raise SystemExit("--stream 不能与 --preflight 同时使用，请先单独运行预检")
+    stream_send = importlib.import_module('stream_send')
+    options = _mail_options(settings, args)
+    with stream_send.StreamingSender(
+            settings['contact_list'], settings['target_dir'], settings['smtp_host'], int(settings['smtp_port']),
+            settings['sender'], settings['password'], delivery_db=settings['delivery_db'], test_mode=args.test,
+            delay_seconds=settings['delay'], use_pipelining=not args.no_pipelining, use_tls=settings['use_tls'],
+            domain_config=settings['domain_config'], consolidate=options['consolidate'],
+            max_attachments=options['max_attachments'], max_attachment_bytes=options['max_attachment_bytes'],
+            move_sent=args.move_sent, archive_sent=args.archive, assume_yes=args.yes,
+            history_db=_history_db(settings)) as stream:
+        files = cmd_build(settings, args, in_memory=True, on_plan=stream.plan, on_file=stream.add)
+        if not stream.approved:
+            return None
+        if not files:
+            logger.info("没有生成新的文件，无需发送")
+        return stream.finish()
+
+
+def cmd_watch(settings, args):
+    """监控投放目录，每个新文件依次执行 update-names、build、route；指定 --send 时接着发送"""
+    require(settings, 'drop_dir', 'contact_list', 'output_dir', 'target_dir')
+    on_batch = None
+    if args.send:
+        # 常驻运行时无人确认，每个批次分类完成后直接发送
+        _require_smtp(settings, args)
+        args.yes = True
+        on_batch = lambda name, written: cmd_send(settings, args)
+    watch_folder = importlib.import_module('watch_folder')
+    with watch_folder.FolderWatcher(settings['drop_dir'], settings['contact_list'], settings['output_dir'],
+                                    settings['target_dir'], history_db=settings['history_db'],
+                                    delivery_db=settings['delivery_db'], settle_polls=args.settle_polls,
+                                    on_batch=on_batch, metrics_file=args.metrics_file,
+                                    layouts=settings['layouts'], layout_plugins=settings['layout_plugins'],
+                                    combined_sheets=settings['combined_sheets']) as watcher:
+        watcher.run(interval=args.interval, once=args.once)
+
+
+def _path_arguments(parser, keys):
+    for key in keys:
+        parser.add_argument(f"--{key.replace('_', '-')}", dest=key, help=PATH_SETTINGS[key])
+
+
+def _mail_arguments(parser):
+    parser.add_argument('--consolidate', action='store_true', help='合并同一收件人下抄送集合相同的邮件')
+    parser.add_argument('--max-attachments', type=int, help='合并后每封邮件的最大附件数')
+    parser.add_argument('--max-attachment-mb', type=float, help='合并后每封邮件的附件总大小上限(MB)')
+    parser.add_argument('--preflight', action='store_true', help='只检查将要发送的附件，不发送')
+    parser.add_argument('--preflight-report', help='预检结果CSV文件路径')
+
+
+def _send_arguments(parser):
+    parser.add_argument('--test', action='store_true', help='测试模式：验证逻辑但不发送邮件')
+    parser.add_argument('--delay', type=int, help='每封邮件发送后的延迟秒数，默认为2秒')
+    parser.add_argument('--no-pipelining', action='store_true', help='禁用 SMTP PIPELINING/CHUNKING')
+    parser.add_argument('--move-sent', action='store_true', help='发送成功后将邮箱文件夹移动到"已批量发送"目录')
+    parser.add_argument('--yes', action='store_true', help='不询问，预览后直接发送')
+    parser.add_argument('--smtp-host', help='SMTP服务器地址')
+    parser.add_argument('--smtp-port', type=int, help='SMTP端口，默认为587')
+    parser.add_argument('--sender', help='发件人邮箱')
+    parser.add_argument('--no-tls', action='store_true', help='不使用 STARTTLS')
+    _path_arguments(parser, ['domain_config'])
+
+
+COMMANDS = {
+    'update-names': (cmd_update_names, '根据发送列表更新原始数据中的公司名称 (1MU_update_company_name.py)',
+                     ['raw_data', 'contact_list', 'updated_data']),
+    'build': (cmd_build, '格式化数据并按协议号生成独立文件 (2MU.py)',
+              ['updated_data', 'output_dir', 'history_db']),
+    'route': (cmd_route, '按协议号把文件分类到邮箱目录 (3MUmails.py)',
+              ['contact_list', 'output_dir', 'target_dir', 'delivery_db']),
+    'verify': (cmd_verify, '验证发送列表与邮箱目录并预览邮件，不发送 (4mail.py)',
+               ['contact_list', 'target_dir', 'delivery_db']),
+    'send': (cmd_send, '验证、预览并发送邮件 (4mail.py)',
+             ['contact_list', 'output_dir', 'target_dir', 'history_db', 'delivery_db']),
+    'run-all': (cmd_run_all, '依次执行 update-names、build、route、send',
+                [key for key in PATH_SETTINGS if key != 'drop_dir']),
+    'build-send': (cmd_build_send, '生成独立文件并直接作为附件发送，文件不落盘 (2MU.py + 4mail.py)',
+                   ['updated_data', 'contact_list', 'output_dir', 'target_dir', 'history_db', 'delivery_db']),
+    'watch': (cmd_watch, '监控投放目录，自动处理新的原始导出文件',
+              ['drop_dir', 'contact_list', 'output_dir', 'target_dir', 'history_db', 'delivery_db']),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description='白名单处理与邮件发送统一入口',
+        epilog=f'路径和SMTP设置从 --config（默认 {DEFAULT_CONFIG}）读取，命令行参数优先；'
+               f'SMTP密码也可通过环境变量 {PASSWORD_ENV} 提供')
+    subparsers = parser.add_subparsers(dest='command', metavar='<子命令>')
+    subparsers.required = True
+    for name, (_, help_text, keys) in COMMANDS.items():
+        sub = subparsers.add_parser(name, help=help_text, description=help_text)
+        sub.add_argument('--config', help=f'JSON配置文件，默认为当前目录下的 {DEFAULT_CONFIG}')
+        _path_arguments(sub, [key for key in keys if key != 'domain_config'])
+        if name in ('build', 'run-all', 'build-send'):
+            sub.add_argument('--include-known', action='store_true', help='不过滤已提交过的旅客，全部重新生成')
+        if name in ('update-names', 'build', 'run-all', 'build-send'):
+            sub.add_argument('--workers', type=int, help='读取多个输入文件、生成多个航司布局时的进程数，默认为CPU核数')
+        if name in ('build', 'run-all', 'watch', 'build-send'):
+            sub.add_argument('--layouts', help='航司布局代码，多个用逗号分隔，默认为 MU（配置项 layouts）')
+            sub.add_argument('--layout-plugin', action='append',
+                             help='定义其它航司布局的插件模块，可重复指定（配置项 layout_plugins）')
+            sub.add_argument('--combined-sheets', type=int,
+                             help='另外保存合并工作簿，每个文件最多 N 个工作表；默认为0，不保存（配置项 combined_sheets）')
+        if name == 'watch':
+            sub.add_argument('--interval', type=float, default=30, help='轮询间隔秒数，默认为30秒')
+            sub.add_argument('--settle-polls', type=int, default=2,
+                             help='文件大小和修改时间连续多少次轮询不变才开始处理，默认为2')
+            sub.add_argument('--once', action='store_true', help='只处理投放目录中现有的文件后退出')
+            sub.add_argument('--send', action='store_true', help='每个批次分类完成后直接发送邮件（不询问）')
+        if name == 'build-send':
+            sub.add_argument('--archive', action='store_true', help='发送成功后把附件写入 target/邮箱/ 目录存档')
+            sub.add_argument('--stream', action='store_true',
+                             help='边生成边发送：确认发送计划后，每个邮箱的文件生成完就开始发送')
+        if name in ('verify', 'send', 'run-all', 'watch', 'build-send'):
+            _mail_arguments(sub)
+        if name in ('send', 'run-all', 'watch', 'build-send'):
+            _send_arguments(sub)
+        add_arguments(sub)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    handler = COMMANDS[args.command][0]
+    settings = resolve_settings(args)
+    # 插件中的布局在 build 生成文件和 verify/send 预检表头时都会用到
+    load_plugins(settings['layout_plugins'])
+
+    start_run(f'whitelist {args.command}', quiet=args.quiet, profile_dir=args.profile)
+    result = handler(settings, args)
+    # build 在后台线程中保存合并工作簿，写完之后再输出本次运行的指标
+    builder = sys.modules.get('2MU')
+    if builder is not None:
+        builder.wait_for_combined_workbooks()
+    finish_run(args.metrics_file)
+    # 预检未通过或有邮件发送失败时返回 1
+    return 1 if result is False or getattr(result, 'failed', 0) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
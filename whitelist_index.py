@@ -0,0 +1,196 @@
+import os
+import sqlite3
+from datetime import datetime
+
+from layouts import DEFAULT_LAYOUT
+
+# 历史白名单数据库的默认文件名
+WHITELIST_INDEX_NAME = '白名单历史.sqlite3'
+
+# 键包含航司布局：同一旅客提交给东航之后，仍然是其它航司的新增
+_SUBMITTED_TABLE = """
+CREATE TABLE IF NOT EXISTS submitted (
+    layout TEXT NOT NULL,
+    agreement TEXT NOT NULL,
+    doc_type TEXT NOT NULL,
+    doc_number TEXT NOT NULL,
+    batch TEXT,
+    submitted_at TEXT NOT NULL,
+    PRIMARY KEY (layout, agreement, doc_type, doc_number)
+) WITHOUT ROWID;
+"""
+
+_SCHEMA = _SUBMITTED_TABLE + """
+CREATE TABLE IF NOT EXISTS pending (
+    file_name TEXT NOT NULL,
+    layout TEXT NOT NULL,
+    agreement TEXT NOT NULL,
+    doc_type TEXT NOT NULL,
+    doc_number TEXT NOT NULL,
+    batch TEXT,
+    built_at TEXT NOT NULL,
+    PRIMARY KEY (file_name, agreement, doc_type, doc_number)
+) WITHOUT ROWID;
+"""
+
+# 每次 IN 查询的协议号数量，低于 SQLite 的参数上限
+_QUERY_CHUNK = 500
+
+
+def normalize_agreement(value):
+    """协议号统一为字符串；Excel 读成浮点数的整数协议号去掉".0\""""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    text = str(value).strip()
+    # 直接从 XML 读到的数字单元格可能是 "3100000.0" 这样的文本
+    if text.endswith('.0') and text[:-2].isdigit():
+        return text[:-2]
+    return text
+
+
+def _keys(df, agreement_col, type_col, number_col):
+    """生成每行的 (协议号, 证件类型, 证件号码) 键；证件号码为空的行返回 None"""
+    # 调用方已经持有 DataFrame，这里才导入 pandas，4mail.py 只用到 normalize_agreement 时不必导入
+    import pandas as pd
+    keys = []
+    for agreement, doc_type, doc_number in zip(df[agreement_col], df[type_col], df[number_col]):
+        if pd.isna(doc_number) or pd.isna(agreement) or str(doc_number).strip() == '':
+            keys.append(None)
+            continue
+        keys.append((normalize_agreement(agreement),
+                     '' if pd.isna(doc_type) else str(doc_type).strip(),
+                     str(doc_number).strip().upper()))
+    return keys
+
+
+def row_keys(group, agreement_col='协议号', type_col='证件类型', number_col='证件信息'):
+    """
+    一个文件的所有源数据行的键（format_sheet 之前）
+    format_sheet 合并或删掉的行（如身份证行旁边的护照行）同样计入：文件发送后这些行都已处理，不应再作为新增生成
+    """
+    return [key for key in _keys(group, agreement_col, type_col, number_col) if key is not None]
+
+
+class WhitelistIndex:
+    """
+    已提交给航司的白名单记录
+    Persistent index of (协议号, 证件类型, 证件号码) keys already submitted, per airline layout
+
+    2MU.py 在 split_column_and_add 之后用它按航司布局过滤掉已经提交过的旅客，只生成真正的新增。
+    生成文件时把每个文件的源数据行的键暂存在 pending 中（stage），文件发送成功后
+    4mail.py 再按文件名把它们记为已提交（commit）；取消发送、发送失败或分类出错的批次
+    不会记入，下次仍会重新生成。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._migrate()
+        self._conn.executescript(_SCHEMA)
+
+    def _migrate(self):
+        """以前的数据库没有布局列，当时只生成东航模板，已有的记录归入 DEFAULT_LAYOUT"""
+        submitted = {row[1] for row in self._conn.execute("PRAGMA table_info(submitted)")}
+        if submitted and 'layout' not in submitted:
+            self._conn.executescript(f"""
+                BEGIN;
+                ALTER TABLE submitted RENAME TO submitted_without_layout;
+                {_SUBMITTED_TABLE}
+                INSERT INTO submitted (layout, agreement, doc_type, doc_number, batch, submitted_at)
+                    SELECT '{DEFAULT_LAYOUT}', agreement, doc_type, doc_number, batch, submitted_at
+                    FROM submitted_without_layout;
+                DROP TABLE submitted_without_layout;
+                COMMIT;
+            """)
+        pending = {row[1] for row in self._conn.execute("PRAGMA table_info(pending)")}
+        if pending and 'layout' not in pending:
+            with self._conn:
+                self._conn.execute(f"ALTER TABLE pending ADD COLUMN layout TEXT NOT NULL DEFAULT '{DEFAULT_LAYOUT}'")
+
+    def known_keys(self, agreements, layout=DEFAULT_LAYOUT):
+        """返回给定协议号下已经按该航司布局提交过的键"""
+        agreements = sorted(set(agreements))
+        known = set()
+        for start in range(0, len(agreements), _QUERY_CHUNK):
+            chunk = agreements[start:start + _QUERY_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            known.update(self._conn.execute(
+                "SELECT agreement, doc_type, doc_number FROM submitted "
+                f"WHERE layout = ? AND agreement IN ({placeholders})", [layout] + chunk))
+        return known
+
+    def new_rows(self, df, layouts, agreement_col='协议号', type_col='证件类型', number_col='证件信息'):
+        """
+        每个航司布局下尚未提交过的行
+
+        Returns:
+            {布局代码: [每行是否为新增]}
+        """
+        keys = _keys(df, agreement_col, type_col, number_col)
+        agreements = {key[0] for key in keys if key is not None}
+        masks = {}
+        for layout in layouts:
+            known = self.known_keys(agreements, layout)
+            masks[layout] = [key is None or key not in known for key in keys]
+        return masks
+
+    def filter_new(self, df, layout=DEFAULT_LAYOUT, agreement_col='协议号', type_col='证件类型', number_col='证件信息'):
+        """
+        过滤已按该航司布局提交过的行
+
+        Returns:
+            (只包含新增行的 DataFrame, 被过滤的行数)
+        """
+        mask = self.new_rows(df, [layout], agreement_col, type_col, number_col)[layout]
+        new_df = df[mask].reset_index(drop=True)
+        return new_df, len(df) - len(new_df)
+
+    def stage(self, files, layout=DEFAULT_LAYOUT, batch=None):
+        """
+        暂存一个航司布局生成的文件中的键，发送成功后由 commit 记为已提交
+
+        Args:
+            files: {文件名: [键, ...]}；同名文件以前暂存的键被替换（文件已被重新生成）
+            layout: 生成这些文件的航司布局代码
+            batch: 批次名
+
+        Returns:
+            暂存的条数
+        """
+        built_at = datetime.now().isoformat(timespec='seconds')
+        rows = [(file_name, layout) + key + (batch, built_at) for file_name, keys in files.items() for key in keys]
+        with self._conn:
+            self._conn.executemany("DELETE FROM pending WHERE file_name = ?", [(name,) for name in files])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pending (file_name, layout, agreement, doc_type, doc_number, batch, built_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def commit(self, file_names):
+        """把已发送文件的暂存键按生成它们的航司布局记为已提交，返回新写入的条数"""
+        file_names = sorted(set(file_names))
+        submitted_at = datetime.now().isoformat(timespec='seconds')
+        recorded = 0
+        with self._conn:
+            for start in range(0, len(file_names), _QUERY_CHUNK):
+                chunk = file_names[start:start + _QUERY_CHUNK]
+                placeholders = ','.join('?' * len(chunk))
+                recorded += self._conn.execute(
+                    "INSERT OR IGNORE INTO submitted (layout, agreement, doc_type, doc_number, batch, submitted_at) "
+                    "SELECT layout, agreement, doc_type, doc_number, batch, ? FROM pending "
+                    f"WHERE file_name IN ({placeholders})",
+                    [submitted_at] + chunk).rowcount
+                self._conn.execute(f"DELETE FROM pending WHERE file_name IN ({placeholders})", chunk)
+        return recorded
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
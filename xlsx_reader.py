@@ -0,0 +1,304 @@
+import posixpath
+import re
+import zipfile
+from datetime import datetime, timedelta
+from xml.etree import ElementTree
+
+# 只依赖标准库，读取发送列表这类小文件时不必导入 pandas/openpyxl
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+SHARED_STRINGS = 'xl/sharedStrings.xml'
+STYLES = 'xl/styles.xml'
+
+# iter_frames 每批的行数
+BATCH_ROWS = 10000
+
+# Excel 内置的日期/时间数字格式
+_DATE_FORMAT_IDS = set(range(14, 23)) | {45, 46, 47}
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def sheet_paths(archive):
+    """按 workbook.xml 中的顺序返回 (工作表名, 压缩包内路径)"""
+    rels = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    targets = {rel.get('Id'): rel.get('Target') for rel in rels.iter(f'{_PKG_REL_NS}Relationship')}
+    workbook = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    sheets = []
+    for sheet in workbook.iter(f'{_NS}sheet'):
+        target = targets.get(sheet.get(f'{_REL_NS}id'), '')
+        path = target.lstrip('/') if target.startswith('/') else posixpath.normpath(posixpath.join('xl', target))
+        sheets.append((sheet.get('name'), path))
+    return sheets
+
+
+def read_shared_strings(archive, indices=None):
+    """
+    读取共享字符串表，返回 {索引: 文本}
+    给出 indices 时只保留这些索引，读到其中最大的索引后即停止
+    """
+    if SHARED_STRINGS not in archive.namelist():
+        return {}
+    wanted = set(indices) if indices is not None else None
+    if wanted is not None and not wanted:
+        return {}
+    last = max(wanted) if wanted else None
+    strings = {}
+    index = 0
+    with archive.open(SHARED_STRINGS) as f:
+        for _, elem in ElementTree.iterparse(f):
+            if elem.tag != f'{_NS}si':
+                continue
+            if wanted is None or index in wanted:
+                strings[index] = ''.join(t.text or '' for t in elem.iter(f'{_NS}t'))
+            elem.clear()
+            if last is not None and index >= last:
+                break
+            index += 1
+    return strings
+
+
+class SharedStrings:
+    """
+    按需读取的共享字符串表
+    只解析到目前为止用到的最大索引，读取大文件时不必先把整个 sharedStrings.xml 读入
+    """
+
+    def __init__(self, archive):
+        self._strings = []
+        self._file = archive.open(SHARED_STRINGS) if SHARED_STRINGS in archive.namelist() else None
+        self._items = ElementTree.iterparse(self._file) if self._file else None
+
+    def get(self, index, default=''):
+        while index >= len(self._strings) and self._items is not None:
+            for _, elem in self._items:
+                if elem.tag == f'{_NS}si':
+                    self._strings.append(''.join(t.text or '' for t in elem.iter(f'{_NS}t')))
+                    elem.clear()
+                    break
+            else:
+                self.close()
+        return self._strings[index] if index < len(self._strings) else default
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = self._items = None
+
+
+def date_styles(archive):
+    """返回使用日期/时间数字格式的单元格样式序号（单元格的 s 属性）"""
+    if STYLES not in archive.namelist():
+        return set()
+    styles = ElementTree.fromstring(archive.read(STYLES))
+    date_formats = set(_DATE_FORMAT_IDS)
+    for fmt in styles.iter(f'{_NS}numFmt'):
+        # 去掉引号中的文字和 [Red]、[$-804] 这类修饰后，含日期时间占位符的自定义格式视为日期
+        code = re.sub(r'"[^"]*"|\[[^\]]*\]', '', fmt.get('formatCode', ''))
+        if re.search(r'[dmyhs]', code, re.IGNORECASE):
+            date_formats.add(int(fmt.get('numFmtId')))
+    cell_xfs = styles.find(f'{_NS}cellXfs')
+    if cell_xfs is None:
+        return set()
+    return {i for i, xf in enumerate(cell_xfs.iter(f'{_NS}xf')) if int(xf.get('numFmtId', 0)) in date_formats}
+
+
+def _number(text, is_date=False):
+    """数字单元格的原文转为 int/float；整数值的浮点数转为 int（与 pandas.read_excel 一致）"""
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    if is_date:
+        return _EXCEL_EPOCH + timedelta(days=number)
+    return int(number) if number.is_integer() else number
+
+
+def column_index(ref):
+    """单元格引用的列号（从0开始），例如 'C5' -> 2"""
+    index = 0
+    for ch in ref:
+        if not ch.isalpha():
+            break
+        index = index * 26 + ord(ch.upper()) - 64
+    return index - 1
+
+
+def _cell_value(cell, strings):
+    """单元格的值：文本单元格返回字符串，数字按 XML 中的原文返回，空单元格返回 None"""
+    cell_type = cell.get('t')
+    if cell_type == 'inlineStr':
+        return ''.join(t.text or '' for t in cell.iter(f'{_NS}t'))
+    v = cell.find(f'{_NS}v')
+    if v is None or v.text is None:
+        return None
+    if cell_type == 's':
+        return strings.get(int(v.text), '')
+    if cell_type == 'b':
+        return v.text == '1'
+    return v.text
+
+
+def _sheet_path(archive, sheet):
+    """sheet 为工作表序号或名称，返回压缩包内路径"""
+    sheets = sheet_paths(archive)
+    if isinstance(sheet, str):
+        matches = [p for name, p in sheets if name == sheet]
+        if not matches:
+            raise KeyError(f"工作表不存在: {sheet}")
+        return matches[0]
+    return sheets[sheet][1]
+
+
+def iter_rows(path, sheet=0):
+    """
+    逐行读取工作表，产生 (Excel行号, 值列表)
+    sheet 为工作表序号或名称；共享字符串一次性读入，适合发送列表这样的小文件
+    """
+    with zipfile.ZipFile(path) as archive:
+        sheet_path = _sheet_path(archive, sheet)
+        strings = read_shared_strings(archive)
+        row_number = 0
+        with archive.open(sheet_path) as f:
+            for _, elem in ElementTree.iterparse(f):
+                if elem.tag != f'{_NS}row':
+                    continue
+                row_number = int(elem.get('r') or row_number + 1)
+                values = []
+                for position, cell in enumerate(elem.iter(f'{_NS}c')):
+                    ref = cell.get('r')
+                    col = column_index(ref) if ref else position
+                    if col >= len(values):
+                        values.extend([None] * (col + 1 - len(values)))
+                    values[col] = _cell_value(cell, strings)
+                elem.clear()
+                yield row_number, values
+
+
+def read_header(path, sheet=0):
+    """
+    读取表头（第一个非空行），读到这一行即停止
+    只解析表头用到的共享字符串，大文件也只需要读取开头的一小部分
+    """
+    with zipfile.ZipFile(path) as archive:
+        with archive.open(_sheet_path(archive, sheet)) as f:
+            for _, elem in ElementTree.iterparse(f):
+                if elem.tag != f'{_NS}row':
+                    continue
+                cells = []
+                for position, cell in enumerate(elem.iter(f'{_NS}c')):
+                    ref = cell.get('r')
+                    v = cell.find(f'{_NS}v')
+                    shared = cell.get('t') == 's' and v is not None and v.text is not None
+                    cells.append((column_index(ref) if ref else position,
+                                  int(v.text) if shared else None,
+                                  None if shared else _cell_value(cell, {})))
+                elem.clear()
+                if any(index is not None or value not in (None, '') for _, index, value in cells):
+                    break
+            else:
+                return []
+        strings = read_shared_strings(archive, [index for _, index, _ in cells if index is not None])
+    header = [''] * (max(col for col, _, _ in cells) + 1)
+    for col, index, value in cells:
+        text = strings.get(index, '') if index is not None else value
+        header[col] = '' if text is None else str(text).strip()
+    return header
+
+
+def iter_batches(path, columns=None, batch_size=BATCH_ROWS, sheet=0, raw_numbers=()):
+    """
+    流式读取工作表，以第一个非空行为表头，每次产生 (列名列表, 行列表)
+    Stream a large sheet in row batches with lazily resolved shared strings
+
+    只解析 columns 中的列（None 为全部列），其它单元格直接跳过；空字符串视为空值，全空的行跳过。
+    数字转为 int/float，日期格式的数字转为 datetime；raw_numbers 中的列保留 XML 中的原文。
+    每批最多 batch_size 行，读过的 XML 元素立即释放，内存占用与文件大小无关。
+    """
+    with zipfile.ZipFile(path) as archive:
+        strings = SharedStrings(archive)
+        dates = date_styles(archive)
+        names, positions, raw = None, None, None
+        batch = []
+        yielded = False
+        try:
+            with archive.open(_sheet_path(archive, sheet)) as f:
+                for _, elem in ElementTree.iterparse(f):
+                    if elem.tag != f'{_NS}row':
+                        continue
+                    cells = elem.iter(f'{_NS}c')
+                    if positions is None:
+                        header = {}
+                        for position, cell in enumerate(cells):
+                            ref = cell.get('r')
+                            value = _cell_value(cell, strings)
+                            if value not in (None, ''):
+                                header[column_index(ref) if ref else position] = str(value).strip()
+                        elem.clear()
+                        if not header:
+                            continue
+                        by_name = {name: col for col, name in sorted(header.items(), reverse=True)}
+                        names = list(columns) if columns is not None else [header[col] for col in sorted(header)]
+                        missing = [name for name in names if name not in by_name]
+                        if missing:
+                            raise KeyError(f"工作表缺少列: {', '.join(missing)}")
+                        positions = {by_name[name]: i for i, name in enumerate(names)}
+                        raw = {by_name[name] for name in raw_numbers if name in by_name}
+                        continue
+
+                    values = [None] * len(names)
+                    for position, cell in enumerate(cells):
+                        ref = cell.get('r')
+                        col = column_index(ref) if ref else position
+                        if col not in positions:
+                            continue
+                        value = _cell_value(cell, strings)
+                        if value == '':
+                            continue
+                        if value is not None and cell.get('t') in (None, 'n') and col not in raw:
+                            value = _number(value, int(cell.get('s', 0)) in dates)
+                        values[positions[col]] = value
+                    elem.clear()
+                    if all(v is None for v in values):
+                        continue
+                    batch.append(values)
+                    if len(batch) >= batch_size:
+                        yield names, batch
+                        batch, yielded = [], True
+        finally:
+            strings.close()
+        # 没有数据行时也产生一个空批次，调用方可以得到列名
+        if batch or (names is not None and not yielded):
+            yield names, batch
+
+
+def iter_frames(path, columns=None, batch_size=BATCH_ROWS, sheet=0, raw_numbers=()):
+    """iter_batches 的 DataFrame 版本，每批产生一个 DataFrame"""
+    import pandas as pd
+    for names, rows in iter_batches(path, columns, batch_size, sheet, raw_numbers):
+        yield pd.DataFrame(rows, columns=names, dtype=object)
+
+
+def read_records(path, sheet=0):
+    """
+    以第一行为表头读取工作表
+    Read a small sheet into dict records without pandas
+
+    Returns:
+        (列名列表, [(Excel行号, {列名: 值}), ...])，全空的行会被跳过，字符串两端的空白保留原样
+    """
+    rows = iter_rows(path, sheet)
+    columns = []
+    for _, values in rows:
+        if any(v not in (None, '') for v in values):
+            columns = ['' if v is None else str(v).strip() for v in values]
+            break
+    records = []
+    for row_number, values in rows:
+        if not any(v not in (None, '') for v in values):
+            continue
+        records.append((row_number, {column: values[i] if i < len(values) else None
+                                     for i, column in enumerate(columns) if column}))
+    return columns, records